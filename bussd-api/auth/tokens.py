@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+import httpx
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException
+from jose import jwt, JWTError
+from cache.ttl_cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Legacy Supabase projects sign access tokens with this shared secret (HS256)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+# Projects with asymmetric signing keys publish them here; defaults to the project's well-known JWKS
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+# Signing keys are refetched this often, or sooner (at most every AUTH_JWKS_MIN_REFRESH seconds) for an unknown kid
+AUTH_JWKS_REFRESH = float(os.getenv("AUTH_JWKS_REFRESH", "600"))
+AUTH_JWKS_MIN_REFRESH = float(os.getenv("AUTH_JWKS_MIN_REFRESH", "30"))
+# Verified claims are reused until the token expires, for at most this long
+AUTH_CLAIMS_CACHE_SIZE = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "4096"))
+AUTH_CLAIMS_CACHE_TTL = float(os.getenv("AUTH_CLAIMS_CACHE_TTL", "300"))
+# Reject requests without a bearer token instead of trusting the user_uuid they send
+REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "false").lower() == "true"
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
+
+class KeySet:
+    """Signing keys for access tokens: the project's JWT secret and/or its JWKS.
+
+    The JWKS is fetched on first use and refreshed every ``refresh_interval``
+    seconds in the background; a token with an unknown ``kid`` triggers an
+    early refetch, but no more often than ``min_refresh_interval``.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str],
+        jwks_url: Optional[str],
+        refresh_interval: float,
+        min_refresh_interval: float,
+        timer: Callable[[], float] = time.monotonic,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timer = timer
+        self.transport = transport
+        self.keys: Dict[str, dict] = {}
+        self.fetched_at: Optional[float] = None
+        self.fetches = 0
+        self._fetching: Optional[asyncio.Future] = None
+
+    async def _fetch(self) -> None:
+        async with httpx.AsyncClient(timeout=5, transport=self.transport) as client:
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+        self.keys = {key["kid"]: key for key in response.json().get("keys", []) if "kid" in key}
+        self.fetched_at = self.timer()
+        self.fetches += 1
+
+    def refresh(self) -> asyncio.Future:
+        """Start fetching the JWKS unless a fetch is already running, and return it."""
+        if self._fetching is None or self._fetching.done():
+            self._fetching = asyncio.ensure_future(self._fetch())
+            self._fetching.add_done_callback(self._on_fetched)
+        return self._fetching
+
+    def _on_fetched(self, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to fetch signing keys from {self.jwks_url}: {task.exception()}")
+
+    async def key_for(self, kid: Optional[str], algorithm: str) -> Any:
+        if algorithm == "HS256":
+            if not self.secret:
+                raise HTTPException(status_code=401, detail="Token algorithm not accepted")
+            return self.secret
+        if algorithm not in ASYMMETRIC_ALGORITHMS or not self.jwks_url:
+            raise HTTPException(status_code=401, detail="Token algorithm not accepted")
+
+        age = None if self.fetched_at is None else self.timer() - self.fetched_at
+        if kid not in self.keys and (age is None or age >= self.min_refresh_interval):
+            try:
+                await asyncio.shield(self.refresh())
+            except Exception:
+                raise HTTPException(status_code=503, detail="Could not load token signing keys")
+        elif age is not None and age >= self.refresh_interval:
+            # Keep verifying with the current keys while new ones load
+            self.refresh()
+
+        key = self.keys.get(kid)
+        if key is None:
+            raise HTTPException(status_code=401, detail="Unknown token signing key")
+        return key
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "jwks_keys": len(self.keys),
+            "jwks_fetches": self.fetches,
+            "jwks_age_seconds": None if self.fetched_at is None else round(self.timer() - self.fetched_at, 1),
+        }
+
+
+class Identity:
+    """The verified user behind a request."""
+
+    __slots__ = ("user_id", "email", "claims")
+
+    def __init__(self, claims: Dict[str, Any]):
+        self.user_id: str = claims["sub"]
+        self.email: Optional[str] = claims.get("email")
+        self.claims = claims
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally and caches the claims of tokens it has already checked."""
+
+    def __init__(self, keys: KeySet, audience: Optional[str], cache: TTLCache, clock: Callable[[], float] = time.time):
+        self.keys = keys
+        self.audience = audience
+        self.cache = cache
+        self.clock = clock
+        self.verified = 0
+        self.rejected = 0
+
+    async def verify(self, token: str) -> Identity:
+        cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        identity = self.cache.get(cache_key)
+        if identity is not None and identity.claims.get("exp", 0) > self.clock():
+            return identity
+
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get("alg", "")
+            key = await self.keys.key_for(header.get("kid"), algorithm)
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                options={"verify_aud": self.audience is not None, "require_exp": True, "require_sub": True},
+            )
+        except HTTPException:
+            self.rejected += 1
+            raise
+        except JWTError as e:
+            self.rejected += 1
+            raise HTTPException(status_code=401, detail=f"Invalid access token: {e}")
+
+        identity = Identity(claims)
+        self.verified += 1
+        self.cache.set(cache_key, identity)
+        return identity
+
+    def stats(self) -> Dict[str, Any]:
+        return {"verified": self.verified, "rejected": self.rejected, "claims_cache": self.cache.stats(), **self.keys.stats()}
+
+
+_verifier: Optional[TokenVerifier] = None
+_lock = threading.Lock()
+
+
+def _jwks_url() -> Optional[str]:
+    if SUPABASE_JWKS_URL:
+        return SUPABASE_JWKS_URL
+    url = os.environ.get("SUPABASE_URL")
+    return f"{url.rstrip('/')}/auth/v1/.well-known/jwks.json" if url else None
+
+
+def get_verifier() -> TokenVerifier:
+    """Return the shared verifier, creating it on first use."""
+    global _verifier
+    if _verifier is None:
+        with _lock:
+            if _verifier is None:
+                keys = KeySet(SUPABASE_JWT_SECRET, _jwks_url(), AUTH_JWKS_REFRESH, AUTH_JWKS_MIN_REFRESH)
+                cache = TTLCache(maxsize=AUTH_CLAIMS_CACHE_SIZE, ttl=AUTH_CLAIMS_CACHE_TTL)
+                _verifier = TokenVerifier(keys, SUPABASE_JWT_AUDIENCE or None, cache)
+    return _verifier
+
+
+def reset() -> None:
+    """Drop the shared verifier so the next request picks up changed settings."""
+    global _verifier
+    with _lock:
+        _verifier = None
+
+
+async def get_identity(authorization: Optional[str] = Header(None)) -> Optional[Identity]:
+    """Request dependency: the verified caller, or None for anonymous requests when auth isn't required."""
+    if not authorization:
+        if REQUIRE_AUTH:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Expected a Bearer token", headers={"WWW-Authenticate": "Bearer"})
+    return await get_verifier().verify(token.strip())
+
+
+def resolve_user(identity: Optional[Identity], user_uuid: Optional[str]) -> str:
+    """The user a request acts for: the token's subject, or the claimed user_uuid for anonymous requests.
+
+    A token for one user can't act on another user's data.
+    """
+    if identity is not None:
+        if user_uuid and user_uuid != identity.user_id:
+            raise HTTPException(status_code=403, detail="user_uuid does not match the access token")
+        return identity.user_id
+    if not user_uuid:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return user_uuid
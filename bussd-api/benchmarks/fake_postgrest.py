@@ -0,0 +1,117 @@
+"""In-memory stand-in for Supabase's PostgREST API, enough for the queries in ``db/``.
+
+Supports select with ``eq``/``neq``/``gt``/``gte``/``lt``/``lte`` filters, order and
+limit, and insert/update/delete returning the representation.
+
+    FAKE_POSTGREST_LATENCY_MS=5 python -m uvicorn benchmarks.fake_postgrest:app --port 9002
+"""
+import os
+import asyncio
+import operator
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+LATENCY_MS = float(os.getenv("FAKE_POSTGREST_LATENCY_MS", "5"))
+
+OPERATORS = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+RESERVED = {"select", "order", "limit", "offset", "columns", "on_conflict"}
+
+tables: Dict[str, List[dict]] = {}
+next_ids: Dict[str, int] = {}
+
+
+def coerce(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def parse_filters(request: Request) -> List[Tuple[str, Callable, object]]:
+    filters = []
+    for column, expression in request.query_params.multi_items():
+        if column in RESERVED:
+            continue
+        op, _, value = expression.partition(".")
+        filters.append((column, OPERATORS[op], coerce(value)))
+    return filters
+
+
+def matches(row: dict, filters) -> bool:
+    for column, compare, value in filters:
+        current = row.get(column)
+        try:
+            if not compare(current, value):
+                return False
+        except TypeError:
+            if not compare(str(current), str(value)):
+                return False
+    return True
+
+
+def project(rows: List[dict], select: str) -> List[dict]:
+    if not select or select == "*":
+        return rows
+    columns = select.split(",")
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
+async def table_endpoint(request: Request):
+    await asyncio.sleep(LATENCY_MS / 1000)
+    name = request.path_params["table"]
+    rows = tables.setdefault(name, [])
+    filters = parse_filters(request)
+    now = datetime.now(timezone.utc).isoformat()
+
+    if request.method == "GET":
+        selected = [row for row in rows if matches(row, filters)]
+        order = request.query_params.get("order")
+        if order:
+            column, _, direction = order.partition(".")
+            selected.sort(key=lambda row: row.get(column) or 0, reverse=direction.startswith("desc"))
+        limit = request.query_params.get("limit")
+        if limit:
+            selected = selected[:int(limit)]
+        return JSONResponse(project(selected, request.query_params.get("select", "*")))
+
+    if request.method == "POST":
+        body = await request.json()
+        created = []
+        for values in body if isinstance(body, list) else [body]:
+            next_ids[name] = next_ids.get(name, 0) + 1
+            row = {"id": next_ids[name], "created_at": now, "updated_at": now, **values}
+            rows.append(row)
+            created.append(row)
+        return JSONResponse(created, status_code=201)
+
+    if request.method == "PATCH":
+        values = await request.json()
+        updated = []
+        for row in rows:
+            if matches(row, filters):
+                row.update(values, updated_at=now)
+                updated.append(row)
+        return JSONResponse(updated)
+
+    if request.method == "DELETE":
+        deleted = [row for row in rows if matches(row, filters)]
+        tables[name] = [row for row in rows if not matches(row, filters)]
+        return JSONResponse(deleted)
+
+    return Response(status_code=405)
+
+
+async def reset(request: Request):
+    tables.clear()
+    next_ids.clear()
+    return JSONResponse({"ok": True})
+
+
+app = Starlette(routes=[
+    Route("/rest/v1/{table}", table_endpoint, methods=["GET", "POST", "PATCH", "DELETE"]),
+    Route("/_reset", reset, methods=["POST"]),
+])
@@ -0,0 +1,59 @@
+"""Local stand-in for the TfL API, serving StopPoint-shaped payloads after a configurable delay.
+
+    FAKE_TFL_LATENCY_MS=80 FAKE_TFL_STOPS=60 python -m uvicorn benchmarks.fake_tfl:app --port 9001
+"""
+import os
+import asyncio
+import random
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from benchmarks.serialization import make_stop
+
+# Mean upstream latency and jitter, in milliseconds
+LATENCY_MS = float(os.getenv("FAKE_TFL_LATENCY_MS", "80"))
+JITTER_MS = float(os.getenv("FAKE_TFL_JITTER_MS", "20"))
+STOPS_PER_ROUTE = int(os.getenv("FAKE_TFL_STOPS", "60"))
+
+requests_served = 0
+
+
+async def delay() -> None:
+    global requests_served
+    requests_served += 1
+    await asyncio.sleep(max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000)
+
+
+def route_stops(route_id: str, direction: str) -> list:
+    # Each route gets its own stop ids; inbound visits the same stops in reverse
+    offset = sum(map(ord, route_id)) * 1000
+    stops = [make_stop(offset + i) for i in range(STOPS_PER_ROUTE)]
+    return stops[::-1] if direction == "inbound" else stops
+
+
+async def route_sequence(request):
+    await delay()
+    stops = route_stops(request.path_params["route_id"], request.path_params["direction"])
+    return JSONResponse({
+        "lineId": request.path_params["route_id"],
+        "direction": request.path_params["direction"],
+        "stopPointSequences": [{"stopPoint": stops}],
+    })
+
+
+async def stop_point(request):
+    await delay()
+    stop = make_stop(0)
+    stop["id"] = stop["naptanId"] = request.path_params["stop_id"]
+    return JSONResponse(stop)
+
+
+async def stats(request):
+    return JSONResponse({"requests_served": requests_served})
+
+
+app = Starlette(routes=[
+    Route("/Line/{route_id}/Route/Sequence/{direction}", route_sequence),
+    Route("/StopPoint/{stop_id}", stop_point),
+    Route("/_stats", stats),
+])
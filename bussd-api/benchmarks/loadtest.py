@@ -0,0 +1,175 @@
+"""Offline load test: the API against local fake TfL and PostgREST servers.
+
+Starts the fakes and the API (each under uvicorn in its own process), runs a
+scenario from ``benchmarks.scenarios`` with N concurrent virtual users for a
+fixed duration, and reports requests/sec and p50/p95/p99 per step. Run from
+``bussd-api/``:
+
+    python -m benchmarks.loadtest --scenario mixed --users 20 --duration 30
+    python -m benchmarks.loadtest --scenario journey --tfl-latency-ms 150 --json results.json
+
+Keep the arguments fixed between releases and compare the JSON output to
+spot regressions.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import tempfile
+import asyncio
+import argparse
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+import httpx
+from benchmarks.scenarios import SCENARIOS, Recorder, User
+
+# supabase-py only checks that the key looks like a JWT
+FAKE_ANON_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.signature"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def serve(app: str, port: int, env: Dict[str, str], log_dir: str) -> Iterator[str]:
+    """Run ``app`` under uvicorn with its output in ``log_dir``, so the report isn't buried in request logs."""
+    log_path = os.path.join(log_dir, app.split(":")[0].rsplit(".", 1)[-1] + ".log")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+            env={**os.environ, **env},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_up(base_url + "/")
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> Dict[str, dict]:
+    report = {}
+    steps = list(recorder.latencies) + [step for step in recorder.errors if step not in recorder.latencies]
+    all_latencies: List[float] = []
+    for step in steps:
+        latencies = sorted(recorder.latencies.get(step, []))
+        all_latencies.extend(latencies)
+        report[step] = stats_for(latencies, recorder.errors.get(step, 0), elapsed)
+    report["total"] = stats_for(sorted(all_latencies), sum(recorder.errors.values()), elapsed)
+    return report
+
+
+def stats_for(latencies: List[float], errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def print_report(report: Dict[str, dict]) -> None:
+    print(f"{'step':<18}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for step, row in report.items():
+        print(f"{step:<18}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+
+
+async def drive(base_url: str, args: argparse.Namespace) -> Dict[str, dict]:
+    scenario = SCENARIOS[args.scenario]
+    routes = [str(route) for route in range(1, args.routes + 1)]
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def virtual_user(number: int, deadline: float):
+            rng = random.Random(args.seed + number)
+            user = User(number)
+            while time.monotonic() < deadline:
+                try:
+                    await scenario(client, recorder, rng, routes, user)
+                except httpx.HTTPError:
+                    pass
+
+        if args.warmup:
+            await asyncio.gather(*(virtual_user(n, time.monotonic() + args.warmup) for n in range(args.users)))
+            recorder = Recorder()
+
+        started = time.monotonic()
+        await asyncio.gather(*(virtual_user(n, started + args.duration) for n in range(args.users)))
+        return summarize(recorder, time.monotonic() - started)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds first, to fill caches")
+    parser.add_argument("--routes", type=int, default=50, help="Distinct bus routes the users pick from")
+    parser.add_argument("--tfl-latency-ms", type=float, default=80)
+    parser.add_argument("--postgrest-latency-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="Also write the report here")
+    parser.add_argument("--api-url", help="Benchmark an already running API instead of starting one")
+    parser.add_argument("--log-dir", default=tempfile.gettempdir(), help="Where the servers' output goes")
+    args = parser.parse_args(argv)
+
+    if args.api_url:
+        report = asyncio.run(drive(args.api_url, args))
+    else:
+        tfl_port, postgrest_port, api_port = free_port(), free_port(), free_port()
+        with serve("benchmarks.fake_tfl:app", tfl_port, {"FAKE_TFL_LATENCY_MS": str(args.tfl_latency_ms)}, args.log_dir) as tfl_url, \
+             serve("benchmarks.fake_postgrest:app", postgrest_port,
+                   {"FAKE_POSTGREST_LATENCY_MS": str(args.postgrest_latency_ms)}, args.log_dir) as postgrest_url, \
+             serve("main:app", api_port, {
+                 "TFL_URL": tfl_url,
+                 "SUPABASE_URL": postgrest_url,
+                 "SUPABASE_ANON_KEY": FAKE_ANON_KEY,
+                 # Measure the API, not the TfL quota guard
+                 "TFL_RATE_LIMIT": "100000",
+                 "TFL_RATE_BURST": "100000",
+                 "TFL_SNAPSHOT_PATH": "",
+             }, args.log_dir) as api_url:
+            report = asyncio.run(drive(api_url, args))
+
+    print(f"scenario={args.scenario} users={args.users} duration={args.duration}s routes={args.routes}\n")
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
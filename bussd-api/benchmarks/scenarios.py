@@ -0,0 +1,81 @@
+"""The app's real request flows, replayed against a running API by ``benchmarks.loadtest``."""
+import time
+import random
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+import httpx
+
+
+class Recorder:
+    """Latencies and failures per scenario step."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def timed(self, step: str, request: Awaitable[httpx.Response]) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.errors[step] += 1
+            raise
+        self.latencies[step].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[step] += 1
+            response.raise_for_status()
+        return response
+
+
+class User:
+    def __init__(self, number: int):
+        self.uuid = f"bench-user-{number}"
+        self.email = f"bench{number}@example.com"
+
+
+async def journey(client: httpx.AsyncClient, recorder: Recorder, rng: random.Random, routes: List[str], user: User) -> None:
+    """AddBusRoute: fetch a route's stops, pick two, work out the span, save the journey."""
+    route = rng.choice(routes)
+    stops = await recorder.timed("fetch stops", client.get(
+        "/api/tfl/stops", params={"route_id": route, "direction": "outbound"}
+    ))
+    stop_ids = [stop["id"] for stop in stops.json()["stops"]]
+    # Some riders pick their stops in inbound order, which makes the API try both directions
+    first, second = rng.sample(stop_ids, 2)
+
+    between = await recorder.timed("stops-between", client.get("/api/tfl/stops-between", params={
+        "route_id": route, "from_stop_id": first, "to_stop_id": second, "direction": "auto"
+    }))
+    await recorder.timed("add route", client.post("/api/tfl/add-bus-route", params={
+        "bus_route": route,
+        "percentage": between.json()["percentage"],
+        "user_uuid": user.uuid,
+        "started_stop": first,
+        "ended_stop": second,
+        "user_email": user.email,
+    }))
+
+
+async def dashboard(client: httpx.AsyncClient, recorder: Recorder, rng: random.Random, routes: List[str], user: User) -> None:
+    """DashboardScreen reload: page through the user's routes."""
+    cursor = None
+    while True:
+        params = {"user_uuid": user.uuid}
+        if cursor is not None:
+            params["cursor"] = cursor
+        page = (await recorder.timed("dashboard page", client.get("/api/dashboard/routes", params=params))).json()
+        cursor = page.get("next_cursor")
+        if cursor is None:
+            break
+
+
+async def journey_then_dashboard(client, recorder, rng, routes, user) -> None:
+    await journey(client, recorder, rng, routes, user)
+    await dashboard(client, recorder, rng, routes, user)
+
+
+SCENARIOS: Dict[str, Callable[..., Awaitable[None]]] = {
+    "journey": journey,
+    "dashboard": dashboard,
+    "mixed": journey_then_dashboard,
+}
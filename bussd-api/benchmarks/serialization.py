@@ -0,0 +1,95 @@
+"""Compare payload size and encode time for /stops responses.
+
+Builds a route of StopPoint objects shaped like TfL's (additionalProperties,
+lines, children) and encodes it the way FastAPI does by default
+(jsonable_encoder + json.dumps) and with orjson, full and compact, then
+compresses the result.
+
+    python -m benchmarks.serialization [--stops 60] [--repeat 200]
+"""
+import json
+import zlib
+import argparse
+import timeit
+from typing import Callable, List
+import orjson
+from fastapi.encoders import jsonable_encoder
+from tflApi.route_index import COMPACT_STOP_FIELDS, RouteIndex
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_stop(i: int) -> dict:
+    naptan = f"4900{i:05d}S"
+    return {
+        "$type": "Tfl.Api.Presentation.Entities.StopPoint, Tfl.Api.Presentation.Entities",
+        "id": naptan,
+        "naptanId": naptan,
+        "name": f"Example Road / Stop {i}",
+        "commonName": f"Example Road / Stop {i}",
+        "stopLetter": "K",
+        "indicator": "Stop K",
+        "stopType": "NaptanPublicBusCoachTram",
+        "modes": ["bus"],
+        "lat": 51.5 + i / 1000,
+        "lon": -0.12 + i / 1000,
+        "icsCode": str(1000000 + i),
+        "lines": [
+            {"id": str(line), "name": str(line), "uri": f"/Line/{line}", "type": "Line", "crowding": {}, "routeType": "Unknown", "status": "Unknown"}
+            for line in range(8)
+        ],
+        "lineModeGroups": [{"modeName": "bus", "lineIdentifier": [str(line) for line in range(8)]}],
+        "additionalProperties": [
+            {"category": category, "key": key, "sourceSystemKey": "Naptan490", "value": f"{category}-{key}-{i}"}
+            for category in ("Address", "Direction", "Facility") for key in ("AddressLine", "Towards", "CompassPoint")
+        ],
+        "children": [
+            {"id": f"{naptan}-{child}", "commonName": f"Entrance {child}", "lat": 51.5, "lon": -0.12, "children": [], "additionalProperties": []}
+            for child in range(2)
+        ],
+    }
+
+
+def fastapi_default(payload: dict) -> bytes:
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def orjson_encode(payload: dict) -> bytes:
+    return orjson.dumps(payload)
+
+
+def measure(encode: Callable[[dict], bytes], payload: dict, repeat: int) -> List[str]:
+    body = encode(payload)
+    seconds = timeit.timeit(lambda: encode(payload), number=repeat) / repeat
+    row = [f"{len(body):>9,}", f"{len(zlib.compress(body, 6)):>9,}"]
+    row.append(f"{len(brotli.compress(body, quality=4)):>9,}" if brotli is not None else f"{'n/a':>9}")
+    row.append(f"{seconds * 1000:>9.3f}")
+    return row
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", type=int, default=60, help="Stops on the route")
+    parser.add_argument("--repeat", type=int, default=200, help="Encodes per measurement")
+    args = parser.parse_args(argv)
+
+    index = RouteIndex([make_stop(i) for i in range(args.stops)])
+    full = {"route_id": "88", "direction": "outbound", "stop_count": len(index), "stops": index.stops}
+    compact = dict(full, stops=index.project(COMPACT_STOP_FIELDS))
+
+    print(f"{args.stops} stops, {args.repeat} encodes per row\n")
+    print(f"{'':<28}{'raw bytes':>9} {'gzip':>9} {'brotli':>9} {'encode ms':>9}")
+    for label, encode, payload in (
+        ("full, FastAPI default", fastapi_default, full),
+        ("full, orjson", orjson_encode, full),
+        ("compact, FastAPI default", fastapi_default, compact),
+        ("compact, orjson", orjson_encode, compact),
+    ):
+        print(f"{label:<28}" + " ".join(measure(encode, payload, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
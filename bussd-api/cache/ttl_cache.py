@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """In-process LRU cache with a per-entry TTL and single-flight loading.
+
+    Concurrent ``get_or_load`` calls for the same missing key share one
+    loader call instead of each going upstream. With ``stale_ttl`` set, an
+    expired entry is still returned for that long while a background load
+    replaces it (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        stale_ttl: float = 0,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timer = timer
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    def _entry(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] + self.stale_ttl <= self.timer():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._entry(key)
+        if entry is None or entry[0] <= self.timer():
+            return _MISSING
+        return entry[1]
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """Seconds until the entry expires (negative once stale), or None if it isn't cached."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[0] - self.timer()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (self.timer() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def record_lookup(self, hit: bool) -> None:
+        """Count a lookup made with ``get`` by a caller that loads misses itself."""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entry(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self.timer():
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self.refresh(key, loader)
+            return value
+
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        return await asyncio.shield(self.refresh(key, loader))
+
+    def refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Start loading ``key`` unless a load is already running, and return the load task."""
+        task = self._inflight.get(key)
+        if task is None:
+            # Run the load as its own task so a cancelled caller doesn't cancel it for everyone else
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._on_loaded, key))
+        return task
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        # Retrieving the exception also stops asyncio warning about it if every caller went away
+        if task.exception() is None:
+            self.set(key, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,54 @@
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class WriteGenerations:
+    """Tells a load whether its key was written to while it ran.
+
+    Generations are only kept for keys with a load in flight, so memory
+    follows concurrent loads rather than the number of keys. A write whose
+    key isn't known bumps a global epoch that every in-flight load sees.
+    """
+
+    def __init__(self):
+        self.epoch = 0
+        # key -> [loads in flight, writes seen since the first of them started]
+        self._loading: Dict[Hashable, List[int]] = {}
+
+    def begin(self, key: Hashable) -> Tuple[int, int]:
+        """Register a load of ``key`` and return the token to pass to ``end``."""
+        entry = self._loading.setdefault(key, [0, 0])
+        entry[0] += 1
+        return self.epoch, entry[1]
+
+    def end(self, key: Hashable, token: Tuple[int, int]) -> bool:
+        """Finish a load; True if nothing that could affect ``key`` was written since ``begin``."""
+        entry = self._loading[key]
+        unchanged = (self.epoch, entry[1]) == token
+        entry[0] -= 1
+        if not entry[0]:
+            del self._loading[key]
+        return unchanged
+
+    def written(self, key: Optional[Hashable]) -> None:
+        """Record a write to ``key``, or to unknown keys when it's None."""
+        if key is None:
+            self.epoch += 1
+            return
+        entry = self._loading.get(key)
+        if entry is not None:
+            entry[1] += 1
+
+
+def rows_by_owner(user_uuid: Optional[str], rows: Any) -> Optional[Dict[str, List[dict]]]:
+    """Group rows returned by a write by their user_uuid (``user_uuid`` when a row has none).
+
+    Returns None when the rows can't be read, so callers can't tell what changed.
+    """
+    if not isinstance(rows, list) or not all(isinstance(row, dict) and "id" in row for row in rows):
+        return None
+    owners: Dict[str, List[dict]] = {}
+    for row in rows:
+        owner = row.get("user_uuid", user_uuid)
+        if owner is not None:
+            owners.setdefault(owner, []).append(row)
+    return owners
@@ -1,33 +1,82 @@
 import os
-from fastapi import FastAPI
-from supabase import create_client, Client
+from typing import Optional
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
+from db import bus_routes
+from db import client as db_client
+from auth.tokens import Identity, get_identity, resolve_user
+from dashboard.route_cache import CACHED_COLUMNS, ROUTE_FIELDS, route_cache
 load_dotenv()
 
-app = FastAPI()
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+DASHBOARD_MAX_PAGE_SIZE = int(os.getenv("DASHBOARD_MAX_PAGE_SIZE", "200"))
+
+# What the route list renders when no fields are asked for
+DEFAULT_ROUTE_FIELDS = ["id", "bus_route", "started_stop", "ended_stop", "percentage_travelled"]
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+
+def parse_fields(fields: Optional[str]) -> str:
+    if not fields:
+        return ",".join(DEFAULT_ROUTE_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(requested) - ROUTE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # id is the pagination cursor, so it's always returned
+    if "id" not in requested:
+        requested.insert(0, "id")
+    return ",".join(requested)
 
-@app.get('/routes')
-async def get_routes(user_uuid: str):
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print(user_uuid)
+@app.get('/routes')
+async def get_routes(
+    user_uuid: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(DASHBOARD_PAGE_SIZE, ge=1),
+    fields: Optional[str] = None,
+    identity: Optional[Identity] = Depends(get_identity)
+):
+    user_uuid = resolve_user(identity, user_uuid)
+    supabase = db_client.get_supabase()
+    if not supabase:
+        return {"error": "Supabase credentials not found in environment variables", 'message': 'Error fetching routes'}
+    columns = parse_fields(fields)
+    limit = min(limit, DASHBOARD_MAX_PAGE_SIZE)
     try:
-        routes = supabase.from_('bus_routes_taken').select('*').eq('user_uuid', user_uuid).execute()
-        return {"routes": routes.data}
+        async def load_all(max_rows: int):
+            return (await bus_routes.select_page(supabase, user_uuid, CACHED_COLUMNS, max_rows)).data
+
+        cached = await route_cache.get(user_uuid, load_all)
+        if cached is not None:
+            # One more row than the page tells us whether another page follows
+            rows = cached.page(cursor, limit + 1)
+            requested = columns.split(",")
+            rows = [{field: row[field] for field in requested if field in row} for row in rows]
+        else:
+            rows = (await bus_routes.select_page(supabase, user_uuid, columns, limit + 1, after_id=cursor)).data
+        page = rows[:limit]
+        next_cursor = page[-1]["id"] if len(rows) > limit else None
+        return {"routes": page, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e), 'message': 'Error fetching routes'}
 
 
-@app.get('/routes/{route_id}')
-async def get_route(route_id: str):
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
+@app.get('/cache/stats')
+async def cache_stats():
+    return {"user_routes": route_cache.stats()}
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-    route = supabase.from_('bus_routes_taken').select('*').eq('id', route_id).execute()
+@app.get('/routes/{route_id}')
+async def get_route(route_id: str, identity: Optional[Identity] = Depends(get_identity)):
+    supabase = db_client.get_supabase()
+    if not supabase:
+        return {"error": "Supabase credentials not found in environment variables"}
+
+    # Signed-in callers only see their own routes
+    route = await bus_routes.select_by_id(supabase, route_id, identity.user_id if identity else None)
     if route.error:
         return {"error": route.error}
     return {"route": route.data}
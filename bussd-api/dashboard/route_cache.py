@@ -0,0 +1,133 @@
+import os
+from bisect import bisect_left, bisect_right
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from cache.ttl_cache import TTLCache
+from cache.writes import WriteGenerations, rows_by_owner
+
+load_dotenv()
+
+# Each user's route list is kept in-process for this long; writes through this API update it straight away
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+DASHBOARD_CACHE_USERS = int(os.getenv("DASHBOARD_CACHE_USERS", "2048"))
+# Users with more routes than this are paged from the database instead
+DASHBOARD_CACHE_MAX_ROWS = int(os.getenv("DASHBOARD_CACHE_MAX_ROWS", "1000"))
+
+# Columns the dashboard may ask for; the cache keeps all of them so any projection can be served
+ROUTE_FIELDS = {
+    "id", "bus_route", "started_stop", "ended_stop", "percentage_travelled",
+    "bus_route_taken", "user_uuid", "user_email", "created_at", "updated_at"
+}
+CACHED_COLUMNS = ",".join(sorted(ROUTE_FIELDS))
+
+# Cached in place of the route list for users with too many routes, so they skip the full load until it expires
+OVERSIZED = object()
+
+
+class UserRoutes:
+    """One user's routes ordered by id, with the ids alongside for cursor lookups."""
+
+    __slots__ = ("ids", "rows")
+
+    def __init__(self, rows: Iterable[dict]):
+        ordered = sorted(rows, key=lambda row: row["id"])
+        self.ids: List[Any] = [row["id"] for row in ordered]
+        self.rows: List[dict] = ordered
+
+    def page(self, after_id: Optional[Any], limit: int) -> List[dict]:
+        start = 0 if after_id is None else bisect_right(self.ids, after_id)
+        return self.rows[start:start + limit]
+
+    def upsert(self, row: dict) -> None:
+        position = bisect_left(self.ids, row["id"])
+        if position < len(self.ids) and self.ids[position] == row["id"]:
+            self.rows[position] = row
+        else:
+            self.ids.insert(position, row["id"])
+            self.rows.insert(position, row)
+
+    def remove(self, route_id: Any) -> None:
+        position = bisect_left(self.ids, route_id)
+        if position < len(self.ids) and self.ids[position] == route_id:
+            del self.ids[position]
+            del self.rows[position]
+
+
+class UserRouteCache:
+    """Per-user dashboard route lists, bounded and expiring, kept in step with this API's own writes.
+
+    A write to a user while their list is loading stops that load from being
+    cached, so a read after a write never sees the pre-write list. Writes
+    from other processes only show up once an entry expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_rows: int):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_rows = max_rows
+        self.generations = WriteGenerations()
+        self.writes = 0
+        self.oversized = 0
+
+    async def get(self, user_uuid: str, load: Callable[[int], Awaitable[List[dict]]]) -> Optional[UserRoutes]:
+        """The user's routes, loading them with ``load(limit)`` on a miss; None if they have too many to cache."""
+        routes = self.cache.get(user_uuid)
+        self.cache.record_lookup(routes is not None)
+        if routes is not None:
+            return None if routes is OVERSIZED else routes
+
+        token = self.generations.begin(user_uuid)
+        try:
+            rows = await load(self.max_rows + 1)
+        finally:
+            unchanged = self.generations.end(user_uuid, token)
+        if len(rows) > self.max_rows:
+            self.oversized += 1
+            self.cache.set(user_uuid, OVERSIZED)
+            return None
+        routes = UserRoutes(self._project(row) for row in rows)
+        if unchanged:
+            self.cache.set(user_uuid, routes)
+        return routes
+
+    @staticmethod
+    def _project(row: dict) -> dict:
+        return {field: row[field] for field in ROUTE_FIELDS if field in row}
+
+    def _written(self, user_uuid: Optional[str], rows: Any, apply: Callable[[UserRoutes, dict], None]) -> None:
+        self.writes += 1
+        owners = rows_by_owner(user_uuid, rows)
+        if owners is None:
+            # Can't tell exactly what changed, so drop the user's entry (or everything if we don't know whose)
+            self.generations.written(user_uuid)
+            if user_uuid is None:
+                self.cache.clear()
+            else:
+                self.cache.invalidate(user_uuid)
+            return
+        for owner, owned in owners.items():
+            self.generations.written(owner)
+            routes = self.cache.get(owner)
+            if not isinstance(routes, UserRoutes):
+                continue
+            for row in owned:
+                apply(routes, self._project(row))
+            if len(routes.ids) > self.max_rows:
+                self.cache.set(owner, OVERSIZED)
+
+    def inserted(self, user_uuid: str, rows: Any) -> None:
+        self._written(user_uuid, rows, UserRoutes.upsert)
+
+    def updated(self, user_uuid: str, rows: Any) -> None:
+        self._written(user_uuid, rows, UserRoutes.upsert)
+
+    def deleted(self, user_uuid: Optional[str], rows: Any) -> None:
+        self._written(user_uuid, rows, lambda routes, row: routes.remove(row["id"]))
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "writes": self.writes, "oversized_users": self.oversized}
+
+
+route_cache = UserRouteCache(DASHBOARD_CACHE_USERS, DASHBOARD_CACHE_TTL, DASHBOARD_CACHE_MAX_ROWS)
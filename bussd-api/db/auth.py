@@ -0,0 +1,18 @@
+from supabase import Client
+from db.executor import run_sync
+
+
+async def sign_up(client: Client, email: str, password: str):
+    return await run_sync(client.auth.sign_up, {"email": email, "password": password})
+
+
+async def sign_in_with_password(client: Client, email: str, password: str):
+    return await run_sync(client.auth.sign_in_with_password, {"email": email, "password": password})
+
+
+async def sign_out(client: Client):
+    return await run_sync(client.auth.sign_out)
+
+
+async def get_session(client: Client):
+    return await run_sync(client.auth.get_session)
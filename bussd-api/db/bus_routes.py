@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional, Union
+from supabase import Client
+from db.executor import run_sync
+
+TABLE = "bus_routes_taken"
+
+
+async def insert(client: Client, rows: Union[Dict[str, Any], List[Dict[str, Any]]]):
+    return await run_sync(client.table(TABLE).insert(rows).execute)
+
+
+async def select_for_user(client: Client, user_uuid: str, columns: str = "*"):
+    return await run_sync(client.table(TABLE).select(columns).eq("user_uuid", user_uuid).execute)
+
+
+async def select_page(client: Client, user_uuid: str, columns: str, limit: int, after_id: Optional[int] = None):
+    """Keyset page of a user's routes ordered by id, starting after ``after_id``."""
+    query = client.table(TABLE).select(columns).eq("user_uuid", user_uuid)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return await run_sync(query.order("id").limit(limit).execute)
+
+
+async def select_all_page(client: Client, columns: str, limit: int, after_id: Optional[int] = None):
+    """Keyset page of every user's routes ordered by id, starting after ``after_id``."""
+    query = client.table(TABLE).select(columns)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return await run_sync(query.order("id").limit(limit).execute)
+
+
+async def select_by_id(client: Client, route_id: Any, user_uuid: Optional[str] = None, columns: str = "*"):
+    query = client.table(TABLE).select(columns).eq("id", route_id)
+    if user_uuid is not None:
+        query = query.eq("user_uuid", user_uuid)
+    return await run_sync(query.execute)
+
+
+async def update(
+    client: Client,
+    route_id: Any,
+    user_uuid: str,
+    values: Dict[str, Any],
+    expected_updated_at: Optional[str] = None
+):
+    """Update a user's route and return the changed rows; empty if nothing matched.
+
+    ``expected_updated_at`` makes the update conditional on the row not having
+    changed since the caller read it (updated_at is maintained by the database).
+    """
+    query = client.table(TABLE).update(values).eq("id", route_id).eq("user_uuid", user_uuid)
+    if expected_updated_at is not None:
+        query = query.eq("updated_at", expected_updated_at)
+    return await run_sync(query.execute)
+
+
+async def delete(client: Client, route_id: Any, user_uuid: Optional[str] = None):
+    query = client.table(TABLE).delete().eq("id", route_id)
+    if user_uuid is not None:
+        query = query.eq("user_uuid", user_uuid)
+    return await run_sync(query.execute)
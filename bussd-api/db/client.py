@@ -0,0 +1,88 @@
+import os
+import logging
+import threading
+from typing import Optional
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import SyncClient
+from supabase import Client
+from supabase.lib.client_options import ClientOptions
+
+logger = logging.getLogger(__name__)
+
+# Max concurrent Supabase calls and pooled HTTP connections per client; the single knob for DB concurrency
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+_client: Optional[Client] = None
+_auth_client: Optional[Client] = None
+_lock = threading.Lock()
+
+
+class _PooledPostgrestClient(SyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_POOL_SIZE,
+                max_keepalive_connections=SUPABASE_POOL_SIZE,
+            ),
+        )
+
+
+class _PooledClient(Client):
+    # supabase-py rebuilds the postgrest client on auth events, so the pool has to be set up here
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT):
+        return _PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout)
+
+
+def _create() -> Optional[Client]:
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_ANON_KEY")
+    if not url or not key:
+        return None
+    options = ClientOptions(
+        postgrest_client_timeout=SUPABASE_TIMEOUT,
+        persist_session=False,
+    )
+    try:
+        return _PooledClient(url, key, options=options)
+    except Exception as e:
+        logger.error(f"Failed to create Supabase client: {e}")
+        return None
+
+
+def get_supabase() -> Optional[Client]:
+    """Return the shared data client, creating it on first use. None if credentials aren't set."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _create()
+    return _client
+
+
+def get_auth_client() -> Optional[Client]:
+    """Return the client used for sign-in/sign-up.
+
+    Signing in swaps the client's postgrest headers to the user's token, so
+    auth flows get their own client and never change what data queries run as.
+    """
+    global _auth_client
+    if _auth_client is None:
+        with _lock:
+            if _auth_client is None:
+                _auth_client = _create()
+    return _auth_client
+
+
+def reset() -> None:
+    """Drop the cached clients so the next call picks up new credentials."""
+    global _client, _auth_client
+    with _lock:
+        _client = None
+        _auth_client = None
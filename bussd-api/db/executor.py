@@ -0,0 +1,23 @@
+from functools import partial
+from typing import Any, Callable, Optional
+import anyio
+from db.client import SUPABASE_POOL_SIZE
+from metrics.registry import upstream_timer
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def get_limiter() -> anyio.CapacityLimiter:
+    global _limiter
+    if _limiter is None:
+        # Each running call holds a worker thread and a pooled connection while it waits on the network
+        _limiter = anyio.CapacityLimiter(SUPABASE_POOL_SIZE)
+    return _limiter
+
+
+async def run_sync(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking supabase-py call in the bounded DB thread pool so the event loop keeps serving."""
+    with upstream_timer("supabase") as timer:
+        result = await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=get_limiter())
+        timer.outcome = "ok"
+    return result
@@ -1,23 +1,46 @@
 import os
-from fastapi import FastAPI, Body
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Body
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from supabase import create_client, Client
+from supabase import Client
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import Optional
 from dashboard.dashboard import app as dashboard_app
 from tflApi.tflapi import app as tfl_app
+from stats.stats import app as stats_app
+from auth.tokens import Identity, get_identity
+from db import auth as db_auth
+from db import client as db_client
+from middleware.compression import CompressionMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.profiling import ProfilingMiddleware
+from metrics.registry import REGISTRY
 
 load_dotenv()
 
+# Responses smaller than this aren't worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Opt-in request profiling (needs pyinstrument): requests sending X-Profile, or a sampled share of all requests
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_FORMAT = os.getenv("PROFILING_FORMAT", "speedscope")
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+
 class SignUpRequest(BaseModel):
     email: str
     password: str
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_ANON_KEY")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Starlette doesn't run lifespans of mounted sub-apps, so drive them from here
+    async with tfl_app.router.lifespan_context(tfl_app), stats_app.router.lifespan_context(stats_app):
+        yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,22 +49,25 @@ app.add_middleware(
     allow_methods=["*"], 
     allow_headers=["*"], 
 )
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+if PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=PROFILING_DIR,
+        token=PROFILING_TOKEN,
+        sample_rate=PROFILING_SAMPLE_RATE,
+        output_format=PROFILING_FORMAT,
+    )
+app.add_middleware(MetricsMiddleware, apps={"/api/dashboard": "dashboard", "/api/tfl": "tfl", "/api/stats": "stats"})
 
 # Mount the dashboard routes
 app.mount("/api/dashboard", dashboard_app)
 app.mount("/api/tfl", tfl_app)
+app.mount("/api/stats", stats_app)
 
-# Only create Supabase client if credentials are available
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    except Exception as e:
-        print(f"Failed to create Supabase client: {e}")
-
-def check_supabase_credentials():
+def check_supabase_credentials(supabase: Optional[Client]):
     """Check if Supabase credentials are available"""
-    if not SUPABASE_URL or not SUPABASE_KEY or not supabase:
+    if not supabase:
         return {"error": "Supabase credentials not found in environment variables"}
     return None
 
@@ -49,9 +75,19 @@ def check_supabase_credentials():
 def read_root():
     return {"message": "Hello, world!"}
 
+@app.get('/metrics', response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of request, TfL and Supabase timings"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get('/auth/session')
-def get_session():
-    error = check_supabase_credentials()
+def get_session(identity: Optional[Identity] = Depends(get_identity)):
+    # A verified access token answers this locally, without asking Supabase
+    if identity is not None:
+        return {"isLoggedIn": True, "session": {"user": {"email": identity.email, "id": identity.user_id}}}
+
+    supabase = db_client.get_auth_client()
+    error = check_supabase_credentials(supabase)
     if error:
         return error
     
@@ -71,7 +107,8 @@ def get_session():
 
 @app.get('/supabase/test')
 def test_supabase():
-    error = check_supabase_credentials()
+    supabase = db_client.get_supabase()
+    error = check_supabase_credentials(supabase)
     if error:
         return error
     
@@ -83,15 +120,13 @@ def test_supabase():
 
 @app.post('/supabase/auth/signup')
 async def signup_user(request: SignUpRequest):
-    error = check_supabase_credentials()
+    supabase = db_client.get_auth_client()
+    error = check_supabase_credentials(supabase)
     if error:
         return error
     
     try:
-        response = supabase.auth.sign_up({
-            "email": request.email,
-            "password": request.password
-        })
+        response = await db_auth.sign_up(supabase, request.email, request.password)
         if response.user:
             return {"message": "User signed up successfully", "user": response.user}
         else:
@@ -101,16 +136,14 @@ async def signup_user(request: SignUpRequest):
     
 @app.post('/supabase/auth/signin')
 async def signin_user(request: SignUpRequest):
-    error = check_supabase_credentials()
+    supabase = db_client.get_auth_client()
+    error = check_supabase_credentials(supabase)
     if error:
         return error
     
     print("Attempting to sign in:", request.email)
     try:
-        response = supabase.auth.sign_in_with_password({
-            "email": request.email,
-            "password": request.password
-        })
+        response = await db_auth.sign_in_with_password(supabase, request.email, request.password)
         print("Sign in response:", response)
         if response.user:
             return {"message": "User signed in successfully", "user": response.user}
@@ -122,9 +155,10 @@ async def signin_user(request: SignUpRequest):
 
 @app.post('/supabase/auth/signout')
 async def signout_user():
-    error = check_supabase_credentials()
+    supabase = db_client.get_auth_client()
+    error = check_supabase_credentials(supabase)
     if error:
         return error
     
-    supabase.auth.sign_out()
+    await db_auth.sign_out(supabase)
     return {"message": "User signed out successfully"}
\ No newline at end of file
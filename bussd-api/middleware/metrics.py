@@ -0,0 +1,74 @@
+import time
+from typing import Dict
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from metrics.registry import REGISTRY, Gauge, Histogram
+
+# Anything else is counted as "other" so odd methods can't add label values
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds",
+    "Time to complete HTTP requests, by route template.",
+    ("method", "route", "status"),
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served, by app.",
+    ("app",),
+))
+
+
+def route_template(scope: Scope) -> str:
+    """The matched route's path template, prefixed with any mounts (``/api/tfl/stops/{stop_id}``).
+
+    Requests no route matched are grouped under "unmatched" so arbitrary paths
+    never become label values.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    # Mounted apps extend root_path with their prefix
+    mount = scope.get("root_path", "")[len(scope.get("app_root_path", "")):]
+    return mount + path
+
+
+class MetricsMiddleware:
+    """Record a latency histogram per route template and in-flight gauges per mounted app.
+
+    ``apps`` maps path prefixes of mounted sub-apps to the label used for
+    them; everything else is counted as "root".
+    """
+
+    def __init__(self, app: ASGIApp, apps: Dict[str, str]):
+        self.app = app
+        self.apps = tuple(apps.items())
+
+    def _app_label(self, path: str) -> str:
+        for prefix, label in self.apps:
+            if path == prefix or path.startswith(prefix + "/"):
+                return label
+        return "root"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        app_label = self._app_label(scope["path"])
+        status = "500"
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(app_label)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(app_label)
+            method = scope["method"] if scope["method"] in METHODS else "other"
+            REQUEST_DURATION.observe(time.perf_counter() - started, method, route_template(scope), status)
@@ -0,0 +1,98 @@
+import os
+import re
+import time
+import uuid
+import random
+import logging
+from typing import Optional
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from middleware.metrics import route_template
+
+# Profiling needs the optional pyinstrument package
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    Profiler = None
+    SpeedscopeRenderer = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"html": "html", "speedscope": "speedscope.json"}
+
+
+class ProfilingMiddleware:
+    """Capture a wall-clock call tree of selected requests and write it to ``directory``.
+
+    A request is profiled when it sends ``header`` (whose value must equal
+    ``token`` if one is set) or is picked by ``sample_rate``. The profile's id
+    is returned in the same header. Only add this middleware when profiling is
+    enabled; requests that aren't picked pay one header lookup.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        directory: str,
+        header: str = "X-Profile",
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        output_format: str = "speedscope",
+        interval: float = 0.001
+    ):
+        if Profiler is None:
+            raise RuntimeError("Profiling is enabled but pyinstrument isn't installed (pip install pyinstrument)")
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown profile format {output_format!r}, expected one of {', '.join(FORMATS)}")
+        self.app = app
+        self.directory = directory
+        self.header = header
+        self.token = token
+        self.sample_rate = sample_rate
+        self.output_format = output_format
+        self.interval = interval
+
+    def should_profile(self, scope: Scope) -> bool:
+        value = Headers(scope=scope).get(self.header)
+        if value is not None:
+            return not self.token or value == self.token
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"])[self.header] = profile_id
+            await send(message)
+
+        # async_mode attributes time spent awaiting (e.g. Supabase calls in worker threads) to the awaiting frame
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            name = f"{profile_id}-{scope['method']}{route_template(scope)}"
+            await anyio.to_thread.run_sync(self._write, profiler, name)
+
+    def _write(self, profiler, name: str) -> None:
+        filename = re.sub(r"[^A-Za-z0-9_.-]+", "_", name) + "." + FORMATS[self.output_format]
+        if self.output_format == "html":
+            output = profiler.output_html()
+        else:
+            output = profiler.output(renderer=SpeedscopeRenderer())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, filename), "w") as f:
+                f.write(output)
+        except OSError as e:
+            logger.error(f"Could not write profile {filename}: {e}")
+            return
+        logger.info(f"Wrote request profile {filename}")
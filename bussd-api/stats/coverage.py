@@ -0,0 +1,287 @@
+import os
+import math
+import heapq
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from dotenv import load_dotenv
+from cache.ttl_cache import TTLCache
+from cache.writes import WriteGenerations, rows_by_owner
+
+load_dotenv()
+
+# A user's coverage is built from their journeys on first use (one query plus placing every journey) and kept
+# for this long after it was loaded or last written to through this API, which keeps it current
+COVERAGE_CACHE_USERS = int(os.getenv("COVERAGE_CACHE_USERS", "2048"))
+COVERAGE_CACHE_TTL = float(os.getenv("COVERAGE_CACHE_TTL", "900"))
+# Writes stop extending an entry past this long after it was loaded, so writes made through other workers show up
+COVERAGE_CACHE_MAX_AGE = float(os.getenv("COVERAGE_CACHE_MAX_AGE", "3600"))
+
+
+class JourneySpan(NamedTuple):
+    """Where a journey sits on its route: stop positions in one direction of a route with ``stops`` stops."""
+    route_id: str
+    direction: str
+    start: int
+    end: int
+    stops: int
+
+
+def span_mask(start: int, end: int) -> int:
+    """Bitset of the segments between two stop positions."""
+    start, end = min(start, end), max(start, end)
+    return ((1 << (end - start)) - 1) << start
+
+
+class RouteCoverage:
+    """Travelled segments of one route direction as a bitset; bit i is the hop from stop i to stop i + 1.
+
+    Each journey's mask is kept, so adding a journey is one OR and taking one
+    out (delete or edit) ORs the remaining masks back together. The covered
+    count is kept up to date, so the percentage is O(1).
+    """
+
+    __slots__ = ("segments", "journeys", "bits", "covered")
+
+    def __init__(self, stops: int):
+        self.segments = max(stops - 1, 0)
+        self.journeys: Dict[Any, int] = {}
+        self.bits = 0
+        self.covered = 0
+
+    def add(self, journey_id: Any, start: int, end: int) -> None:
+        mask = span_mask(start, end)
+        self.journeys[journey_id] = mask
+        self.bits |= mask
+        self.covered = self.bits.bit_count()
+
+    def remove(self, journey_id: Any) -> None:
+        if self.journeys.pop(journey_id, None) is None:
+            return
+        bits = 0
+        for mask in self.journeys.values():
+            bits |= mask
+        self.bits = bits
+        self.covered = bits.bit_count()
+
+    @property
+    def percentage(self) -> int:
+        """Share of the route's segments travelled at least once, rounded half up like RouteIndex.percentage."""
+        if not self.segments:
+            return 0
+        return math.floor(self.covered * 100 / self.segments + 0.5)
+
+    @property
+    def complete(self) -> bool:
+        return self.segments > 0 and self.covered == self.segments
+
+
+class UserCoverage:
+    """Coverage of every route direction one user has travelled, with running totals.
+
+    The totals are adjusted as journeys come and go, so a summary never has to
+    walk the user's journeys.
+    """
+
+    __slots__ = (
+        "routes", "journeys", "unplaced", "stops_travelled", "covered", "completed", "route_journeys", "route_stops",
+        "loaded_at"
+    )
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteCoverage] = {}
+        # journey id -> (route, direction) and the number of stops it travelled
+        self.journeys: Dict[Any, Tuple[Tuple[str, str], int]] = {}
+        # Journeys whose stops aren't on their route (e.g. old free-text rows)
+        self.unplaced: Set[Any] = set()
+        self.stops_travelled = 0
+        # Distinct segments travelled, summed over route directions
+        self.covered = 0
+        # Route directions with every segment travelled
+        self.completed = 0
+        # Per route id, both directions together
+        self.route_journeys: Dict[str, int] = {}
+        self.route_stops: Dict[str, int] = {}
+        # When the engine built this from the user's journeys, on its cache's clock
+        self.loaded_at = 0.0
+
+    def add(self, journey_id: Any, span: Optional[JourneySpan]) -> bool:
+        """Add or replace a journey (None for one that can't be placed on its route).
+
+        Returns False if the route's stop count no longer matches what's stored.
+        """
+        self.remove(journey_id)
+        if span is None:
+            self.unplaced.add(journey_id)
+            return True
+        key = (span.route_id.lower(), span.direction.lower())
+        route = self.routes.get(key)
+        if route is None:
+            route = self.routes[key] = RouteCoverage(span.stops)
+        elif route.segments != max(span.stops - 1, 0):
+            return False
+        was_complete, was_covered = route.complete, route.covered
+        route.add(journey_id, span.start, span.end)
+        self.completed += route.complete - was_complete
+        self.covered += route.covered - was_covered
+
+        count = abs(span.end - span.start)
+        self.journeys[journey_id] = (key, count)
+        self._tally(key[0], 1, count)
+        return True
+
+    def remove(self, journey_id: Any) -> None:
+        self.unplaced.discard(journey_id)
+        entry = self.journeys.pop(journey_id, None)
+        if entry is None:
+            return
+        key, count = entry
+        route = self.routes[key]
+        was_complete, was_covered = route.complete, route.covered
+        route.remove(journey_id)
+        self.completed += route.complete - was_complete
+        self.covered += route.covered - was_covered
+        if not route.journeys:
+            del self.routes[key]
+        self._tally(key[0], -1, -count)
+
+    def _tally(self, route_id: str, journeys: int, stops: int) -> None:
+        self.stops_travelled += stops
+        remaining = self.route_journeys.get(route_id, 0) + journeys
+        if remaining:
+            self.route_journeys[route_id] = remaining
+            self.route_stops[route_id] = self.route_stops.get(route_id, 0) + stops
+        else:
+            del self.route_journeys[route_id]
+            del self.route_stops[route_id]
+
+    def route(self, route_id: str, direction: str) -> Optional[RouteCoverage]:
+        return self.routes.get((route_id.lower(), direction.lower()))
+
+    def top_routes(self, n: int) -> List[str]:
+        """The ``n`` routes taken most often (then furthest), in O(routes log n) however long the history."""
+        return heapq.nlargest(n, self.route_journeys, key=lambda route_id: (self.route_journeys[route_id], self.route_stops[route_id]))
+
+
+SpanResolver = Callable[[dict], Awaitable[Optional[JourneySpan]]]
+
+
+Listener = Callable[[str, Optional[UserCoverage]], None]
+
+
+class CoverageEngine:
+    """Per-user route coverage, built once from the user's journeys and then kept in step with writes.
+
+    ``span`` resolvers place a journey row on its route and return None for
+    rows that can't be placed; any exception they raise (e.g. TfL being down)
+    stops a partial coverage from being cached. A write to a user while their
+    coverage is loading stops that load from being cached.
+
+    Writes restart an entry's expiry, but never past ``max_age`` seconds
+    after it was loaded, which bounds how long writes made through other
+    processes go unseen.
+
+    Listeners are told about every user whose coverage was loaded or changed,
+    and get None for a user written to while their coverage isn't loaded.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_age: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_age = max_age
+        self.generations = WriteGenerations()
+        self.writes = 0
+        self.listeners: List[Listener] = []
+
+    def _notify(self, user_uuid: str, coverage: Optional[UserCoverage]) -> None:
+        for listener in self.listeners:
+            listener(user_uuid, coverage)
+
+    async def get(self, user_uuid: str, load: Callable[[], Awaitable[List[dict]]], span: SpanResolver) -> UserCoverage:
+        coverage = self.cache.get(user_uuid)
+        self.cache.record_lookup(coverage is not None)
+        if coverage is not None:
+            return coverage
+
+        token = self.generations.begin(user_uuid)
+        loaded_at = self.cache.timer()
+        try:
+            rows = await load()
+            spans = await asyncio.gather(*(span(row) for row in rows))
+        finally:
+            unchanged = self.generations.end(user_uuid, token)
+        coverage = UserCoverage()
+        coverage.loaded_at = loaded_at
+        for row, journey_span in zip(rows, spans):
+            if not coverage.add(row["id"], journey_span):
+                coverage.unplaced.add(row["id"])
+        if unchanged:
+            self.cache.set(user_uuid, coverage)
+            self._notify(user_uuid, coverage)
+        return coverage
+
+    def _owners(self, user_uuid: Optional[str], rows: Any) -> Dict[str, List[dict]]:
+        """Rows grouped by owner, marking each owner as written; empty if the rows can't be read."""
+        self.writes += 1
+        owners = rows_by_owner(user_uuid, rows)
+        if owners is None:
+            self.generations.written(user_uuid)
+            self.invalidate(user_uuid)
+            return {}
+        for owner in owners:
+            self.generations.written(owner)
+        return owners
+
+    async def saved(self, user_uuid: Optional[str], rows: Any, span: SpanResolver) -> None:
+        """Apply inserted or updated journey rows to their owners' coverage, if it's loaded."""
+        owners = self._owners(user_uuid, rows)
+        for owner, owned in owners.items():
+            if self.cache.get(owner) is None:
+                self._notify(owner, None)
+                continue
+            try:
+                spans = await asyncio.gather(*(span(row) for row in owned))
+            except Exception:
+                self.invalidate(owner)
+                continue
+            # Look the user up again: the entry may have been dropped while spans resolved
+            coverage = self.cache.get(owner)
+            if coverage is None:
+                self._notify(owner, None)
+                continue
+            for row, journey_span in zip(owned, spans):
+                if not coverage.add(row["id"], journey_span):
+                    self.invalidate(owner)
+                    break
+            else:
+                self._renew(owner, coverage)
+                self._notify(owner, coverage)
+
+    def deleted(self, user_uuid: Optional[str], rows: Any) -> None:
+        """Take deleted journey rows out of their owners' coverage."""
+        owners = self._owners(user_uuid, rows)
+        for owner, owned in owners.items():
+            coverage = self.cache.get(owner)
+            if coverage is not None:
+                for row in owned:
+                    coverage.remove(row["id"])
+                self._renew(owner, coverage)
+            self._notify(owner, coverage)
+
+    def _renew(self, user_uuid: str, coverage: UserCoverage) -> None:
+        # The write kept this user's coverage current, so restart its expiry rather than rebuild it later,
+        # unless that would keep it past max_age
+        if self.cache.timer() + self.cache.ttl <= coverage.loaded_at + self.max_age:
+            self.cache.set(user_uuid, coverage)
+
+    def invalidate(self, user_uuid: Optional[str] = None) -> None:
+        """Drop one user's coverage, or everyone's if we don't know whose changed."""
+        if user_uuid is None:
+            self.cache.clear()
+        else:
+            self.cache.invalidate(user_uuid)
+            self._notify(user_uuid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "writes": self.writes}
+
+
+coverage_engine = CoverageEngine(COVERAGE_CACHE_USERS, COVERAGE_CACHE_TTL, COVERAGE_CACHE_MAX_AGE)
@@ -0,0 +1,311 @@
+import os
+import time
+import asyncio
+import logging
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from stats.coverage import UserCoverage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Full rebuilds from bus_routes_taken correct any drift; in between, writes update the rankings directly
+LEADERBOARD_ENABLED = os.getenv("LEADERBOARD_ENABLED", "true").lower() == "true"
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv("LEADERBOARD_REBUILD_INTERVAL", "3600"))
+# Users written to while their coverage wasn't loaded are rescored this often, this many at a time
+LEADERBOARD_CATCHUP_INTERVAL = float(os.getenv("LEADERBOARD_CATCHUP_INTERVAL", "30"))
+LEADERBOARD_CATCHUP_BATCH = int(os.getenv("LEADERBOARD_CATCHUP_BATCH", "100"))
+# Rows read per query during a rebuild
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "1000"))
+# A rebuild loads each distinct route once, this many at a time and at most this many per second, so it takes
+# only a small share of the TfL limits the API shares (TFL_RATE_LIMIT)
+LEADERBOARD_TFL_CONCURRENCY = int(os.getenv("LEADERBOARD_TFL_CONCURRENCY", "2"))
+LEADERBOARD_TFL_RATE = float(os.getenv("LEADERBOARD_TFL_RATE", "1"))
+
+# Route directions with every segment travelled, and distinct stop-to-stop segments travelled
+METRICS = ("routes_completed", "stops_covered")
+
+
+def scores_for(coverage: UserCoverage) -> Tuple[int, int]:
+    return coverage.completed, coverage.covered
+
+
+class Ranking:
+    """Users ordered by a non-negative integer score, with O(log S) rank and top-N lookups.
+
+    A Fenwick tree indexed by score counts users per score, so "how many
+    users score higher" is one prefix sum and the k-th highest score is one
+    descent. Users with the same score share a rank and are listed in the
+    order they reached it. Memory is one entry per user plus the tree, which
+    is sized to the highest score and so bounded by the size of the network.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        self.scores: Dict[str, int] = {}
+        self.buckets: Dict[int, Dict[str, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def _add(self, score: int, delta: int) -> None:
+        position = score + 1
+        while position <= self.capacity:
+            self.tree[position] += delta
+            position += position & -position
+
+    def _at_most(self, score: int) -> int:
+        """Number of users scoring ``score`` or less."""
+        position, total = min(score + 1, self.capacity), 0
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+    def _kth_lowest(self, k: int) -> int:
+        """The score of the k-th lowest user (1-based)."""
+        position, step = 0, 1 << (self.capacity.bit_length() - 1)
+        while step:
+            if position + step <= self.capacity and self.tree[position + step] < k:
+                position += step
+                k -= self.tree[position]
+            step >>= 1
+        return position
+
+    def _grow(self, score: int) -> None:
+        while self.capacity <= score:
+            self.capacity *= 2
+        self.tree = [0] * (self.capacity + 1)
+        for bucket_score, bucket in self.buckets.items():
+            self._add(bucket_score, len(bucket))
+
+    def set(self, user_uuid: str, score: int) -> None:
+        score = max(score, 0)
+        previous = self.scores.get(user_uuid)
+        if previous == score:
+            return
+        if previous is not None:
+            self.discard(user_uuid)
+        if score >= self.capacity:
+            self._grow(score)
+        self.scores[user_uuid] = score
+        self.buckets.setdefault(score, {})[user_uuid] = None
+        self._add(score, 1)
+
+    def discard(self, user_uuid: str) -> None:
+        score = self.scores.pop(user_uuid, None)
+        if score is None:
+            return
+        bucket = self.buckets[score]
+        del bucket[user_uuid]
+        if not bucket:
+            del self.buckets[score]
+        self._add(score, -1)
+
+    def rank(self, user_uuid: str) -> Optional[int]:
+        """1 + the number of users scoring higher, or None for users who aren't ranked."""
+        score = self.scores.get(user_uuid)
+        if score is None:
+            return None
+        return len(self.scores) - self._at_most(score) + 1
+
+    def top(self, n: int) -> List[Tuple[int, str, int]]:
+        """(rank, user, score) for the ``n`` highest scoring users."""
+        entries: List[Tuple[int, str, int]] = []
+        rank = 1
+        while len(entries) < n and rank <= len(self.scores):
+            score = self._kth_lowest(len(self.scores) - rank + 1)
+            bucket = self.buckets[score]
+            for user_uuid in bucket:
+                if len(entries) == n:
+                    break
+                entries.append((rank, user_uuid, score))
+            rank += len(bucket)
+        return entries
+
+
+class Leaderboard:
+    """Network-wide rankings of users, one per metric.
+
+    Coverage changes update a user's scores as they happen. A full rebuild
+    replaces the rankings, except for users rescored while it ran, whose
+    newer scores are kept, and users it deferred, who keep their old scores
+    and are rescored later.
+    """
+
+    def __init__(self):
+        self.rankings: Dict[str, Ranking] = {metric: Ranking() for metric in METRICS}
+        # Written to while their coverage wasn't loaded, so their scores may be behind
+        self.stale: Set[str] = set()
+        self.rebuilt_at: Optional[float] = None
+        self.rebuilds = 0
+        self.deferred = 0
+        self._rescored_during_rebuild: Optional[Set[str]] = None
+
+    def update(self, user_uuid: str, coverage: Optional[UserCoverage]) -> None:
+        """Coverage listener: rescore a user, or remember to when their coverage isn't loaded."""
+        if coverage is None:
+            self.stale.add(user_uuid)
+            return
+        self.stale.discard(user_uuid)
+        for metric, score in zip(METRICS, scores_for(coverage)):
+            self.rankings[metric].set(user_uuid, score)
+        if self._rescored_during_rebuild is not None:
+            self._rescored_during_rebuild.add(user_uuid)
+
+    def begin_rebuild(self) -> Set[str]:
+        """Start a rebuild; returns the stale users it will cover, to restore if it fails."""
+        self._rescored_during_rebuild = set()
+        covered, self.stale = self.stale, set()
+        return covered
+
+    def abort_rebuild(self, stale: Set[str]) -> None:
+        self._rescored_during_rebuild = None
+        self.stale |= stale
+
+    def finish_rebuild(self, scores: Dict[str, Tuple[int, int]], deferred: Iterable[str] = ()) -> None:
+        """Replace the rankings with ``scores``; ``deferred`` users couldn't be scored and are left as they were."""
+        rescored = self._rescored_during_rebuild or set()
+        rankings = {metric: Ranking(self.rankings[metric].capacity) for metric in METRICS}
+        for user_uuid, user_scores in scores.items():
+            if user_uuid not in rescored:
+                for metric, score in zip(METRICS, user_scores):
+                    rankings[metric].set(user_uuid, score)
+        deferred = set(deferred) - rescored
+        for user_uuid in rescored | deferred:
+            for metric in METRICS:
+                score = self.rankings[metric].scores.get(user_uuid)
+                if score is not None:
+                    rankings[metric].set(user_uuid, score)
+        self.rankings = rankings
+        self.stale |= deferred
+        self.deferred = len(deferred)
+        self._rescored_during_rebuild = None
+        self.rebuilt_at = time.time()
+        self.rebuilds += 1
+
+    def top(self, metric: str, n: int) -> List[Tuple[int, str, int]]:
+        return self.rankings[metric].top(n)
+
+    def rank(self, metric: str, user_uuid: str) -> Optional[Tuple[int, int]]:
+        """(rank, score) of a user, or None if they aren't ranked."""
+        ranking = self.rankings[metric]
+        rank = ranking.rank(user_uuid)
+        return None if rank is None else (rank, ranking.scores[user_uuid])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.rankings[METRICS[0]]),
+            "stale_users": len(self.stale),
+            "rebuilds": self.rebuilds,
+            "deferred_by_last_rebuild": self.deferred,
+            "rebuilt_at": self.rebuilt_at,
+        }
+
+
+class LeaderboardRefresher:
+    """Runs full leaderboard rebuilds every ``rebuild_interval`` seconds and rescores stale users in between.
+
+    ``rebuild`` returns every user's scores and the users it had to defer;
+    ``rescore`` reloads a batch of users' coverage and returns the ones that
+    failed. A failed rebuild, or a user that failed to rescore, is retried
+    after ``catchup_interval`` seconds, doubling with each further failure up
+    to ``rebuild_interval``. Stale users keep being rescored meanwhile.
+    """
+
+    def __init__(
+        self,
+        leaderboard: Leaderboard,
+        rebuild: Callable[[], Awaitable[Tuple[Dict[str, Tuple[int, int]], Set[str]]]],
+        rescore: Callable[[List[str]], Awaitable[Set[str]]],
+        rebuild_interval: float,
+        catchup_interval: float,
+        catchup_batch: int,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        self.leaderboard = leaderboard
+        self.rebuild = rebuild
+        self.rescore = rescore
+        self.rebuild_interval = rebuild_interval
+        self.catchup_interval = catchup_interval
+        self.catchup_batch = catchup_batch
+        self.timer = timer
+        self.last_rebuild: Optional[float] = None
+        self.failures = 0
+        self.retry_at: Optional[float] = None
+        # Stale users that failed to rescore -> (failures in a row, when to try them again)
+        self.backoff: Dict[str, Tuple[int, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _delay(self, failures: int) -> float:
+        return min(self.catchup_interval * 2 ** failures, self.rebuild_interval)
+
+    def _rebuild_due(self) -> bool:
+        now = self.timer()
+        if self.retry_at is not None:
+            return now >= self.retry_at
+        return self.last_rebuild is None or now - self.last_rebuild >= self.rebuild_interval
+
+    async def run_once(self) -> None:
+        if self._rebuild_due():
+            stale = self.leaderboard.begin_rebuild()
+            try:
+                scores, deferred = await self.rebuild()
+            except Exception:
+                self.leaderboard.abort_rebuild(stale)
+                self.failures += 1
+                self.retry_at = self.timer() + self._delay(self.failures)
+                raise
+            self.leaderboard.finish_rebuild(scores, deferred)
+            if deferred:
+                logger.warning(f"Leaderboard rebuild deferred {len(deferred)} users whose routes failed to load")
+            self.last_rebuild = self.timer()
+            self.failures = 0
+            self.retry_at = None
+            return
+
+        stale = self.leaderboard.stale
+        # Users rescored since (by a write or a rebuild) start afresh next time they go stale
+        for user_uuid in [user_uuid for user_uuid in self.backoff if user_uuid not in stale]:
+            del self.backoff[user_uuid]
+        now = self.timer()
+        batch = list(islice(
+            (user_uuid for user_uuid in stale if self.backoff.get(user_uuid, (0, now))[1] <= now), self.catchup_batch
+        ))
+        if not batch:
+            return
+        failed = await self.rescore(batch)
+        for user_uuid in batch:
+            if user_uuid in failed:
+                failures = self.backoff.get(user_uuid, (0, now))[0] + 1
+                self.backoff[user_uuid] = (failures, self.timer() + self._delay(failures))
+            else:
+                self.backoff.pop(user_uuid, None)
+        if failed:
+            logger.error(f"Failed to rescore {len(failed)} leaderboard users")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.catchup_interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Leaderboard refresh failed: {e}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,266 @@
+import os
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from db import bus_routes
+from auth.tokens import Identity, get_identity, resolve_user
+from stats.coverage import JourneySpan, UserCoverage, coverage_engine, span_mask
+from stats.leaderboard import (
+    LEADERBOARD_CATCHUP_BATCH, LEADERBOARD_CATCHUP_INTERVAL, LEADERBOARD_ENABLED, LEADERBOARD_PAGE_SIZE,
+    LEADERBOARD_REBUILD_INTERVAL, LEADERBOARD_TFL_CONCURRENCY, LEADERBOARD_TFL_RATE, METRICS,
+    LeaderboardRefresher, leaderboard
+)
+from tflApi.limiter import UpstreamGovernor
+from tflApi.route_index import DIRECTIONS
+from tflApi.tflapi import journey_span, load_failed, place_journey, require_supabase, scan_route_index
+
+# How many routes the summary lists as the user's most taken, by default and at most
+STATS_TOP_ROUTES = int(os.getenv("STATS_TOP_ROUTES", "5"))
+STATS_MAX_TOP_ROUTES = int(os.getenv("STATS_MAX_TOP_ROUTES", "50"))
+# Leaderboard length, by default and at most
+LEADERBOARD_TOP = int(os.getenv("LEADERBOARD_TOP", "10"))
+LEADERBOARD_MAX_TOP = int(os.getenv("LEADERBOARD_MAX_TOP", "100"))
+# Keys the opaque ids leaders are listed under; set it to keep ids the same across workers and restarts
+LEADERBOARD_ID_KEY = (os.getenv("LEADERBOARD_ID_KEY") or os.urandom(32).hex()).encode()
+
+# What's needed to place a journey on its route
+JOURNEY_COLUMNS = "id,bus_route,started_stop,ended_stop,user_uuid"
+
+refresher: Optional[LeaderboardRefresher] = None
+
+
+async def get_user_coverage(user_uuid: str) -> UserCoverage:
+    supabase = require_supabase()
+
+    async def load():
+        return (await bus_routes.select_for_user(supabase, user_uuid, JOURNEY_COLUMNS)).data
+
+    return await coverage_engine.get(user_uuid, load, journey_span)
+
+
+def background_governor() -> UpstreamGovernor:
+    """TfL budget for one rebuild or catch-up batch, on top of the limits shared with user requests."""
+    return UpstreamGovernor(
+        rate=LEADERBOARD_TFL_RATE,
+        burst=LEADERBOARD_TFL_CONCURRENCY,
+        max_in_flight=LEADERBOARD_TFL_CONCURRENCY,
+        # Only load_routes' workers queue, so a slot is never more than one round of tokens away
+        max_wait=LEADERBOARD_TFL_CONCURRENCY / LEADERBOARD_TFL_RATE + 1,
+    )
+
+
+async def load_routes(route_ids: Iterable[str], loaded: Dict[str, Dict[str, Any]], governor: UpstreamGovernor) -> None:
+    """Load both directions of each route not yet in ``loaded`` ({route: {direction: index or load error}})."""
+    pending = iter([(route_id, direction) for route_id in set(route_ids) - loaded.keys() for direction in DIRECTIONS])
+
+    async def worker():
+        for route_id, direction in pending:
+            try:
+                index = await scan_route_index(route_id, direction, governor.slot)
+            except Exception as e:
+                index = e
+            loaded.setdefault(route_id, {})[direction] = index
+
+    await asyncio.gather(*(worker() for _ in range(LEADERBOARD_TFL_CONCURRENCY)))
+
+
+async def rescore(user_uuids: List[str]) -> Set[str]:
+    """Rescore stale users from their coverage and return the ones that failed.
+
+    Like a rebuild, the batch loads each of its routes once through the
+    background budget, without counting as demand or filling the shared cache.
+    Users are loaded one at a time so later ones reuse the routes already loaded.
+    """
+    supabase = require_supabase()
+    governor = background_governor()
+    loaded: Dict[str, Dict[str, Any]] = {}
+
+    async def span(row: dict) -> Optional[JourneySpan]:
+        return place_journey(row, loaded[str(row["bus_route"]).lower()])
+
+    failed = set()
+    for user_uuid in user_uuids:
+        async def load(user_uuid=user_uuid):
+            rows = (await bus_routes.select_for_user(supabase, user_uuid, JOURNEY_COLUMNS)).data
+            await load_routes((str(row["bus_route"]).lower() for row in rows), loaded, governor)
+            return rows
+
+        try:
+            leaderboard.update(user_uuid, await coverage_engine.get(user_uuid, load, span))
+        except Exception:
+            failed.add(user_uuid)
+    return failed
+
+
+async def score_all_users() -> Tuple[Dict[str, Tuple[int, int]], Set[str]]:
+    """Every user's leaderboard scores from a scan of bus_routes_taken, and the users it had to defer.
+
+    Each distinct route is loaded once per rebuild, under its own small rate
+    and concurrency budget. Users with a journey on a route that failed to
+    load are deferred rather than scored from part of their history. Only the
+    union bitset of each (user, route, direction) is kept while scanning, not
+    the journeys themselves.
+    """
+    supabase = require_supabase()
+    governor = background_governor()
+    loaded: Dict[str, Dict[str, Any]] = {}
+    bits: Dict[Tuple[str, str, str], int] = {}
+    segments: Dict[Tuple[str, str, str], int] = {}
+    users = set()
+    deferred = set()
+    after_id = None
+    while True:
+        rows = (await bus_routes.select_all_page(supabase, JOURNEY_COLUMNS, LEADERBOARD_PAGE_SIZE, after_id)).data
+        rows_with_users = [row for row in rows if row.get("user_uuid")]
+        await load_routes((str(row["bus_route"]).lower() for row in rows_with_users), loaded, governor)
+        for row in rows_with_users:
+            user_uuid, route_id = row["user_uuid"], str(row["bus_route"]).lower()
+            users.add(user_uuid)
+            try:
+                span = place_journey(row, loaded[route_id])
+            except Exception:
+                deferred.add(user_uuid)
+                continue
+            if span is None:
+                continue
+            key = (user_uuid, route_id, span.direction.lower())
+            bits[key] = bits.get(key, 0) | span_mask(span.start, span.end)
+            segments[key] = max(span.stops - 1, 0)
+        if len(rows) < LEADERBOARD_PAGE_SIZE:
+            break
+        after_id = rows[-1]["id"]
+
+    lookups = [index for directions in loaded.values() for index in directions.values()]
+    if lookups and all(isinstance(index, Exception) and load_failed(index) for index in lookups):
+        # Nothing could be loaded (e.g. TfL is down): fail so the refresher backs off instead of deferring everyone
+        raise lookups[0]
+
+    scores = {user_uuid: (0, 0) for user_uuid in users - deferred}
+    for key, route_bits in bits.items():
+        if key[0] in deferred:
+            continue
+        completed, covered = scores[key[0]]
+        travelled = route_bits.bit_count()
+        scores[key[0]] = (completed + (0 < segments[key] == travelled), covered + travelled)
+    return scores, deferred
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global refresher
+    if LEADERBOARD_ENABLED:
+        refresher = LeaderboardRefresher(
+            leaderboard,
+            score_all_users,
+            rescore,
+            rebuild_interval=LEADERBOARD_REBUILD_INTERVAL,
+            catchup_interval=LEADERBOARD_CATCHUP_INTERVAL,
+            catchup_batch=LEADERBOARD_CATCHUP_BATCH,
+        )
+        refresher.start()
+    try:
+        yield
+    finally:
+        if refresher is not None:
+            await refresher.stop()
+            refresher = None
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Coverage changes from journey writes rescore users on the leaderboard as they happen
+coverage_engine.listeners.append(leaderboard.update)
+
+
+@app.get('/coverage')
+async def get_coverage(
+    user_uuid: Optional[str] = None,
+    route_id: Optional[str] = None,
+    identity: Optional[Identity] = Depends(get_identity)
+):
+    """How much of each route direction the user has travelled, counting overlapping journeys once."""
+    user_uuid = resolve_user(identity, user_uuid)
+    coverage = await get_user_coverage(user_uuid)
+
+    routes = []
+    for (route, direction), route_coverage in sorted(coverage.routes.items()):
+        if route_id is not None and route != route_id.lower():
+            continue
+        routes.append({
+            "route_id": route,
+            "direction": direction,
+            "percentage": route_coverage.percentage,
+            "segments_travelled": route_coverage.covered,
+            "segments": route_coverage.segments,
+            "complete": route_coverage.complete,
+            "journeys": len(route_coverage.journeys),
+        })
+    return {"routes": routes, "unplaced_journeys": len(coverage.unplaced)}
+
+
+@app.get('/summary')
+async def get_summary(
+    user_uuid: Optional[str] = None,
+    top: int = Query(STATS_TOP_ROUTES, ge=0),
+    identity: Optional[Identity] = Depends(get_identity)
+):
+    """A user's totals, read from the running totals kept with their coverage."""
+    user_uuid = resolve_user(identity, user_uuid)
+    coverage = await get_user_coverage(user_uuid)
+
+    top_routes = []
+    for route_id in coverage.top_routes(min(top, STATS_MAX_TOP_ROUTES)):
+        directions = [coverage.route(route_id, direction) for direction in DIRECTIONS]
+        top_routes.append({
+            "route_id": route_id,
+            "journeys": coverage.route_journeys[route_id],
+            "stops_travelled": coverage.route_stops[route_id],
+            # The better-covered direction
+            "percentage": max(route.percentage for route in directions if route is not None),
+        })
+    return {
+        "journeys": len(coverage.journeys) + len(coverage.unplaced),
+        "distinct_routes": len(coverage.route_journeys),
+        "stops_travelled": coverage.stops_travelled,
+        "completed_routes": coverage.completed,
+        "top_routes": top_routes,
+    }
+
+
+def leader_id(user_uuid: str) -> str:
+    """Opaque id a leader is listed under. user_uuid still identifies anonymous callers, so it's never shown."""
+    return hashlib.blake2b(user_uuid.encode(), key=LEADERBOARD_ID_KEY[:64], digest_size=8).hexdigest()
+
+
+@app.get('/leaderboard')
+async def get_leaderboard(
+    metric: str = METRICS[0],
+    top: int = Query(LEADERBOARD_TOP, ge=1),
+    identity: Optional[Identity] = Depends(get_identity)
+):
+    """The top users for a metric and, for a caller with a verified token, their own rank."""
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric, expected one of: {', '.join(METRICS)}")
+
+    caller = identity.user_id if identity is not None else None
+    result = {
+        "metric": metric,
+        "users_ranked": len(leaderboard.rankings[metric]),
+        "rebuilt_at": leaderboard.rebuilt_at,
+        "leaders": [
+            {"rank": rank, "id": leader_id(leader), "score": score, "is_me": leader == caller}
+            for rank, leader, score in leaderboard.top(metric, min(top, LEADERBOARD_MAX_TOP))
+        ],
+    }
+    if caller is not None:
+        mine = leaderboard.rank(metric, caller)
+        result["me"] = None if mine is None else {"rank": mine[0], "score": mine[1]}
+    return result
+
+
+@app.get('/cache/stats')
+async def cache_stats():
+    return {"coverage": coverage_engine.stats(), "leaderboard": leaderboard.stats()}
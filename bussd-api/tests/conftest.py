@@ -3,6 +3,8 @@ from fastapi.testclient import TestClient
 from main import app
 import os
 from unittest.mock import MagicMock, patch
+from dashboard.route_cache import route_cache
+from stats.coverage import coverage_engine
 
 @pytest.fixture(autouse=True)
 def mock_env_vars(monkeypatch):
@@ -10,6 +12,15 @@ def mock_env_vars(monkeypatch):
     monkeypatch.setenv("SUPABASE_URL", "https://test-url.supabase.co")
     monkeypatch.setenv("SUPABASE_ANON_KEY", "test-key")
 
+@pytest.fixture(autouse=True)
+def clear_route_cache():
+    """Dashboard route lists and route coverage are cached per process, so each test starts empty"""
+    route_cache.clear()
+    coverage_engine.invalidate()
+    yield
+    route_cache.clear()
+    coverage_engine.invalidate()
+
 @pytest.fixture
 def mock_supabase():
     """Mock Supabase client"""
@@ -30,8 +41,8 @@ def mock_supabase():
     mock_select.execute.return_value = mock_execute
     mock_client.table.return_value = mock_table
     
-    with patch('main.create_client', return_value=mock_client), \
-         patch('main.supabase', mock_client):
+    with patch('db.client.get_supabase', return_value=mock_client), \
+         patch('db.client.get_auth_client', return_value=mock_client):
         yield mock_client
 
 @pytest.fixture
@@ -50,10 +61,8 @@ def test_client_no_supabase(monkeypatch):
     monkeypatch.delenv("SUPABASE_ANON_KEY", raising=False)
     
     # Mock Supabase client as None
-    with patch('main.supabase', None), \
-         patch('main.create_client', return_value=None), \
-         patch('main.SUPABASE_URL', None), \
-         patch('main.SUPABASE_KEY', None), \
+    with patch('db.client.get_supabase', return_value=None), \
+         patch('db.client.get_auth_client', return_value=None), \
          TestClient(app) as client:
         yield client
     
@@ -0,0 +1,25 @@
+from fastapi.testclient import TestClient
+from benchmarks import fake_postgrest
+from benchmarks.loadtest import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+def test_fake_postgrest_round_trip():
+    client = TestClient(fake_postgrest.app)
+    client.post("/_reset")
+    created = client.post("/rest/v1/bus_routes_taken", json=[{"user_uuid": "u1"}, {"user_uuid": "u2"}, {"user_uuid": "u1"}])
+    assert [row["id"] for row in created.json()] == [1, 2, 3]
+
+    page = client.get("/rest/v1/bus_routes_taken", params={"select": "id,user_uuid", "user_uuid": "eq.u1", "id": "gt.1", "order": "id", "limit": "5"})
+    assert page.json() == [{"id": 3, "user_uuid": "u1"}]
+
+    updated = client.patch("/rest/v1/bus_routes_taken", params={"id": "eq.3"}, json={"user_uuid": "u3"})
+    assert updated.json()[0]["user_uuid"] == "u3"
+    assert client.delete("/rest/v1/bus_routes_taken", params={"id": "eq.1"}).json()[0]["id"] == 1
+    assert len(client.get("/rest/v1/bus_routes_taken").json()) == 2
@@ -0,0 +1,189 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+from main import app
+from cache.ttl_cache import TTLCache
+from tflApi import tflapi
+from tflApi.resilience import CircuitBreaker
+from stats.coverage import CoverageEngine, JourneySpan, RouteCoverage, UserCoverage, coverage_engine
+
+# Route 88 outbound: stops a..e, so four segments
+STOPS = [{"id": stop_id, "name": f"Stop {stop_id.upper()}"} for stop_id in "abcde"]
+
+
+def test_overlapping_journeys_count_once():
+    route = RouteCoverage(stops=5)
+    route.add(1, 0, 2)
+    route.add(2, 1, 3)
+    assert (route.covered, route.percentage, route.complete) == (3, 75, False)
+
+    route.add(3, 4, 2)
+    assert (route.percentage, route.complete) == (100, True)
+
+    route.remove(2)
+    assert route.covered == 4
+    route.remove(3)
+    assert (route.covered, route.percentage) == (2, 50)
+
+
+def test_edited_journey_replaces_its_old_span():
+    coverage = UserCoverage()
+    coverage.add(1, JourneySpan("88", "outbound", 0, 4, 5))
+    coverage.add(1, JourneySpan("88", "outbound", 0, 1, 5))
+    assert coverage.route("88", "outbound").percentage == 25
+
+    coverage.add(1, JourneySpan("25", "inbound", 0, 1, 10))
+    assert coverage.route("88", "outbound") is None
+    # A different stop count means the stored spans were computed against another sequence
+    assert not coverage.add(2, JourneySpan("25", "inbound", 0, 1, 11))
+
+
+@pytest.fixture
+def client():
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, json={"stopPointSequences": [{"stopPoint": STOPS}]})
+    )
+    mock_supabase = MagicMock()
+    with patch("tflApi.tflapi.create_http_client", side_effect=lambda: httpx.AsyncClient(transport=transport)), \
+         patch("tflApi.tflapi.sequence_cache", TTLCache(maxsize=10, ttl=60)), \
+         patch("db.client.get_supabase", return_value=mock_supabase), \
+         TestClient(app) as client:
+        client.supabase = mock_supabase
+        yield client
+
+
+def test_coverage_is_loaded_once_and_kept_up_to_date(client):
+    user = {"user_uuid": "user-abc"}
+    load = client.supabase.table().select().eq().execute
+    load.return_value = MagicMock(data=[
+        {"id": 1, "bus_route": "88", "started_stop": "a", "ended_stop": "c", **user},
+        {"id": 2, "bus_route": "88", "started_stop": "b", "ended_stop": "c", **user},
+        {"id": 3, "bus_route": "88", "started_stop": "a", "ended_stop": "nowhere", **user},
+    ])
+
+    response = client.get("/api/stats/coverage", params={"user_uuid": "user-abc"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "routes": [{"route_id": "88", "direction": "outbound", "percentage": 50, "segments_travelled": 2,
+                    "segments": 4, "complete": False, "journeys": 2}],
+        "unplaced_journeys": 1,
+    }
+
+    client.supabase.table().insert().execute.return_value = MagicMock(
+        data=[{"id": 4, "bus_route": "88", "started_stop": "b", "ended_stop": "e", **user}]
+    )
+    client.post("/api/tfl/record-journey", json={
+        "route_id": "88", "from_stop_id": "b", "to_stop_id": "e", "user_uuid": "user-abc", "user_email": "a@example.com",
+    })
+    client.supabase.table().delete().eq().execute.return_value = MagicMock(data=[{"id": 1, **user}])
+    client.delete("/api/tfl/delete-bus-route/1")
+
+    routes = client.get("/api/stats/coverage", params={"user_uuid": "user-abc", "route_id": "88"}).json()["routes"]
+    assert [(route["percentage"], route["journeys"]) for route in routes] == [(75, 2)]
+    load.assert_called_once()
+
+
+def test_coverage_is_not_cached_while_a_direction_fails_to_load(client):
+    def inbound_down(request):
+        if request.url.path.endswith("/inbound"):
+            return httpx.Response(502, text="Bad gateway")
+        return httpx.Response(200, json={"stopPointSequences": [{"stopPoint": STOPS}]})
+
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(inbound_down))
+    client.supabase.table().select().eq().execute.return_value = MagicMock(data=[
+        {"id": 1, "bus_route": "88", "started_stop": "a", "ended_stop": "c", "user_uuid": "user-abc"},
+        # Not outbound, so it may be on the inbound sequence that didn't load
+        {"id": 2, "bus_route": "88", "started_stop": "w", "ended_stop": "z", "user_uuid": "user-abc"},
+    ])
+    with patch("tflApi.tflapi.last_known_good", TTLCache(maxsize=10, ttl=3600)), \
+         patch("tflApi.tflapi.circuit_breaker", CircuitBreaker(failure_threshold=5, reset_timeout=30)), \
+         patch("tflApi.tflapi.TFL_RETRY_BASE_DELAY", 0):
+        response = client.get("/api/stats/coverage", params={"user_uuid": "user-abc"})
+
+    assert response.status_code == 502
+    assert coverage_engine.cache.get("user-abc") is None
+
+
+def test_running_totals_follow_adds_edits_and_deletes():
+    coverage = UserCoverage()
+    coverage.add(1, JourneySpan("88", "outbound", 0, 4, 5))
+    coverage.add(2, JourneySpan("88", "inbound", 1, 2, 5))
+    coverage.add(3, JourneySpan("25", "outbound", 0, 3, 10))
+    coverage.add(4, None)
+    assert (coverage.stops_travelled, coverage.completed, len(coverage.unplaced)) == (8, 1, 1)
+    assert coverage.top_routes(1) == ["88"]
+
+    coverage.add(1, JourneySpan("88", "outbound", 0, 2, 5))
+    coverage.remove(2)
+    coverage.remove(4)
+    assert (coverage.stops_travelled, coverage.completed, len(coverage.unplaced)) == (5, 0, 0)
+    assert coverage.top_routes(5) == ["25", "88"]
+    assert coverage.route_journeys == {"88": 1, "25": 1}
+
+
+def test_summary(client):
+    client.supabase.table().select().eq().execute.return_value = MagicMock(data=[
+        {"id": 1, "bus_route": "88", "started_stop": "a", "ended_stop": "e", "user_uuid": "user-abc"},
+        {"id": 2, "bus_route": "88", "started_stop": "b", "ended_stop": "c", "user_uuid": "user-abc"},
+        {"id": 3, "bus_route": "25", "started_stop": "a", "ended_stop": "b", "user_uuid": "user-abc"},
+        {"id": 4, "bus_route": "25", "started_stop": "a", "ended_stop": "nowhere", "user_uuid": "user-abc"},
+    ])
+
+    response = client.get("/api/stats/summary", params={"user_uuid": "user-abc", "top": 1})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "journeys": 4,
+        "distinct_routes": 2,
+        "stops_travelled": 6,
+        "completed_routes": 1,
+        "top_routes": [{"route_id": "88", "journeys": 2, "stops_travelled": 5, "percentage": 100}],
+    }
+
+
+@pytest.mark.asyncio
+async def test_only_writes_to_the_loading_user_stop_it_being_cached():
+    engine = CoverageEngine(maxsize=10, ttl=60, max_age=300)
+
+    async def place(row):
+        return JourneySpan("88", "outbound", 0, 1, 5)
+
+    async def load_while_another_user_writes():
+        engine.deleted("other-user", [{"id": 9, "user_uuid": "other-user"}])
+        return [{"id": 1, "user_uuid": "user-abc"}]
+
+    async def load_while_the_same_user_writes():
+        engine.deleted("user-abc", [{"id": 2, "user_uuid": "user-abc"}])
+        return [{"id": 1, "user_uuid": "user-abc"}]
+
+    await engine.get("user-abc", load_while_another_user_writes, place)
+    assert "user-abc" in engine.cache
+
+    engine.invalidate()
+    await engine.get("user-abc", load_while_the_same_user_writes, place)
+    assert "user-abc" not in engine.cache
+
+
+@pytest.mark.asyncio
+async def test_writes_restart_the_coverage_expiry_up_to_its_max_age():
+    now = [0.0]
+    engine = CoverageEngine(maxsize=10, ttl=60, max_age=150)
+    engine.cache = TTLCache(maxsize=10, ttl=60, timer=lambda: now[0])
+
+    async def place(row):
+        return JourneySpan("88", "outbound", 0, 1, 5)
+
+    async def load():
+        return [{"id": 1, "user_uuid": "user-abc"}]
+
+    await engine.get("user-abc", load, place)
+    now[0] = 50
+    await engine.saved("user-abc", [{"id": 2, "user_uuid": "user-abc"}], place)
+    now[0] = 100
+    assert "user-abc" in engine.cache
+
+    # Renewing now would keep it past 150s from the load, so it expires on its current schedule
+    await engine.saved("user-abc", [{"id": 3, "user_uuid": "user-abc"}], place)
+    now[0] = 111
+    assert "user-abc" not in engine.cache
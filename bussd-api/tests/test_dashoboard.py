@@ -2,11 +2,12 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, patch
 from main import app
+from dashboard.route_cache import CACHED_COLUMNS, UserRouteCache, route_cache
 import os
 
 @pytest.fixture
 def mock_supabase():
-    with patch('dashboard.dashboard.create_client') as mock:
+    with patch('db.client.get_supabase') as mock:
         yield mock.return_value
 
 @pytest.fixture
@@ -27,8 +28,14 @@ def test_get_routes_success(test_client, mock_supabase):
     mock_execute = MagicMock()
     mock_execute.data = mock_data
     
+    mock_limit = MagicMock()
+    mock_limit.execute.return_value = mock_execute
+
+    mock_order = MagicMock()
+    mock_order.limit.return_value = mock_limit
+
     mock_eq = MagicMock()
-    mock_eq.execute.return_value = mock_execute
+    mock_eq.order.return_value = mock_order
     
     mock_select = MagicMock()
     mock_select.eq.return_value = mock_eq
@@ -36,43 +43,124 @@ def test_get_routes_success(test_client, mock_supabase):
     mock_from = MagicMock()
     mock_from.select.return_value = mock_select
     
-    mock_supabase.from_.return_value = mock_from
+    mock_supabase.table.return_value = mock_from
 
     # Make request
     response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid")
     
     # Assert response
     assert response.status_code == 200
-    assert response.json() == {"routes": mock_data}
+    # Only the default columns are returned
+    expected = [{"id": 1, "bus_route": "123", "percentage_travelled": 75}]
+    assert response.json() == {"routes": expected, "next_cursor": None}
     
-    # Verify Supabase query chain
-    mock_supabase.from_.assert_called_once_with('bus_routes_taken')
-    mock_from.select.assert_called_once_with('*')
+    # Verify Supabase query chain: the user's whole list is loaded once into the cache
+    mock_supabase.table.assert_called_once_with('bus_routes_taken')
+    mock_from.select.assert_called_once_with(CACHED_COLUMNS)
     mock_select.eq.assert_called_once_with('user_uuid', 'test-uuid')
-    mock_eq.execute.assert_called_once()
+    mock_eq.order.assert_called_once_with('id')
+    mock_order.limit.assert_called_once_with(route_cache.max_rows + 1)
+    mock_limit.execute.assert_called_once()
+
+    # Repeat loads are served from the cache
+    assert test_client.get("/api/dashboard/routes?user_uuid=test-uuid").json()["routes"] == expected
+    mock_limit.execute.assert_called_once()
 
 def test_get_routes_no_user_uuid(test_client):
     response = test_client.get("/api/dashboard/routes")
-    assert response.status_code == 422 
+    # Without an access token the caller has to say who they are
+    assert response.status_code == 401
 
 def test_get_routes_empty_result(test_client, mock_supabase):
     mock_execute = MagicMock()
     mock_execute.data = []
     
-    mock_eq = MagicMock()
-    mock_eq.execute.return_value = mock_execute
-    
-    mock_select = MagicMock()
-    mock_select.eq.return_value = mock_eq
-    
-    mock_from = MagicMock()
-    mock_from.select.return_value = mock_select
-    
-    mock_supabase.from_.return_value = mock_from
+    mock_supabase.table().select().eq().order().limit().execute.return_value = mock_execute
 
     response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid")
     assert response.status_code == 200
-    assert response.json() == {"routes": []}
+    assert response.json() == {"routes": [], "next_cursor": None}
+
+def test_get_routes_next_page(test_client, mock_supabase):
+    mock_execute = MagicMock()
+    mock_execute.data = [{"id": 1}, {"id": 3}, {"id": 4}, {"id": 7}, {"id": 9}]
+    mock_supabase.table().select().eq().order().limit().execute.return_value = mock_execute
+
+    response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid&cursor=3&limit=2")
+
+    assert response.status_code == 200
+    assert response.json() == {"routes": [{"id": 4}, {"id": 7}], "next_cursor": 7}
+    response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid&cursor=7&limit=2")
+    assert response.json() == {"routes": [{"id": 9}], "next_cursor": None}
+
+def test_get_routes_large_lists_are_paged_from_the_database(test_client, mock_supabase):
+    mock_eq = mock_supabase.table().select().eq()
+    mock_eq.order().limit().execute.return_value = MagicMock(data=[{"id": i} for i in range(1, 5)])
+    mock_eq.gt().order().limit().execute.return_value = MagicMock(data=[{"id": 4}, {"id": 7}, {"id": 9}])
+
+    with patch.object(route_cache, "max_rows", 3):
+        response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid&cursor=3&limit=10000")
+
+        # Later pages go straight to the keyset query
+        test_client.get("/api/dashboard/routes?user_uuid=test-uuid&cursor=7")
+
+    assert response.json() == {"routes": [{"id": 4}, {"id": 7}, {"id": 9}], "next_cursor": None}
+    mock_eq.gt.assert_called_with('id', 7)
+    # The page size is capped
+    mock_eq.gt().order().limit.assert_any_call(201)
+    mock_eq.order().limit().execute.assert_called_once()
+
+def test_get_routes_fields_projection(test_client, mock_supabase):
+    mock_supabase.table().select().eq().order().limit().execute.return_value = MagicMock(data=[
+        {"id": 1, "bus_route": "73", "percentage_travelled": 40, "user_email": "a@example.com"}
+    ])
+
+    response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid&fields=bus_route,percentage_travelled")
+
+    assert response.status_code == 200
+    assert response.json()["routes"] == [{"id": 1, "bus_route": "73", "percentage_travelled": 40}]
+
+def test_get_routes_after_writes(test_client, mock_supabase):
+    user = {"user_uuid": "test-uuid"}
+    mock_load = mock_supabase.table().select().eq().order().limit().execute
+    mock_load.return_value = MagicMock(data=[{"id": 1, "bus_route": "73", **user}, {"id": 2, "bus_route": "25", **user}])
+    assert len(test_client.get("/api/dashboard/routes?user_uuid=test-uuid").json()["routes"]) == 2
+
+    mock_supabase.table().insert().execute.return_value = MagicMock(data=[{"id": 5, "bus_route": "8", **user}])
+    test_client.post("/api/tfl/add-bus-route", params={
+        "bus_route": "8", "percentage": 50, "started_stop": "A", "ended_stop": "B",
+        "user_email": "a@example.com", "user_uuid": "test-uuid"
+    })
+    mock_supabase.table().update().eq().eq().execute.return_value = MagicMock(
+        data=[{"id": 1, "bus_route": "73", "percentage_travelled": "90", "updated_at": "2025-06-01T10:05:00+00:00", **user}]
+    )
+    test_client.post("/api/tfl/update-bus-route/1", json={
+        "user_email": "a@example.com", "bus_route": "73", "percentage_travelled": "90", "user_uuid": "test-uuid"
+    })
+    mock_supabase.table().delete().eq().execute.return_value = MagicMock(data=[{"id": 2, **user}])
+    test_client.delete("/api/tfl/delete-bus-route/2")
+
+    # updated_at is kept too, so an edit can send it back as expected_updated_at
+    response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid&fields=bus_route,percentage_travelled,updated_at")
+    assert response.json()["routes"] == [
+        {"id": 1, "bus_route": "73", "percentage_travelled": "90", "updated_at": "2025-06-01T10:05:00+00:00"},
+        {"id": 5, "bus_route": "8"},
+    ]
+    mock_load.assert_called_once()
+
+def test_get_routes_unreadable_write_drops_the_user(test_client, mock_supabase):
+    mock_load = mock_supabase.table().select().eq().order().limit().execute
+    mock_load.return_value = MagicMock(data=[{"id": 1, "user_uuid": "test-uuid"}])
+    test_client.get("/api/dashboard/routes?user_uuid=test-uuid")
+
+    route_cache.inserted("test-uuid", None)
+    test_client.get("/api/dashboard/routes?user_uuid=test-uuid")
+
+    assert mock_load.call_count == 2
+
+def test_get_routes_unknown_field(test_client, mock_supabase):
+    response = test_client.get("/api/dashboard/routes?user_uuid=test-uuid&fields=bus_route,password")
+    assert response.status_code == 400
 
 def test_get_route_by_id_success(test_client, mock_supabase):
     # Mock data
@@ -94,13 +182,31 @@ def test_get_route_by_id_success(test_client, mock_supabase):
     mock_from = MagicMock()
     mock_from.select.return_value = mock_select
     
-    mock_supabase.from_.return_value = mock_from
+    mock_supabase.table.return_value = mock_from
 
     response = test_client.get("/api/dashboard/routes/123")
     assert response.status_code == 200
     assert response.json() == {"route": mock_data}
 
-    mock_supabase.from_.assert_called_once_with('bus_routes_taken')
+    mock_supabase.table.assert_called_once_with('bus_routes_taken')
     mock_from.select.assert_called_once_with('*')
     mock_select.eq.assert_called_once_with('id', '123')
-    mock_eq.execute.assert_called_once()
\ No newline at end of file
+    mock_eq.execute.assert_called_once()
+@pytest.mark.asyncio
+async def test_route_cache_only_skips_loads_written_to_while_loading():
+    cache = UserRouteCache(maxsize=10, ttl=60, max_rows=100)
+
+    async def load_while_another_user_writes(limit):
+        cache.inserted("other-user", [{"id": 9, "user_uuid": "other-user"}])
+        return [{"id": 1, "user_uuid": "test-uuid"}]
+
+    async def load_while_the_same_user_writes(limit):
+        cache.inserted("test-uuid", [{"id": 2, "user_uuid": "test-uuid"}])
+        return [{"id": 1, "user_uuid": "test-uuid"}]
+
+    await cache.get("test-uuid", load_while_another_user_writes)
+    assert "test-uuid" in cache.cache
+
+    cache.clear()
+    await cache.get("test-uuid", load_while_the_same_user_writes)
+    assert "test-uuid" not in cache.cache
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import pytest
+from httpx import AsyncClient
+from unittest.mock import MagicMock, patch
+from main import app
+from db import bus_routes
+from db import client as db_client
+from db.executor import run_sync
+from cache.ttl_cache import TTLCache
+
+DB_LATENCY = 0.3
+
+
+def slow_execute(data):
+    def execute():
+        time.sleep(DB_LATENCY)
+        return MagicMock(data=data)
+    return execute
+
+
+@pytest.mark.asyncio
+async def test_run_sync_returns_result():
+    assert await run_sync(sum, [1, 2, 3]) == 6
+
+
+@pytest.mark.asyncio
+async def test_queries_run_concurrently():
+    mock_client = MagicMock()
+    mock_client.table.return_value.insert.return_value.execute.side_effect = slow_execute([{"id": 1}])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(bus_routes.insert(mock_client, {"bus_route": "88"}) for _ in range(5)))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < DB_LATENCY * 3
+
+
+@pytest.mark.asyncio
+async def test_slow_database_does_not_block_tfl_requests():
+    mock_client = MagicMock()
+    mock_client.table.return_value.insert.return_value.execute.side_effect = slow_execute([{"id": 1}])
+    tfl_data = {"stopPointSequences": [{"stopPoint": [{"id": "a"}, {"id": "b"}]}]}
+    finished = {}
+
+    async def add_route(ac):
+        await ac.post("/api/tfl/add-bus-route", params={
+            "bus_route": "88",
+            "percentage": 80,
+            "user_uuid": "user-abc",
+            "started_stop": "a",
+            "ended_stop": "b",
+            "user_email": "test@example.com",
+        })
+        finished["db"] = time.perf_counter()
+
+    async def get_stops(ac):
+        await asyncio.sleep(0.05)
+        response = await ac.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound"})
+        assert response.status_code == 200
+        finished["tfl"] = time.perf_counter()
+
+    with patch("db.client.get_supabase", return_value=mock_client), \
+         patch("tflApi.tflapi.fetch_tfl", return_value=tfl_data), \
+         patch("tflApi.tflapi.sequence_cache", TTLCache(maxsize=10, ttl=60)):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            started = time.perf_counter()
+            await asyncio.gather(add_route(ac), get_stops(ac))
+
+    assert finished["tfl"] - started < DB_LATENCY / 2
+    assert finished["tfl"] < finished["db"]
+
+
+@pytest.fixture
+def fresh_clients(monkeypatch):
+    # The anon key has to look like a JWT for supabase-py to accept it
+    monkeypatch.setenv("SUPABASE_ANON_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.signature")
+    db_client.reset()
+    yield
+    db_client.reset()
+
+
+def test_supabase_client_is_shared(fresh_clients):
+    supabase = db_client.get_supabase()
+
+    assert supabase is not None
+    assert db_client.get_supabase() is supabase
+    assert db_client.get_auth_client() is not supabase
+
+
+def test_supabase_client_uses_configured_pool(fresh_clients):
+    pool = db_client.get_supabase().postgrest.session._transport._pool
+
+    assert pool._max_connections == db_client.SUPABASE_POOL_SIZE
+
+
+def test_supabase_client_missing_credentials(fresh_clients, monkeypatch):
+    monkeypatch.delenv("SUPABASE_URL")
+
+    assert db_client.get_supabase() is None
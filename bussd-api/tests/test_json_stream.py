@@ -0,0 +1,50 @@
+import json
+import pytest
+from tflApi.json_stream import MalformedJSON, iter_json_array
+
+
+async def read(body: bytes, chunk_size: int, max_item_size: int = 1000):
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    return [value async for value in iter_json_array(chunks(), max_item_size)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1000])
+async def test_values_split_across_chunks(chunk_size):
+    values = [{"route_id": "88", "stop": "é"}, 12345, "a, ]", [1, 2], None]
+    body = json.dumps(values, ensure_ascii=False).encode()
+    assert await read(b" \n" + body + b" ", chunk_size) == values
+
+
+@pytest.mark.asyncio
+async def test_empty_array():
+    assert await read(b"[ ]", 1) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body, yielded", [
+    (b'{"route_id": "88"}', []),
+    (b"[1, 2,]", [1, 2]),
+    (b"[1 2]", [1]),
+    (b"[1, {", [1]),
+    (b"[1] [2]", [1]),
+])
+async def test_malformed_bodies_fail_after_the_values_before_them(body, yielded):
+    values = []
+
+    async def chunks():
+        yield body
+
+    with pytest.raises(MalformedJSON):
+        async for value in iter_json_array(chunks(), 1000):
+            values.append(value)
+    assert values == yielded
+
+
+@pytest.mark.asyncio
+async def test_values_are_limited_in_size():
+    with pytest.raises(MalformedJSON):
+        await read(b'["' + b"x" * 100 + b'"]', 10, max_item_size=50)
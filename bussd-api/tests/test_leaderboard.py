@@ -0,0 +1,285 @@
+import random
+from contextlib import suppress
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+from main import app
+from auth.tokens import Identity, get_identity
+from cache.ttl_cache import TTLCache
+from stats import stats
+from stats.coverage import JourneySpan, UserCoverage
+from stats.leaderboard import METRICS, Leaderboard, LeaderboardRefresher, Ranking, leaderboard
+from tflApi import tflapi
+
+STOPS = [{"id": stop_id, "name": f"Stop {stop_id.upper()}"} for stop_id in "abcde"]
+
+
+def test_ranking_matches_a_sorted_list():
+    generator = random.Random(7)
+    ranking = Ranking(capacity=4)
+    scores = {}
+    for _ in range(500):
+        user = f"user-{generator.randrange(60)}"
+        if generator.random() < 0.1:
+            ranking.discard(user)
+            scores.pop(user, None)
+        else:
+            scores[user] = generator.randrange(40)
+            ranking.set(user, scores[user])
+
+    for user, score in scores.items():
+        assert ranking.rank(user) == 1 + sum(1 for other in scores.values() if other > score)
+    top = ranking.top(10)
+    assert [score for _, _, score in top] == sorted(scores.values(), reverse=True)[:10]
+    assert all(rank == ranking.rank(user) for rank, user, _ in top)
+    assert ranking.rank("nobody") is None
+
+
+def test_ties_share_a_rank_in_the_order_they_were_reached():
+    ranking = Ranking()
+    for user, score in [("a", 3), ("b", 5), ("c", 3), ("d", 1)]:
+        ranking.set(user, score)
+    assert ranking.top(3) == [(1, "b", 5), (2, "a", 3), (2, "c", 3)]
+    assert ranking.rank("d") == 4
+
+
+def test_rebuild_keeps_users_rescored_while_it_ran():
+    board = Leaderboard()
+    board.update("stale", None)
+    stale = board.begin_rebuild()
+    assert stale == {"stale"} and not board.stale
+
+    coverage = UserCoverage()
+    coverage.add(1, JourneySpan("88", "outbound", 0, 4, 5))
+    board.update("active", coverage)
+    board.finish_rebuild({"active": (0, 1), "stale": (2, 9), "other": (1, 3)})
+
+    assert board.rank("routes_completed", "stale") == (1, 2)
+    assert board.rank("routes_completed", "active") == (2, 1)
+    assert board.rank("stops_covered", "active") == (2, 4)
+    assert board.rebuilds == 1
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(leaderboard, "rankings", {metric: Ranking() for metric in METRICS})
+    monkeypatch.setattr(leaderboard, "stale", set())
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if "/Line/999/" in request.url.path or request.url.path.endswith("/Line/77/Route/Sequence/inbound"):
+            return httpx.Response(501, text="Not implemented")
+        return httpx.Response(200, json={"stopPointSequences": [{"stopPoint": STOPS}]})
+
+    transport = httpx.MockTransport(handler)
+    mock_supabase = MagicMock()
+    with patch("tflApi.tflapi.create_http_client", side_effect=lambda: httpx.AsyncClient(transport=transport)), \
+         patch("tflApi.tflapi.sequence_cache", TTLCache(maxsize=10, ttl=60)), \
+         patch("db.client.get_supabase", return_value=mock_supabase), \
+         patch("stats.stats.LEADERBOARD_PAGE_SIZE", 2), \
+         patch("stats.stats.LEADERBOARD_TFL_RATE", 1000), \
+         TestClient(app) as client:
+        client.supabase = mock_supabase
+        client.requests = requests
+        yield client
+    stats.app.dependency_overrides.clear()
+
+
+def test_leaderboard_after_rebuild_and_writes(client):
+    pages = [
+        [{"id": 1, "bus_route": "88", "started_stop": "a", "ended_stop": "e", "user_uuid": "user-1"},
+         {"id": 2, "bus_route": "88", "started_stop": "a", "ended_stop": "b", "user_uuid": "user-2"}],
+        [{"id": 3, "bus_route": "88", "started_stop": "b", "ended_stop": "d", "user_uuid": "user-2"}],
+    ]
+    query = client.supabase.table().select()
+    query.order().limit().execute.return_value = MagicMock(data=pages[0])
+    query.gt().order().limit().execute.return_value = MagicMock(data=pages[1])
+    scores, deferred = client.portal.call(stats.score_all_users)
+    assert scores == {"user-1": (1, 4), "user-2": (0, 3)} and not deferred
+    leaderboard.finish_rebuild(scores)
+    query.gt.assert_called_with("id", 2)
+
+    # Anonymous callers see opaque ids and no rank of their own, whatever user_uuid they claim
+    response = client.get("/api/stats/leaderboard", params={"metric": "stops_covered", "user_uuid": "user-2"})
+    assert response.json()["leaders"] == [
+        {"rank": 1, "id": stats.leader_id("user-1"), "score": 4, "is_me": False},
+        {"rank": 2, "id": stats.leader_id("user-2"), "score": 3, "is_me": False},
+    ]
+    assert "me" not in response.json()
+    assert "user-" not in response.text
+
+    stats.app.dependency_overrides[get_identity] = lambda: Identity({"sub": "user-2"})
+    response = client.get("/api/stats/leaderboard", params={"metric": "stops_covered"})
+    assert [leader["is_me"] for leader in response.json()["leaders"]] == [False, True]
+    assert response.json()["me"] == {"rank": 2, "score": 3}
+
+    # Once user-2's coverage is loaded, their writes move them up straight away
+    query.eq().execute.return_value = MagicMock(data=pages[0][1:] + pages[1])
+    client.get("/api/stats/coverage", params={"user_uuid": "user-2"})
+    client.supabase.table().insert().execute.return_value = MagicMock(
+        data=[{"id": 4, "bus_route": "88", "started_stop": "d", "ended_stop": "e", "user_uuid": "user-2"}]
+    )
+    client.post("/api/tfl/record-journey", json={
+        "route_id": "88", "from_stop_id": "d", "to_stop_id": "e", "user_uuid": "user-2", "user_email": "a@example.com",
+    })
+
+    response = client.get("/api/stats/leaderboard")
+    assert [leader["score"] for leader in response.json()["leaders"]] == [1, 1]
+    assert response.json()["me"] == {"rank": 1, "score": 1}
+
+
+def test_rebuild_loads_each_route_once_and_defers_users_on_failed_routes(client):
+    rows = [
+        {"id": 1, "bus_route": "88", "started_stop": "a", "ended_stop": "e", "user_uuid": "user-1"},
+        {"id": 2, "bus_route": "88", "started_stop": "b", "ended_stop": "c", "user_uuid": "user-2"},
+        {"id": 3, "bus_route": "999", "started_stop": "a", "ended_stop": "b", "user_uuid": "user-2"},
+    ]
+    query = client.supabase.table().select()
+    query.order().limit().execute.return_value = MagicMock(data=rows[:2])
+    query.gt().order().limit().execute.return_value = MagicMock(data=rows[2:])
+    leaderboard.finish_rebuild({"user-2": (0, 7)})
+
+    leaderboard.begin_rebuild()
+    scores, deferred = client.portal.call(stats.score_all_users)
+    leaderboard.finish_rebuild(scores, deferred)
+
+    # Both directions of each route were fetched once, without counting as demand or filling the shared cache
+    assert sorted(client.requests) == sorted(set(client.requests)) and len(client.requests) == 4
+    assert len(tflapi.sequence_cache) == 0
+    assert tflapi.refresh_scheduler is None or not tflapi.refresh_scheduler.demand
+    # user-2 has a journey on a route that failed, so they keep their old score until they're rescored
+    assert scores == {"user-1": (1, 4)} and deferred == {"user-2"}
+    assert leaderboard.rank("stops_covered", "user-2") == (1, 7)
+    assert leaderboard.stale == {"user-2"}
+
+    # If no route loads at all, the rebuild fails instead of deferring everyone
+    query.order().limit().execute.return_value = MagicMock(data=rows[2:])
+    with pytest.raises(HTTPException):
+        client.portal.call(stats.score_all_users)
+
+
+def test_rebuild_defers_users_whose_journey_may_be_on_a_direction_that_failed(client):
+    rows = [
+        {"id": 1, "bus_route": "77", "started_stop": "a", "ended_stop": "c", "user_uuid": "user-1"},
+        {"id": 2, "bus_route": "77", "started_stop": "w", "ended_stop": "z", "user_uuid": "user-2"},
+    ]
+    query = client.supabase.table().select()
+    query.order().limit().execute.return_value = MagicMock(data=rows)
+    query.gt().order().limit().execute.return_value = MagicMock(data=[])
+
+    scores, deferred = client.portal.call(stats.score_all_users)
+
+    # Route 77 loaded outbound only: user-1's journey fits it, user-2's might be inbound
+    assert scores == {"user-1": (0, 2)} and deferred == {"user-2"}
+
+
+def test_catchup_rescores_through_the_background_budget(client):
+    journeys = {
+        "user-2": [{"id": 2, "bus_route": "88", "started_stop": "a", "ended_stop": "c", "user_uuid": "user-2"}],
+        "user-3": [{"id": 3, "bus_route": "88", "started_stop": "b", "ended_stop": "e", "user_uuid": "user-3"}],
+        "user-4": [{"id": 4, "bus_route": "999", "started_stop": "a", "ended_stop": "b", "user_uuid": "user-4"}],
+    }
+    client.supabase.table().select().eq.side_effect = \
+        lambda column, user_uuid: MagicMock(execute=MagicMock(return_value=MagicMock(data=journeys[user_uuid])))
+    for user_uuid in journeys:
+        leaderboard.update(user_uuid, None)
+
+    failed = client.portal.call(stats.rescore, list(journeys))
+
+    assert failed == {"user-4"} and leaderboard.stale == {"user-4"}
+    assert leaderboard.rank("stops_covered", "user-3") == (1, 3)
+    # Route 88 was loaded once for both users, without counting as demand or filling the shared cache
+    assert sorted(client.requests) == sorted(set(client.requests)) and len(client.requests) == 4
+    assert len(tflapi.sequence_cache) == 0
+    assert tflapi.refresh_scheduler is None or not tflapi.refresh_scheduler.demand
+
+
+def test_leaderboard_unknown_metric(client):
+    assert client.get("/api/stats/leaderboard", params={"metric": "fastest"}).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_refresher_rebuilds_then_rescores_stale_users():
+    board = Leaderboard()
+    now = [0.0]
+    rescored = []
+
+    async def rebuild():
+        return {"user-1": (1, 4)}, set()
+
+    async def rescore(user_uuids):
+        rescored.extend(user_uuids)
+        return set()
+
+    refresher = LeaderboardRefresher(board, rebuild, rescore, rebuild_interval=60,
+                                     catchup_interval=1, catchup_batch=10, timer=lambda: now[0])
+    await refresher.run_once()
+    assert board.rank("routes_completed", "user-1") == (1, 1)
+
+    board.update("user-2", None)
+    now[0] = 30
+    await refresher.run_once()
+    assert rescored == ["user-2"] and board.rebuilds == 1
+
+    now[0] = 61
+    await refresher.run_once()
+    assert board.rebuilds == 2
+
+
+@pytest.mark.asyncio
+async def test_refresher_backs_off_after_a_failed_rebuild():
+    board = Leaderboard()
+    now = [0.0]
+    attempts = []
+
+    async def rebuild():
+        attempts.append(now[0])
+        if len(attempts) < 3:
+            raise RuntimeError("TfL is down")
+        return {"user-1": (1, 4)}, set()
+
+    async def rescore(user_uuids):
+        return set()
+
+    refresher = LeaderboardRefresher(board, rebuild, rescore, rebuild_interval=100,
+                                     catchup_interval=10, catchup_batch=10, timer=lambda: now[0])
+    for now[0] in (0, 10, 20, 30, 40, 50, 60, 70):
+        with suppress(RuntimeError):
+            await refresher.run_once()
+
+    # Retried 20s after the first failure, then 40s after the second
+    assert attempts == [0, 20, 60]
+    assert board.rebuilds == 1 and refresher.retry_at is None
+
+
+@pytest.mark.asyncio
+async def test_refresher_backs_off_users_that_fail_to_rescore():
+    board = Leaderboard()
+    now = [0.0]
+    attempts = []
+
+    async def rebuild():
+        return {}, set()
+
+    async def rescore(user_uuids):
+        attempts.append((now[0], sorted(user_uuids)))
+        return {"user-down"}
+
+    refresher = LeaderboardRefresher(board, rebuild, rescore, rebuild_interval=1000,
+                                     catchup_interval=10, catchup_batch=10, timer=lambda: now[0])
+    await refresher.run_once()
+    board.update("user-down", None)
+    for now[0] in (10, 20, 30, 40, 50, 60):
+        await refresher.run_once()
+
+    # Tried again 20s after the first failure, then 40s after the second
+    assert [at for at, _ in attempts] == [10, 30]
+    assert refresher.backoff == {"user-down": (2, 70)}
+
+    # Once a write rescores them, they start afresh the next time they go stale
+    board.stale.discard("user-down")
+    await refresher.run_once()
+    assert not refresher.backoff
@@ -0,0 +1,59 @@
+import asyncio
+import time
+import pytest
+from tflApi.limiter import UpstreamBusy, UpstreamGovernor
+
+
+@pytest.mark.asyncio
+async def test_requests_wait_for_tokens():
+    governor = UpstreamGovernor(rate=20, burst=2, max_in_flight=10, max_wait=1)
+
+    async def call():
+        async with governor.slot():
+            pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(4)))
+    elapsed = time.perf_counter() - started
+
+    # Two go out of the burst, the other two wait 50ms apart for tokens
+    assert 0.08 <= elapsed < 0.5
+    assert governor.stats()["admitted"] == 4
+    assert governor.stats()["max_wait_seconds"] > 0
+
+
+@pytest.mark.asyncio
+async def test_request_rejected_when_token_is_past_deadline():
+    governor = UpstreamGovernor(rate=1, burst=1, max_in_flight=10, max_wait=0.1)
+
+    async with governor.slot():
+        pass
+    with pytest.raises(UpstreamBusy) as busy:
+        async with governor.slot():
+            pass
+
+    assert busy.value.retry_after >= 1
+    assert governor.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_in_flight_cap_and_queue_depth():
+    governor = UpstreamGovernor(rate=100, burst=10, max_in_flight=1, max_wait=0.1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with governor.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+    assert governor.stats()["in_flight"] == 1
+    assert governor.stats()["queue_depth"] == 1
+
+    with pytest.raises(UpstreamBusy):
+        await waiter
+    release.set()
+    await holder
+    assert governor.stats()["in_flight"] == 0
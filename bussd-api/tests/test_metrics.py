@@ -0,0 +1,50 @@
+import re
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+from main import app
+from metrics.registry import Histogram, UPSTREAM_DURATION
+from middleware.metrics import REQUEST_DURATION
+
+
+@pytest.fixture
+def test_client():
+    return TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test histogram.", ("route",), buckets=(0.1, 1))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    lines = histogram.render().splitlines()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+    assert histogram.count("/a") == 3
+
+
+def test_requests_are_labelled_by_route_template(test_client):
+    mock_client = MagicMock()
+    mock_client.table.return_value.select.return_value.eq.return_value.execute.return_value = \
+        MagicMock(data=[{"id": 123}], error=None)
+
+    with patch("db.client.get_supabase", return_value=mock_client):
+        before = REQUEST_DURATION.count("GET", "/api/dashboard/routes/{route_id}", "200")
+        supabase_before = UPSTREAM_DURATION.count("supabase", "ok")
+        assert test_client.get("/api/dashboard/routes/123").status_code == 200
+        assert test_client.get("/api/dashboard/routes/456").status_code == 200
+
+    assert REQUEST_DURATION.count("GET", "/api/dashboard/routes/{route_id}", "200") == before + 2
+    assert UPSTREAM_DURATION.count("supabase", "ok") == supabase_before + 2
+
+    test_client.get("/no/such/path/789")
+    body = test_client.get("/metrics").text
+    assert 'route="/api/dashboard/routes/{route_id}"' in body
+    assert 'route="unmatched",status="404"' in body
+    # Ids never end up in route labels (sample values can contain any digits, so only labels are checked)
+    routes = set(re.findall(r'route="([^"]*)"', body))
+    assert not any("456" in route or "789" in route for route in routes)
+    assert 'http_requests_in_flight{app="dashboard"} 0' in body
@@ -0,0 +1,60 @@
+import json
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+pytest.importorskip("pyinstrument")
+
+from middleware.profiling import ProfilingMiddleware
+
+
+def make_client(tmp_path, **options):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), **options)
+
+    @app.get("/routes/{route_id}")
+    async def slow_route(route_id: str):
+        await asyncio.sleep(0.01)
+        return {"id": route_id}
+
+    return TestClient(app)
+
+
+def test_request_with_header_is_profiled_as_speedscope(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/routes/42", headers={"X-Profile": "1"})
+
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile"]
+    [written] = list(tmp_path.iterdir())
+    assert written.name.startswith(profile_id)
+    assert "routes_route_id" in written.name
+    assert "$schema" in json.loads(written.read_text())
+
+
+def test_html_format(tmp_path):
+    client = make_client(tmp_path, output_format="html")
+    client.get("/routes/42", headers={"X-Profile": "1"})
+    [written] = list(tmp_path.iterdir())
+    assert written.suffix == ".html"
+
+
+def test_requests_are_not_profiled_by_default(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/routes/42")
+    assert "X-Profile" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_token_must_match(tmp_path):
+    client = make_client(tmp_path, token="secret")
+    assert "X-Profile" not in client.get("/routes/42", headers={"X-Profile": "guess"}).headers
+    assert "X-Profile" in client.get("/routes/42", headers={"X-Profile": "secret"}).headers
+
+
+def test_sampled_requests_are_profiled(tmp_path):
+    client = make_client(tmp_path, sample_rate=1.0)
+    client.get("/routes/1")
+    client.get("/routes/2")
+    assert len(list(tmp_path.iterdir())) == 2
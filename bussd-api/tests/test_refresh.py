@@ -0,0 +1,82 @@
+import pytest
+from cache.ttl_cache import TTLCache
+from tflApi.refresh import RefreshScheduler
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(timer, budget=10):
+    cache = TTLCache(maxsize=10, ttl=300, stale_ttl=60, timer=timer)
+    loads = []
+
+    def loader_for(key):
+        async def load():
+            loads.append(key)
+            return f"fresh {key}"
+        return load
+
+    scheduler = RefreshScheduler(
+        cache, loader_for, budget_per_minute=budget, refresh_ahead=60, top_n=10, interval=15, timer=timer
+    )
+    return scheduler, cache, loads
+
+
+def test_due_keys_are_popular_and_expiring():
+    timer = FakeTimer()
+    scheduler, cache, _ = make_scheduler(timer)
+    cache.set("88", "a")
+    timer.now = 200
+    cache.set("12", "b")
+    for _ in range(3):
+        scheduler.record("88")
+    scheduler.record("12")
+    scheduler.record("not-cached")
+
+    timer.now = 250
+    assert scheduler.due() == ["88"]
+
+
+@pytest.mark.asyncio
+async def test_run_once_refreshes_within_budget():
+    timer = FakeTimer()
+    scheduler, cache, loads = make_scheduler(timer, budget=2)
+    for route in ("88", "12", "N5"):
+        cache.set(route, "old")
+
+    timer.now = 250
+    scheduler._roll_window()
+    for requests, route in ((6, "88"), (4, "12"), (2, "N5")):
+        for _ in range(requests):
+            scheduler.record(route)
+
+    timer.now = 280
+    await scheduler.run_once()
+
+    assert loads == ["88", "12"]
+    assert cache.get("88") == "fresh 88"
+    assert cache.get("N5") == "old"
+    assert scheduler.stats()["skipped_for_budget"] == 1
+
+    # A new minute brings a fresh budget
+    timer.now = 345
+    await scheduler.run_once()
+    assert loads[-1] == "N5"
+
+
+def test_demand_decays_each_window():
+    timer = FakeTimer()
+    scheduler, _, _ = make_scheduler(timer)
+    for _ in range(4):
+        scheduler.record("88")
+    scheduler.record("12")
+
+    timer.now = 61
+    scheduler._roll_window()
+
+    assert scheduler.demand == {"88": 2}
@@ -0,0 +1,101 @@
+import httpx
+import pytest
+from tflApi.resilience import CircuitBreaker, CircuitOpen, is_transient, with_retries
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def status_error(status):
+    request = httpx.Request("GET", "https://api.tfl.gov.uk/Line/88")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def test_is_transient():
+    assert is_transient(status_error(503))
+    assert is_transient(httpx.ConnectTimeout("timed out"))
+    assert not is_transient(status_error(404))
+    assert not is_transient(ValueError("bad json"))
+
+
+@pytest.mark.asyncio
+async def test_with_retries_retries_transient_errors():
+    errors = [status_error(502), httpx.ReadTimeout("slow")]
+
+    async def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert await with_retries(call, attempts=3, base_delay=0, max_delay=0) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_with_retries_gives_up():
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise status_error(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await with_retries(call, attempts=3, base_delay=0, max_delay=0)
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_with_retries_does_not_retry_client_errors():
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise status_error(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await with_retries(call, attempts=3, base_delay=0, max_delay=0)
+    assert calls == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    timer = FakeTimer()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, timer=timer)
+    for _ in range(3):
+        breaker.check()
+        breaker.record_failure()
+
+    with pytest.raises(CircuitOpen) as open_error:
+        breaker.check()
+    assert open_error.value.retry_after == 30
+
+    timer.now = 31
+    breaker.check()
+    assert breaker.state == "half_open"
+    # Only the probe goes through
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_failed_probe_reopens_circuit():
+    timer = FakeTimer()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, timer=timer)
+    breaker.record_failure()
+
+    timer.now = 11
+    breaker.check()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.stats()["times_opened"] == 2
+    with pytest.raises(CircuitOpen):
+        breaker.check()
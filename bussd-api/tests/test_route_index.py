@@ -0,0 +1,31 @@
+import pytest
+from tflApi.route_index import RouteIndex
+
+
+def make_index(*stop_ids):
+    return RouteIndex([{"id": stop_id} for stop_id in stop_ids])
+
+
+def test_span_and_between():
+    index = make_index("a", "b", "c", "d")
+    assert index.span("d", "a") == (3, 0)
+    assert index.between(3, 0) == ["b", "c"]
+
+
+def test_span_unknown_stop():
+    index = make_index("a", "b")
+    with pytest.raises(KeyError):
+        index.span("a", "z")
+
+
+def test_repeated_stop_keeps_first_position():
+    index = make_index("a", "b", "a")
+    assert index.position("a") == 0
+    assert len(index) == 3
+
+
+def test_percentage_rounds_half_up():
+    index = make_index(*"abcdefgh")
+    assert index.percentage(1) == 13
+    assert index.percentage(8) == 100
+    assert make_index().percentage(0) == 0
@@ -0,0 +1,101 @@
+import json
+import sqlite3
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from main import app
+from cache.ttl_cache import TTLCache
+from tflApi.snapshot import SnapshotError, SnapshotReader, SnapshotStore, SnapshotWriter, main as snapshot_main
+
+STOPS = [{"id": "a", "name": "Stop A"}, {"id": "b", "name": "Stop B"}, {"id": "c", "name": "Stop C"}]
+
+
+def write_snapshot(path, stops=STOPS):
+    writer = SnapshotWriter(str(path))
+    writer.add_route("88", "outbound", stops)
+    writer.add_stop_point({"id": "a", "commonName": "Stop A", "lat": 51.5, "lon": -0.1})
+    writer.commit()
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "tfl.snapshot"
+    write_snapshot(path)
+
+    store = SnapshotStore(str(path))
+    assert store.route_stops("88", "Outbound") == STOPS
+    assert store.route_stops("88", "inbound") is None
+    assert store.stop_point("a")["commonName"] == "Stop A"
+    assert store.stats()["routes"] == 1
+    assert not list(tmp_path.glob("*.tmp-*"))
+
+
+def test_snapshot_version_mismatch(tmp_path):
+    path = tmp_path / "tfl.snapshot"
+    write_snapshot(path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE meta SET value = '999' WHERE key = 'format_version'")
+
+    with pytest.raises(SnapshotError):
+        SnapshotStore(str(path))
+
+
+def test_reader_picks_up_swapped_snapshot(tmp_path):
+    path = tmp_path / "tfl.snapshot"
+    write_snapshot(path)
+    reader = SnapshotReader(str(path), check_interval=0)
+    assert len(reader.route_stops("88", "outbound")) == 3
+
+    write_snapshot(path, stops=STOPS[:2])
+
+    assert len(reader.route_stops("88", "outbound")) == 2
+    reader.close()
+
+
+def test_ingest_from_dir(tmp_path):
+    dump = tmp_path / "dump"
+    dump.mkdir()
+    (dump / "88_outbound.json").write_text(json.dumps({
+        "lineId": "88",
+        "direction": "outbound",
+        "stopPointSequences": [{"stopPoint": STOPS}],
+    }))
+    (dump / "stops.json").write_text(json.dumps([{"id": "a", "commonName": "Stop A"}]))
+    out = tmp_path / "tfl.snapshot"
+
+    assert snapshot_main(["ingest", "--out", str(out), "--from-dir", str(dump)]) == 0
+
+    store = SnapshotStore(str(out))
+    assert store.route_stops("88", "outbound") == STOPS
+    assert store.stop_point("a") == {"id": "a", "commonName": "Stop A"}
+
+
+def test_endpoints_serve_from_snapshot(tmp_path):
+    path = tmp_path / "tfl.snapshot"
+    write_snapshot(path)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"id": "live"})
+
+    with patch("tflApi.tflapi.TFL_SNAPSHOT_PATH", str(path)), \
+         patch("tflApi.tflapi.create_http_client",
+               side_effect=lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))), \
+         patch("tflApi.tflapi.sequence_cache", TTLCache(maxsize=10, ttl=60)), \
+         TestClient(app) as client:
+        stops = client.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound"})
+        stop = client.get("/api/tfl/stops/a")
+        between = client.get("/api/tfl/stops-between", params={"route_id": "88", "from_stop_id": "a", "to_stop_id": "c"})
+        assert requests == []
+
+        missing = client.get("/api/tfl/stops/zzz")
+        stats = client.get("/api/tfl/cache/stats").json()["snapshot"]
+
+    assert stops.json()["stop_count"] == 3
+    assert stop.json()["commonName"] == "Stop A"
+    assert between.json()["count"] == 2
+    assert missing.json() == {"id": "live"}
+    assert len(requests) == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
@@ -0,0 +1,558 @@
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+from main import app
+from tflApi import tflapi
+from cache.ttl_cache import TTLCache
+from tflApi.limiter import UpstreamGovernor
+from tflApi.resilience import CircuitBreaker
+
+SEQUENCE = {
+    "stopPointSequences": [
+        {
+            "stopPoint": [
+                {"id": "a", "name": "Stop A"},
+                {"id": "b", "name": "Stop B"},
+                {"id": "c", "name": "Stop C"},
+                {"id": "d", "name": "Stop D"},
+            ]
+        }
+    ]
+}
+
+
+@pytest.fixture
+def tfl_transport():
+    """Serve canned TfL responses and record the requested paths"""
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if "/Route/Sequence/" in request.url.path:
+            return httpx.Response(200, json=SEQUENCE)
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    transport = httpx.MockTransport(handler)
+    transport.requests = requests
+    return transport
+
+
+@pytest.fixture
+def test_client(tfl_transport):
+    def create_client():
+        return httpx.AsyncClient(transport=tfl_transport, headers={"app_key": "test"})
+
+    with patch("tflApi.tflapi.create_http_client", side_effect=create_client) as factory, \
+         patch("tflApi.tflapi.sequence_cache", TTLCache(maxsize=10, ttl=60)), \
+         patch("tflApi.tflapi.last_known_good", TTLCache(maxsize=10, ttl=3600)), \
+         patch("tflApi.tflapi.circuit_breaker", CircuitBreaker(failure_threshold=2, reset_timeout=30)), \
+         patch("tflApi.tflapi.TFL_RETRY_BASE_DELAY", 0), \
+         TestClient(app) as client:
+        client.factory = factory
+        yield client
+
+
+def test_lifespan_manages_shared_client():
+    with TestClient(app):
+        assert tflapi.http_client is not None
+        assert not tflapi.http_client.is_closed
+        shared = tflapi.http_client
+
+    assert shared.is_closed
+    assert tflapi.http_client is None
+
+
+def test_requests_reuse_shared_client(test_client, tfl_transport):
+    test_client.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound"})
+    test_client.get("/api/tfl/stops/abc")
+    test_client.get("/api/tfl/stops-between", params={"route_id": "88", "from_stop_id": "a", "to_stop_id": "d"})
+
+    assert test_client.factory.call_count == 1
+    # /stops and /stops-between share the cached route sequence
+    assert len(tfl_transport.requests) == 2
+    assert all(r.headers["app_key"] == "test" for r in tfl_transport.requests)
+
+
+def test_get_stops_success(test_client):
+    response = test_client.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound"})
+    assert response.status_code == 200
+    assert response.json()["stop_count"] == 4
+
+
+def test_stops_between_success(test_client):
+    response = test_client.get("/api/tfl/stops-between", params={
+        "route_id": "88",
+        "from_stop_id": "a",
+        "to_stop_id": "d",
+    })
+    assert response.status_code == 200
+    assert response.json()["count"] == 3
+    assert response.json()["stop_ids_between"] == ["b", "c"]
+
+
+def test_stops_between_invalid_stop(test_client):
+    response = test_client.get("/api/tfl/stops-between", params={
+        "route_id": "88",
+        "from_stop_id": "a",
+        "to_stop_id": "z",
+    })
+    assert response.status_code == 400
+    assert "not found" in response.text
+
+
+def test_fetch_tfl_upstream_error(test_client):
+    def handler(request):
+        return httpx.Response(503, text="Service Unavailable")
+
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    response = test_client.get("/api/tfl/stops/abc")
+    assert response.status_code == 503
+
+
+def test_route_sequence_is_cached(test_client, tfl_transport):
+    for _ in range(3):
+        response = test_client.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound"})
+        assert response.status_code == 200
+
+    assert len(tfl_transport.requests) == 1
+    stats = test_client.get("/api/tfl/cache/stats").json()["route_sequences"]
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+
+
+def test_stops_between_compact_response(test_client):
+    response = test_client.get("/api/tfl/stops-between", params={
+        "route_id": "88",
+        "from_stop_id": "b",
+        "to_stop_id": "d",
+        "include_stop_ids": "false",
+    })
+    assert response.status_code == 200
+    assert response.json() == {
+        "direction": "outbound",
+        "count": 2,
+        "from_index": 1,
+        "to_index": 3,
+        "total_stops": 4,
+        "percentage": 50,
+    }
+
+
+def test_get_stops_compact(test_client):
+    response = test_client.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound", "compact": "true"})
+    assert response.status_code == 200
+    assert response.json()["stops"][0] == {"id": "a", "name": "Stop A", "lat": None, "lon": None}
+
+
+def test_get_stop_fields(test_client):
+    response = test_client.get("/api/tfl/stops/abc", params={"fields": "id,name"})
+    assert response.status_code == 200
+    assert response.json() == {"id": "abc", "name": None}
+
+
+def test_stops_conditional_get(test_client, tfl_transport):
+    params = {"route_id": "88", "direction": "outbound"}
+    first = test_client.get("/api/tfl/stops", params=params)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == f"public, max-age={tflapi.TFL_STOPS_MAX_AGE}"
+
+    repeat = test_client.get("/api/tfl/stops", params=params, headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    assert repeat.headers["ETag"] == etag
+
+    weak = test_client.get("/api/tfl/stops", params=params, headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+    compact = test_client.get("/api/tfl/stops", params={**params, "compact": "true"}, headers={"If-None-Match": etag})
+    assert compact.status_code == 200
+    assert compact.headers["ETag"] != etag
+
+
+def test_etag_is_stable_across_reloads(test_client):
+    params = {"route_id": "88", "direction": "outbound"}
+    etag = test_client.get("/api/tfl/stops", params=params).headers["ETag"]
+    tflapi.sequence_cache.clear()
+    assert test_client.get("/api/tfl/stops", params=params).headers["ETag"] == etag
+
+
+def test_stop_and_stops_between_conditional_get(test_client):
+    for path, params in (
+        ("/api/tfl/stops/abc", {}),
+        ("/api/tfl/stops-between", {"route_id": "88", "from_stop_id": "a", "to_stop_id": "c"}),
+    ):
+        etag = test_client.get(path, params=params).headers["ETag"]
+        response = test_client.get(path, params=params, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert "max-age" in response.headers["Cache-Control"]
+
+    other = test_client.get("/api/tfl/stops-between", params={"route_id": "88", "from_stop_id": "a", "to_stop_id": "d"})
+    assert other.headers["ETag"] != etag
+
+
+def serve_both_directions(request):
+    """Inbound runs the outbound sequence backwards and adds a stop only served inbound"""
+    if request.url.path.endswith("/inbound"):
+        stops = [{"id": "e", "name": "Stop E"}] + SEQUENCE["stopPointSequences"][0]["stopPoint"][::-1]
+        return httpx.Response(200, json={"stopPointSequences": [{"stopPoint": stops}]})
+    return httpx.Response(200, json=SEQUENCE)
+
+
+@pytest.mark.parametrize("from_stop_id, to_stop_id, direction, from_index, to_index", [
+    ("b", "d", "outbound", 1, 3),
+    ("d", "b", "inbound", 1, 3),
+    ("e", "a", "inbound", 0, 4),
+])
+def test_stops_between_auto_direction(test_client, from_stop_id, to_stop_id, direction, from_index, to_index):
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(serve_both_directions))
+    response = test_client.get("/api/tfl/stops-between", params={
+        "route_id": "88",
+        "from_stop_id": from_stop_id,
+        "to_stop_id": to_stop_id,
+        "direction": "auto",
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["direction"] == direction
+    assert (body["from_index"], body["to_index"]) == (from_index, to_index)
+
+
+def test_stops_between_auto_direction_unknown_stop(test_client):
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(serve_both_directions))
+    response = test_client.get("/api/tfl/stops-between", params={
+        "route_id": "88", "from_stop_id": "a", "to_stop_id": "zzz", "direction": "auto",
+    })
+    assert response.status_code == 400
+
+
+def inbound_down(request):
+    """Outbound loads, inbound fails as if TfL were having trouble"""
+    if request.url.path.endswith("/inbound"):
+        return httpx.Response(502, text="Bad gateway")
+    return httpx.Response(200, json=SEQUENCE)
+
+
+def test_stops_between_auto_direction_with_a_direction_down(test_client):
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(inbound_down))
+    params = {"route_id": "88", "direction": "auto"}
+
+    # Stops on the direction that loaded are still found
+    assert test_client.get("/api/tfl/stops-between", params={**params, "from_stop_id": "a", "to_stop_id": "c"}).status_code == 200
+    # Others may be on the direction that didn't, so the client is told to retry rather than that its stops are wrong
+    response = test_client.get("/api/tfl/stops-between", params={**params, "from_stop_id": "w", "to_stop_id": "z"})
+    assert response.status_code == 502
+
+
+@pytest.fixture
+def mock_supabase():
+    mock_client = MagicMock()
+    with patch("db.client.get_supabase", return_value=mock_client):
+        yield mock_client
+
+
+def test_record_journey(test_client, tfl_transport, mock_supabase):
+    mock_supabase.table.return_value.insert.return_value.execute.return_value = MagicMock(data=[{"id": 1}])
+
+    response = test_client.post("/api/tfl/record-journey", json={
+        "route_id": "88",
+        "from_stop_id": "a",
+        "to_stop_id": "c",
+        "user_uuid": "user-abc",
+        "user_email": "test@example.com",
+    })
+
+    assert response.status_code == 200
+    assert response.json()["percentage"] == 50
+    assert response.json()["data"] == [{"id": 1}]
+    assert len(tfl_transport.requests) == 1
+    mock_supabase.table.assert_called_with("bus_routes_taken")
+    mock_supabase.table.return_value.insert.assert_called_once_with({
+        "bus_route": "88",
+        "percentage_travelled": 50,
+        "started_stop": "a",
+        "ended_stop": "c",
+        "user_uuid": "user-abc",
+        "user_email": "test@example.com",
+        "bus_route_taken": True,
+    })
+
+
+def test_bulk_journeys_auto_direction(test_client, mock_supabase):
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(serve_both_directions))
+    mock_supabase.table.return_value.insert.return_value.execute.side_effect = \
+        lambda: MagicMock(data=[{"id": i, **row} for i, row in enumerate(mock_supabase.table.return_value.insert.call_args[0][0])])
+
+    journeys = [dict(make_journey("e", "c"), direction="auto"), dict(make_journey("a", "b"), direction="auto")]
+    response = test_client.post("/api/tfl/add-bus-routes", json=journeys)
+
+    assert response.status_code == 200
+    assert [result["percentage"] for result in response.json()["results"]] == [40, 25]
+
+
+def test_journey_writes_with_a_direction_down(test_client, mock_supabase):
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(inbound_down))
+    journey = dict(make_journey("w", "z"), direction="auto")
+
+    assert test_client.post("/api/tfl/record-journey", json=journey).status_code == 502
+    response = test_client.post("/api/tfl/add-bus-routes", json=[journey])
+    assert response.status_code == 200
+    assert response.json()["results"][0]["status"] == "error"
+    assert "not found" not in response.json()["results"][0]["detail"]
+    mock_supabase.table.return_value.insert.assert_not_called()
+
+
+def test_record_journey_unknown_stop(test_client, mock_supabase):
+    response = test_client.post("/api/tfl/record-journey", json={
+        "route_id": "88",
+        "from_stop_id": "a",
+        "to_stop_id": "z",
+        "user_uuid": "user-abc",
+        "user_email": "test@example.com",
+    })
+
+    assert response.status_code == 400
+    mock_supabase.table.assert_not_called()
+
+
+UPDATE_PAYLOAD = {
+    "user_email": "test@example.com",
+    "bus_route": "88",
+    "percentage_travelled": "50",
+    "started_stop": "a",
+    "ended_stop": "c",
+    "user_uuid": "user-abc",
+}
+
+
+def test_update_bus_route_single_query(test_client, mock_supabase):
+    updated = [{"id": 1, "percentage_travelled": "50"}]
+    update_query = mock_supabase.table.return_value.update.return_value.eq.return_value.eq.return_value
+    update_query.execute.return_value = MagicMock(data=updated)
+
+    response = test_client.post("/api/tfl/update-bus-route/1", json=UPDATE_PAYLOAD)
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Bus route updated", "data": updated}
+    mock_supabase.table.return_value.update.assert_called_once_with({
+        "percentage_travelled": "50",
+        "started_stop": "a",
+        "ended_stop": "c",
+    })
+    mock_supabase.table.return_value.select.assert_not_called()
+    update_query.eq.assert_not_called()
+
+
+def test_update_bus_route_not_found(test_client, mock_supabase):
+    update_query = mock_supabase.table.return_value.update.return_value.eq.return_value.eq.return_value
+    update_query.execute.return_value = MagicMock(data=[])
+
+    response = test_client.post("/api/tfl/update-bus-route/1", json=UPDATE_PAYLOAD)
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "No route found with id 1 for this user"
+
+
+def test_update_bus_route_precondition(test_client, mock_supabase):
+    update_query = mock_supabase.table.return_value.update.return_value.eq.return_value.eq.return_value
+    update_query.eq.return_value.execute.return_value = MagicMock(data=[{"id": 1}])
+
+    response = test_client.post("/api/tfl/update-bus-route/1", json={
+        **UPDATE_PAYLOAD,
+        "expected_updated_at": "2025-06-01T10:00:00+00:00",
+    })
+
+    assert response.status_code == 200
+    update_query.eq.assert_called_once_with("updated_at", "2025-06-01T10:00:00+00:00")
+
+
+def test_update_bus_route_conflict(test_client, mock_supabase):
+    update_query = mock_supabase.table.return_value.update.return_value.eq.return_value.eq.return_value
+    update_query.eq.return_value.execute.return_value = MagicMock(data=[])
+    select_query = mock_supabase.table.return_value.select.return_value.eq.return_value.eq.return_value
+    select_query.execute.return_value = MagicMock(data=[{"id": 1, "updated_at": "2025-06-01T10:05:00+00:00"}])
+
+    response = test_client.post("/api/tfl/update-bus-route/1", json={
+        **UPDATE_PAYLOAD,
+        "expected_updated_at": "2025-06-01T10:00:00+00:00",
+    })
+
+    assert response.status_code == 409
+
+
+def make_journey(from_stop_id, to_stop_id, route_id="88"):
+    return {
+        "route_id": route_id,
+        "from_stop_id": from_stop_id,
+        "to_stop_id": to_stop_id,
+        "user_uuid": "user-abc",
+        "user_email": "test@example.com",
+    }
+
+
+def test_add_bus_routes_batches_inserts(test_client, tfl_transport, mock_supabase):
+    inserted_ids = iter(range(1, 100))
+
+    def insert(rows):
+        query = MagicMock()
+        query.execute.return_value = MagicMock(data=[{**row, "id": next(inserted_ids)} for row in rows])
+        return query
+
+    mock_supabase.table.return_value.insert.side_effect = insert
+    journeys = [make_journey("a", "b"), make_journey("a", "z"), make_journey("a", "c"), make_journey("b", "d"),
+                make_journey("a", "d")]
+
+    with patch("tflApi.tflapi.BULK_INSERT_BATCH_SIZE", 2):
+        response = test_client.post("/api/tfl/add-bus-routes", json=journeys)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["inserted"] == 4
+    assert body["failed"] == 1
+    assert [result["status"] for result in body["results"]] == ["created", "error", "created", "created", "created"]
+    assert body["results"][0] == {"index": 0, "status": "created", "id": 1, "percentage": 25}
+    assert body["results"][4]["id"] == 4
+    assert [len(call.args[0]) for call in mock_supabase.table.return_value.insert.call_args_list] == [2, 2]
+    # One upstream fetch for the shared route
+    assert len(tfl_transport.requests) == 1
+
+
+def test_add_bus_routes_failed_batch(test_client, mock_supabase):
+    mock_supabase.table.return_value.insert.return_value.execute.side_effect = Exception("Database error")
+
+    response = test_client.post("/api/tfl/add-bus-routes", json=[make_journey("a", "b"), make_journey("b", "c")])
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 0
+    assert all(result["status"] == "error" for result in response.json()["results"])
+
+
+def test_add_bus_routes_reports_bad_items_and_a_broken_off_body(test_client, mock_supabase):
+    mock_supabase.table.return_value.insert.return_value.execute.side_effect = \
+        lambda: MagicMock(data=[{"id": i, **row} for i, row in enumerate(mock_supabase.table.return_value.insert.call_args[0][0])])
+    valid = json.dumps(make_journey("a", "b"))
+    # The last journey is cut off, and the array with it
+    body = f'[{valid}, {{"route_id": "88"}}, {valid}, 7, {valid[:-5]}'
+
+    with patch("tflApi.tflapi.BULK_INSERT_BATCH_SIZE", 2):
+        response = test_client.post("/api/tfl/add-bus-routes", content=body, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == ["created", "error", "created", "error", "error"]
+    assert "from_stop_id" in body["results"][1]["detail"]
+    assert body["results"][4]["detail"].startswith("Invalid JSON")
+    assert (body["inserted"], body["failed"]) == (2, 3)
+
+
+def test_add_bus_routes_needs_an_array(test_client, mock_supabase):
+    response = test_client.post("/api/tfl/add-bus-routes", json=make_journey("a", "b"))
+
+    assert response.status_code == 400
+    mock_supabase.table.return_value.insert.assert_not_called()
+
+
+def test_upstream_rate_limit_becomes_503(test_client):
+    def handler(request):
+        return httpx.Response(429, headers={"Retry-After": "7"}, text="Too Many Requests")
+
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    response = test_client.get("/api/tfl/stops/abc")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_full_upstream_queue_becomes_503(test_client):
+    with patch.object(tflapi, "upstream_governor", UpstreamGovernor(rate=1, burst=0, max_in_flight=1, max_wait=0.01)):
+        response = test_client.get("/api/tfl/stops/abc")
+        stats = test_client.get("/api/tfl/upstream/stats").json()["tfl"]
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert stats["rejected"] == 1
+
+
+def test_transient_upstream_errors_are_retried(test_client):
+    statuses = iter([502, 504, 200])
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(next(statuses), json={"id": "abc"})
+
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    response = test_client.get("/api/tfl/stops/abc")
+
+    assert response.status_code == 200
+    assert len(requests) == 3
+    assert tflapi.circuit_breaker.state == "closed"
+
+
+def test_open_circuit_serves_last_known_good_sequence(test_client, tfl_transport):
+    params = {"route_id": "88", "direction": "outbound"}
+    assert test_client.get("/api/tfl/stops", params=params).status_code == 200
+    tflapi.sequence_cache.clear()
+
+    requests = []
+
+    def failing(request):
+        requests.append(request)
+        return httpx.Response(503, text="Service Unavailable")
+
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(failing))
+    for _ in range(2):
+        response = test_client.get("/api/tfl/stops", params=params)
+        assert response.status_code == 200
+        assert response.headers["X-Data-Stale"] == "true"
+        assert "Age" in response.headers
+        assert response.headers["Cache-Control"] == "public, max-age=0"
+    assert tflapi.circuit_breaker.state == "open"
+
+    # With the circuit open TfL isn't called at all
+    calls = len(requests)
+    response = test_client.get("/api/tfl/stops-between", params={**params, "from_stop_id": "a", "to_stop_id": "d"})
+    assert response.status_code == 200
+    assert response.json()["count"] == 3
+    assert response.headers["X-Data-Stale"] == "true"
+    assert len(requests) == calls
+
+    response = test_client.get("/api/tfl/stops", params={"route_id": "12", "direction": "outbound"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_stops_batch_streams_ndjson(test_client, tfl_transport):
+    def handler(request):
+        tfl_transport.requests.append(request)
+        if "/Line/404/" in request.url.path:
+            return httpx.Response(404, text="Not found")
+        return httpx.Response(200, json=SEQUENCE)
+
+    tflapi.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    test_client.get("/api/tfl/stops", params={"route_id": "88", "direction": "outbound"})
+
+    response = test_client.post("/api/tfl/stops/batch", json=[
+        {"route_id": "88"},
+        {"route_id": "12", "direction": "inbound"},
+        {"route_id": "404"},
+        {"route_id": "88", "direction": "outbound"},
+    ])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {(line["route_id"], line["direction"]): line for line in lines}
+    assert len(lines) == 3
+    assert results[("88", "outbound")]["stop_count"] == 4
+    assert results[("12", "inbound")]["stop_count"] == 4
+    assert results[("404", "outbound")]["status"] == 404
+    # 88 came from the cache
+    assert len(tfl_transport.requests) == 3
+
+
+def test_stops_batch_too_many_routes(test_client):
+    with patch("tflApi.tflapi.TFL_BATCH_MAX_ROUTES", 1):
+        response = test_client.post("/api/tfl/stops/batch", json=[{"route_id": "88"}, {"route_id": "12"}])
+    assert response.status_code == 413
@@ -0,0 +1,125 @@
+import time
+import httpx
+import pytest
+import rsa
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+from jose import jwk, jwt
+from main import app
+from auth import tokens
+from auth.tokens import KeySet, TokenVerifier, resolve_user
+from cache.ttl_cache import TTLCache
+
+SECRET = "test-jwt-secret"
+
+
+def make_token(sub="user-abc", key=SECRET, algorithm="HS256", expires_in=3600, headers=None, **claims):
+    payload = {"sub": sub, "aud": "authenticated", "exp": int(time.time()) + expires_in, "email": "test@example.com"}
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm=algorithm, headers=headers)
+
+
+def make_verifier(secret=SECRET, jwks_url=None, transport=None):
+    keys = KeySet(secret, jwks_url, refresh_interval=600, min_refresh_interval=30, transport=transport)
+    return TokenVerifier(keys, "authenticated", TTLCache(maxsize=10, ttl=300))
+
+
+@pytest.fixture
+def verifier():
+    verifier = make_verifier()
+    with patch("auth.tokens._verifier", verifier):
+        yield verifier
+
+
+@pytest.mark.asyncio
+async def test_verified_claims_are_cached():
+    verifier = make_verifier()
+    token = make_token()
+
+    with patch("auth.tokens.jwt.decode", wraps=jwt.decode) as decode:
+        first = await verifier.verify(token)
+        second = await verifier.verify(token)
+
+    assert first.user_id == "user-abc"
+    assert second is first
+    assert decode.call_count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", [
+    make_token(expires_in=-10),
+    make_token(aud="anon"),
+    make_token(key="wrong-secret"),
+    make_token(algorithm="HS512"),
+    "not-a-token",
+])
+async def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(HTTPException) as error:
+        await make_verifier().verify(token)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_jwks_keys_are_fetched_once_and_reused():
+    _, private_key = rsa.newkeys(1024)
+    pem = private_key.save_pkcs1().decode()
+    public_jwk = dict(jwk.construct(pem, "RS256").public_key().to_dict(), kid="key-1")
+    fetches = []
+
+    def handler(request):
+        fetches.append(request)
+        return httpx.Response(200, json={"keys": [public_jwk]})
+
+    verifier = make_verifier(secret=None, jwks_url="https://auth.example/jwks.json", transport=httpx.MockTransport(handler))
+    for sub in ("user-1", "user-2"):
+        identity = await verifier.verify(make_token(sub=sub, key=pem, algorithm="RS256", headers={"kid": "key-1"}))
+        assert identity.user_id == sub
+
+    assert len(fetches) == 1
+    # An unknown kid right after a fetch doesn't send every request back to the JWKS endpoint
+    with pytest.raises(HTTPException):
+        await verifier.verify(make_token(key=pem, algorithm="RS256", headers={"kid": "key-2"}))
+    assert len(fetches) == 1
+
+
+def test_resolve_user():
+    identity = tokens.Identity({"sub": "user-abc"})
+    assert resolve_user(identity, None) == "user-abc"
+    assert resolve_user(identity, "user-abc") == "user-abc"
+    assert resolve_user(None, "legacy-user") == "legacy-user"
+    with pytest.raises(HTTPException) as error:
+        resolve_user(identity, "someone-else")
+    assert error.value.status_code == 403
+
+
+def test_dashboard_uses_token_identity(verifier):
+    mock_client = MagicMock()
+    query = mock_client.table().select().eq()
+    query.order().limit().execute.return_value = MagicMock(data=[])
+    client = TestClient(app)
+
+    with patch("db.client.get_supabase", return_value=mock_client):
+        headers = {"Authorization": f"Bearer {make_token()}"}
+        assert client.get("/api/dashboard/routes", headers=headers).status_code == 200
+        mock_client.table().select().eq.assert_called_with("user_uuid", "user-abc")
+
+        response = client.get("/api/dashboard/routes", params={"user_uuid": "someone-else"}, headers=headers)
+        assert response.status_code == 403
+
+        assert client.get("/api/dashboard/routes", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+
+def test_auth_required_rejects_anonymous_requests(verifier):
+    with patch("auth.tokens.REQUIRE_AUTH", True):
+        response = TestClient(app).get("/api/dashboard/routes", params={"user_uuid": "test-uuid"})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_session_from_token(verifier):
+    with patch("db.client.get_auth_client") as auth_client:
+        response = TestClient(app).get("/auth/session", headers={"Authorization": f"Bearer {make_token()}"})
+
+    assert response.json() == {"isLoggedIn": True, "session": {"user": {"email": "test@example.com", "id": "user-abc"}}}
+    auth_client.assert_not_called()
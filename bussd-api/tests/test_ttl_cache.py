@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from cache.ttl_cache import TTLCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=60, timer=timer)
+    cache.set("88", ["a", "b"])
+
+    timer.now = 59
+    assert cache.get("88") == ["a", "b"]
+
+    timer.now = 60
+    assert cache.get("88") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_coalesced():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "sequence"
+
+    results = await asyncio.gather(*(cache.get_or_load("88", loader) for _ in range(200)))
+
+    assert calls == 1
+    assert set(results) == {"sequence"}
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 199
+
+    assert await cache.get_or_load("88", loader) == "sequence"
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_load_is_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    async def failing():
+        raise ValueError("upstream down")
+
+    async def loader():
+        return "sequence"
+
+    with pytest.raises(ValueError):
+        await cache.get_or_load("88", failing)
+    assert await cache.get_or_load("88", loader) == "sequence"
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_while_refreshing():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=60, stale_ttl=30, timer=timer)
+    cache.set("88", "old")
+    refreshed = asyncio.Event()
+
+    async def loader():
+        await refreshed.wait()
+        return "new"
+
+    timer.now = 70
+    assert await cache.get_or_load("88", loader) == "old"
+    assert cache.stats()["stale_hits"] == 1
+
+    refreshed.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert cache.get("88") == "new"
+
+    timer.now = 200
+    assert cache.expires_in("88") is not None
+    assert "88" not in cache
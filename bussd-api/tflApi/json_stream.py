@@ -0,0 +1,86 @@
+import codecs
+import json
+from typing import Any, AsyncIterator
+
+_WHITESPACE = " \t\n\r"
+
+
+class MalformedJSON(ValueError):
+    """The body isn't a JSON array of values, or one of its values is too large."""
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes], max_item_size: int) -> AsyncIterator[Any]:
+    """Yield the values of a JSON array as they arrive, holding at most one value's text at a time.
+
+    Raises ``MalformedJSON`` at the point the body stops being a JSON array,
+    after yielding every value before it.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, position, done = "", 0, False
+    # What may come next: "[" to open, a value or "]" after it, then "," or "]" after each value
+    expecting = "["
+
+    async def more() -> bool:
+        nonlocal buffer, position, done
+        if done:
+            return False
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            done = True
+            chunk = b""
+        try:
+            buffer = buffer[position:] + utf8.decode(chunk, final=done)
+        except UnicodeDecodeError as e:
+            raise MalformedJSON(f"Body isn't valid UTF-8: {e}")
+        position = 0
+        return True
+
+    async def next_char() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not await more():
+                return ""
+
+    while True:
+        char = await next_char()
+        if not char and expecting != "[":
+            raise MalformedJSON("Unexpected end of the array")
+        if expecting == "[":
+            if char != "[":
+                raise MalformedJSON("Expected a JSON array")
+            position += 1
+            expecting = "value or ]"
+        elif char == "]" and expecting != "value":
+            position += 1
+            if await next_char():
+                raise MalformedJSON("Unexpected data after the array")
+            return
+        elif expecting == ", or ]":
+            if char != ",":
+                raise MalformedJSON("Expected ',' or ']' between array values")
+            position += 1
+            expecting = "value"
+        else:
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    error = e
+                else:
+                    # A number at the end of the buffer may be cut short, so only trust a value followed by something
+                    if end < len(buffer) or done:
+                        break
+                    error = None
+                if len(buffer) - position > max_item_size:
+                    raise MalformedJSON(f"Array values are limited to {max_item_size} characters")
+                if not await more():
+                    raise MalformedJSON(f"Invalid JSON: {error}" if error else "Unexpected end of the array")
+            position = end
+            expecting = ", or ]"
+            yield value
@@ -0,0 +1,107 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict
+
+
+class UpstreamBusy(Exception):
+    """Raised when a request can't get an upstream slot before its deadline."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Upstream busy, retry after {retry_after:.1f}s")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class UpstreamGovernor:
+    """Token-bucket rate limit plus a cap on in-flight requests to one upstream.
+
+    Callers queue for a slot for at most ``max_wait`` seconds; if the rate or
+    concurrency limit can't be met by then they get ``UpstreamBusy`` instead.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_in_flight: int,
+        max_wait: float,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.timer = timer
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tokens = float(burst)
+        self._updated = timer()
+        self.queued = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def _reserve_token(self) -> float:
+        """Take a token and return how long to wait until it is actually available."""
+        now = self.timer()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def _retry_after(self) -> float:
+        return (self.queued + 1) / self.rate
+
+    @asynccontextmanager
+    async def slot(self):
+        started = self.timer()
+        deadline = started + self.max_wait
+        self.queued += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise UpstreamBusy(self._retry_after())
+
+            delay = self._reserve_token()
+            if self.timer() + delay > deadline:
+                # Hand the token back; this request won't use it
+                self._tokens += 1
+                self._semaphore.release()
+                self.rejected += 1
+                raise UpstreamBusy(delay)
+            if delay:
+                try:
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+        finally:
+            self.queued -= 1
+
+        waited = self.timer() - started
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait_seen, 4),
+        }
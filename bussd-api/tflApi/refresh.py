@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from cache.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    """Refreshes the most requested cache keys shortly before they expire.
+
+    Demand is counted per key and halved every budget window so the ranking
+    follows recent traffic. At most ``budget_per_minute`` refreshes are
+    started per minute, which keeps background traffic inside the TfL quota.
+    """
+
+    def __init__(
+        self,
+        cache: TTLCache,
+        loader_for: Callable[[Hashable], Callable[[], Awaitable[Any]]],
+        budget_per_minute: int,
+        refresh_ahead: float,
+        top_n: int,
+        interval: float,
+        max_tracked: int = 1024,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        self.cache = cache
+        self.loader_for = loader_for
+        self.budget_per_minute = budget_per_minute
+        self.refresh_ahead = refresh_ahead
+        self.top_n = top_n
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self.timer = timer
+        self.demand: Counter = Counter()
+        self.window_started = timer()
+        self.spent = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_for_budget = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, key: Hashable) -> None:
+        self.demand[key] += 1
+        if len(self.demand) > self.max_tracked * 2:
+            self.demand = Counter(dict(self.demand.most_common(self.max_tracked)))
+
+    def _roll_window(self) -> None:
+        if self.timer() - self.window_started >= 60:
+            self.window_started = self.timer()
+            self.spent = 0
+            self.demand = Counter({key: count // 2 for key, count in self.demand.items() if count > 1})
+
+    def due(self) -> List[Hashable]:
+        """Popular keys that are cached and expire within ``refresh_ahead`` seconds, most requested first."""
+        keys = []
+        for key, _ in self.demand.most_common(self.top_n):
+            expires_in = self.cache.expires_in(key)
+            if expires_in is not None and expires_in <= self.refresh_ahead:
+                keys.append(key)
+        return keys
+
+    async def run_once(self) -> None:
+        self._roll_window()
+        tasks = []
+        for key in self.due():
+            if self.spent >= self.budget_per_minute:
+                self.skipped_for_budget += 1
+                continue
+            self.spent += 1
+            tasks.append(self.cache.refresh(key, self.loader_for(key)))
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, BaseException):
+                self.failed += 1
+            else:
+                self.refreshed += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Background refresh failed: {e}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_keys": len(self.demand),
+            "budget_per_minute": self.budget_per_minute,
+            "spent_this_minute": self.spent,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped_for_budget": self.skipped_for_budget,
+        }
@@ -0,0 +1,88 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict
+import httpx
+
+# Upstream statuses worth retrying; anything else is TfL's real answer
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream that has been failing."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry after {retry_after:.0f}s")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in TRANSIENT_STATUSES
+    return isinstance(error, httpx.TransportError)
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[Any]],
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    retry_if: Callable[[BaseException], bool] = is_transient
+) -> Any:
+    """Run ``call``, retrying errors ``retry_if`` accepts with full-jitter exponential backoff."""
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts - 1 or not retry_if(e):
+                raise
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and rejects calls for ``reset_timeout``.
+
+    After that one probe call is let through (half-open): success closes the
+    circuit, failure opens it for another ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, timer: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def check(self) -> None:
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.reset_timeout - self.timer()
+        if remaining > 0:
+            self.rejected += 1
+            raise CircuitOpen(remaining)
+        # Let this call probe; others keep getting rejected until it reports back or the window passes again
+        self.state = "half_open"
+        self.opened_at = self.timer()
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = self.timer()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,70 @@
+import math
+import hashlib
+from typing import Dict, List, Optional, Tuple
+import orjson
+
+DIRECTIONS = ("outbound", "inbound")
+# What the app needs to draw a stop; compact=true responses carry only these
+COMPACT_STOP_FIELDS = ("id", "name", "lat", "lon")
+
+
+def project_stop(stop: dict, fields: Tuple[str, ...]) -> dict:
+    """Keep only ``fields`` of a TfL stop point; ``name`` falls back to StopPoint's ``commonName``."""
+    projected = {}
+    for field in fields:
+        if field == "name" and "name" not in stop:
+            projected[field] = stop.get("commonName")
+        else:
+            projected[field] = stop.get(field)
+    return projected
+
+
+class RouteIndex:
+    """Ordered stop points of one route direction with O(1) stop position lookups."""
+
+    __slots__ = ("stops", "stop_ids", "positions", "_compact", "_digest")
+
+    def __init__(self, stops: List[dict]):
+        self.stops = stops
+        self.stop_ids: Tuple[str, ...] = tuple(stop["id"] for stop in stops)
+        self.positions: Dict[str, int] = {}
+        for position, stop_id in enumerate(self.stop_ids):
+            # Loop routes can list a stop twice; keep the first like list.index did
+            self.positions.setdefault(stop_id, position)
+        self._compact: Optional[List[dict]] = None
+        self._digest: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.stop_ids)
+
+    def position(self, stop_id: str) -> Optional[int]:
+        return self.positions.get(stop_id)
+
+    def span(self, from_stop_id: str, to_stop_id: str) -> Tuple[int, int]:
+        """Return the positions of both stops, raising KeyError if either is not on the route."""
+        return self.positions[from_stop_id], self.positions[to_stop_id]
+
+    @property
+    def digest(self) -> str:
+        """Hash of the stop content, the same in every process that loaded the same sequence."""
+        if self._digest is None:
+            body = orjson.dumps(self.stops, option=orjson.OPT_SORT_KEYS)
+            self._digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        return self._digest
+
+    def project(self, fields: Tuple[str, ...]) -> List[dict]:
+        """The stops with only ``fields`` kept; the compact projection is built once per index."""
+        if fields != COMPACT_STOP_FIELDS:
+            return [project_stop(stop, fields) for stop in self.stops]
+        if self._compact is None:
+            self._compact = [project_stop(stop, fields) for stop in self.stops]
+        return self._compact
+
+    def between(self, from_index: int, to_index: int) -> List[str]:
+        return list(self.stop_ids[min(from_index, to_index) + 1:max(from_index, to_index)])
+
+    def percentage(self, count: int) -> int:
+        """Share of the route a span of ``count`` stops covers, rounded half up like the app's Math.round."""
+        if not self.stop_ids:
+            return 0
+        return math.floor(count * 100 / len(self.stop_ids) + 0.5)
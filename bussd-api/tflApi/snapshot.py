@@ -0,0 +1,303 @@
+"""Offline snapshot of TfL route sequences and StopPoint records.
+
+The snapshot is a single SQLite file holding zlib-compressed JSON per route
+direction and per stop. It is written to a temporary file and renamed into
+place, so a serving process never sees a half-written snapshot.
+
+Build one from the live API or from saved TfL responses:
+
+    python -m tflApi.snapshot ingest --out tfl.snapshot --routes 88,12
+    python -m tflApi.snapshot ingest --out tfl.snapshot --all-bus-routes --with-stop-points
+    python -m tflApi.snapshot ingest --out tfl.snapshot --from-dir ./tfl-dumps
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import httpx
+from tflApi.route_index import DIRECTIONS
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+
+
+def _unpack(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob))
+
+
+class SnapshotWriter:
+    """Write a new snapshot next to ``path`` and atomically swap it in on ``commit``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE route_sequences (
+                route_id TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                stops BLOB NOT NULL,
+                PRIMARY KEY (route_id, direction)
+            ) WITHOUT ROWID;
+            CREATE TABLE stop_points (id TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID;
+        """)
+        self.routes = 0
+        self.stop_points = 0
+
+    def add_route(self, route_id: str, direction: str, stops: List[dict]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO route_sequences VALUES (?, ?, ?)",
+            (route_id.lower(), direction.lower(), _pack(stops)),
+        )
+        self.routes += 1
+
+    def add_stop_point(self, stop_point: dict) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO stop_points VALUES (?, ?)", (stop_point["id"], _pack(stop_point)))
+        self.stop_points += 1
+
+    def commit(self) -> None:
+        self.conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("format_version", str(SNAPSHOT_FORMAT_VERSION)),
+            ("created_at", str(int(time.time()))),
+        ])
+        self.conn.commit()
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self.conn.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class SnapshotStore:
+    """Read-only view of one snapshot file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error as e:
+            raise SnapshotError(f"Cannot open TfL snapshot {path}: {e}")
+        version = int(meta.get("format_version", 0))
+        if version != SNAPSHOT_FORMAT_VERSION:
+            self.conn.close()
+            raise SnapshotError(
+                f"TfL snapshot {path} has format version {version}, expected {SNAPSHOT_FORMAT_VERSION}"
+            )
+        self.created_at = int(meta.get("created_at", 0))
+        self.inode = os.stat(path).st_ino
+
+    def route_stops(self, route_id: str, direction: str) -> Optional[List[dict]]:
+        row = self.conn.execute(
+            "SELECT stops FROM route_sequences WHERE route_id = ? AND direction = ?",
+            (route_id.lower(), direction.lower()),
+        ).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def stop_point(self, stop_id: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT data FROM stop_points WHERE id = ?", (stop_id,)).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        routes, = self.conn.execute("SELECT COUNT(*) FROM route_sequences").fetchone()
+        stop_points, = self.conn.execute("SELECT COUNT(*) FROM stop_points").fetchone()
+        return {
+            "path": self.path,
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": self.created_at,
+            "routes": routes,
+            "stop_points": stop_points,
+        }
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class SnapshotReader:
+    """Serves lookups from the snapshot at ``path`` and picks up a swapped-in file on its own."""
+
+    def __init__(self, path: str, check_interval: float = 30, timer=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.timer = timer
+        self.store: Optional[SnapshotStore] = None
+        self.checked_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+
+    def _current(self) -> Optional[SnapshotStore]:
+        now = self.timer()
+        if now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            self.reload()
+        return self.store
+
+    def reload(self) -> None:
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self.store is not None and self.store.inode == inode:
+            return
+        try:
+            store = SnapshotStore(self.path)
+        except SnapshotError as e:
+            logger.error(str(e))
+            return
+        old, self.store = self.store, store
+        if old is not None:
+            old.close()
+        logger.info(f"Loaded TfL snapshot {self.path}")
+
+    def _lookup(self, method: str, *args) -> Any:
+        store = self._current()
+        value = getattr(store, method)(*args) if store else None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def route_stops(self, route_id: str, direction: str) -> Optional[List[dict]]:
+        return self._lookup("route_stops", route_id, direction)
+
+    def stop_point(self, stop_id: str) -> Optional[dict]:
+        return self._lookup("stop_point", stop_id)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.store.stats() if self.store else {"path": self.path}
+        return {**stats, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+
+def _sequence_stops(data: dict) -> Optional[List[dict]]:
+    sequences = data.get("stopPointSequences", [])
+    return sequences[0].get("stopPoint", []) if sequences else None
+
+
+def import_files(writer: SnapshotWriter, paths: Iterable[Path]) -> None:
+    """Import saved TfL responses: Route/Sequence bodies and StopPoint records (single or lists)."""
+    for path in paths:
+        data = json.loads(path.read_text())
+        for item in data if isinstance(data, list) else [data]:
+            if "stopPointSequences" in item:
+                stops = _sequence_stops(item)
+                if stops is not None:
+                    writer.add_route(item["lineId"], item["direction"], stops)
+            elif "id" in item and "commonName" in item:
+                writer.add_stop_point(item)
+            else:
+                logger.warning(f"Skipping unrecognised record in {path}")
+
+
+async def fetch_network(
+    writer: SnapshotWriter,
+    base_url: str,
+    api_key: str,
+    route_ids: List[str],
+    with_stop_points: bool = False,
+    concurrency: int = 8,
+) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers={"app_key": api_key}, timeout=30) as client:
+        async def get(path: str):
+            async with semaphore:
+                response = await client.get(path)
+                response.raise_for_status()
+                return response.json()
+
+        if not route_ids:
+            lines = await get("/Line/Mode/bus")
+            route_ids = [line["id"] for line in lines]
+
+        keys: List[Tuple[str, str]] = [(route_id, direction) for route_id in route_ids for direction in DIRECTIONS]
+        results = await asyncio.gather(
+            *(get(f"/Line/{route_id}/Route/Sequence/{direction}") for route_id, direction in keys),
+            return_exceptions=True,
+        )
+        stop_ids = set()
+        for (route_id, direction), data in zip(keys, results):
+            if isinstance(data, Exception):
+                logger.warning(f"Skipping {route_id} {direction}: {data}")
+                continue
+            stops = _sequence_stops(data)
+            if stops is None:
+                continue
+            writer.add_route(route_id, direction, stops)
+            stop_ids.update(stop["id"] for stop in stops)
+
+        if with_stop_points:
+            ids = sorted(stop_ids)
+            stop_points = await asyncio.gather(*(get(f"/StopPoint/{stop_id}") for stop_id in ids), return_exceptions=True)
+            for stop_id, stop_point in zip(ids, stop_points):
+                if isinstance(stop_point, Exception):
+                    logger.warning(f"Skipping StopPoint {stop_id}: {stop_point}")
+                    continue
+                writer.add_stop_point(stop_point)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m tflApi.snapshot", description="Build an offline TfL snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest = subparsers.add_parser("ingest", help="Download or import TfL data into a snapshot file")
+    ingest.add_argument("--out", required=True, help="Snapshot file to write (replaced atomically)")
+    ingest.add_argument("--from-dir", help="Import saved TfL JSON responses from this directory instead of the live API")
+    ingest.add_argument("--routes", default="", help="Comma-separated route IDs to download")
+    ingest.add_argument("--all-bus-routes", action="store_true", help="Download every bus route")
+    ingest.add_argument("--with-stop-points", action="store_true", help="Also download full StopPoint records")
+    ingest.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    writer = SnapshotWriter(args.out)
+    try:
+        if args.from_dir:
+            import_files(writer, sorted(Path(args.from_dir).rglob("*.json")))
+        else:
+            route_ids = [route_id.strip() for route_id in args.routes.split(",") if route_id.strip()]
+            if not route_ids and not args.all_bus_routes:
+                parser.error("pass --routes, --all-bus-routes or --from-dir")
+            asyncio.run(fetch_network(
+                writer,
+                os.getenv("TFL_URL", "https://api.tfl.gov.uk"),
+                os.getenv("TFL_API_KEY", ""),
+                route_ids,
+                with_stop_points=args.with_stop_points,
+                concurrency=args.concurrency,
+            ))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+    print(f"Wrote {writer.routes} route sequences and {writer.stop_points} stop points to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
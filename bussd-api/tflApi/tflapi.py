@@ -1,116 +1,557 @@
 import os
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List
+import importlib.util
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Optional, List, Tuple
 import httpx
+import orjson
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse
-from supabase import create_client, Client
-from pydantic import BaseModel, Field
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from supabase import Client
+from pydantic import BaseModel, Field, ValidationError
+from cache.ttl_cache import TTLCache
+from tflApi.json_stream import MalformedJSON, iter_json_array
+from tflApi.route_index import COMPACT_STOP_FIELDS, DIRECTIONS, RouteIndex, project_stop
+from tflApi.snapshot import SnapshotReader
+from tflApi.refresh import RefreshScheduler
+from tflApi.limiter import UpstreamBusy, UpstreamGovernor
+from tflApi.resilience import CircuitBreaker, CircuitOpen, TRANSIENT_STATUSES, is_transient, with_retries
+from metrics.registry import upstream_timer
+from auth.tokens import Identity, get_identity, resolve_user
+from db import bus_routes
+from db import client as db_client
+from dashboard.route_cache import route_cache
+from stats.coverage import JourneySpan, coverage_engine
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 TFL_URL = os.getenv("TFL_URL", "https://api.tfl.gov.uk")
 TFL_API_KEY = os.getenv("TFL_API_KEY", "")
 
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_KEY:
+# Upstream connection pool settings for the shared TfL client
+TFL_TIMEOUT = float(os.getenv("TFL_TIMEOUT", "10"))
+TFL_CONNECT_TIMEOUT = float(os.getenv("TFL_CONNECT_TIMEOUT", "5"))
+TFL_MAX_CONNECTIONS = int(os.getenv("TFL_MAX_CONNECTIONS", "100"))
+TFL_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TFL_MAX_KEEPALIVE_CONNECTIONS", "20"))
+TFL_KEEPALIVE_EXPIRY = float(os.getenv("TFL_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 needs the optional h2 package (httpx[http2])
+TFL_HTTP2 = os.getenv("TFL_HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+# Keep upstream traffic inside the TfL app key quota (500 requests/minute by default)
+TFL_RATE_LIMIT = float(os.getenv("TFL_RATE_LIMIT", "8"))
+TFL_RATE_BURST = int(os.getenv("TFL_RATE_BURST", "20"))
+TFL_MAX_IN_FLIGHT = int(os.getenv("TFL_MAX_IN_FLIGHT", "20"))
+TFL_QUEUE_TIMEOUT = float(os.getenv("TFL_QUEUE_TIMEOUT", "2"))
+
+# Retries for transient TfL failures, and a breaker that stops calling TfL while it keeps failing
+TFL_RETRY_ATTEMPTS = int(os.getenv("TFL_RETRY_ATTEMPTS", "3"))
+TFL_RETRY_BASE_DELAY = float(os.getenv("TFL_RETRY_BASE_DELAY", "0.2"))
+TFL_RETRY_MAX_DELAY = float(os.getenv("TFL_RETRY_MAX_DELAY", "2"))
+TFL_BREAKER_FAILURES = int(os.getenv("TFL_BREAKER_FAILURES", "5"))
+TFL_BREAKER_RESET = float(os.getenv("TFL_BREAKER_RESET", "30"))
+# How long the last good copy of a sequence is kept to answer with while TfL is down
+TFL_LAST_GOOD_TTL = float(os.getenv("TFL_LAST_GOOD_TTL", str(7 * 24 * 3600)))
+
+# Route stop sequences change rarely, so keep them in-process for a while
+TFL_SEQUENCE_CACHE_TTL = float(os.getenv("TFL_SEQUENCE_CACHE_TTL", "3600"))
+TFL_SEQUENCE_CACHE_SIZE = int(os.getenv("TFL_SEQUENCE_CACHE_SIZE", "512"))
+# Expired sequences are still served for this long while a background fetch replaces them
+TFL_SEQUENCE_STALE_TTL = float(os.getenv("TFL_SEQUENCE_STALE_TTL", "600"))
+
+# Background refresh of the most requested sequences before they expire
+TFL_REFRESH_ENABLED = os.getenv("TFL_REFRESH_ENABLED", "true").lower() == "true"
+TFL_REFRESH_BUDGET_PER_MINUTE = int(os.getenv("TFL_REFRESH_BUDGET_PER_MINUTE", "30"))
+TFL_REFRESH_AHEAD = float(os.getenv("TFL_REFRESH_AHEAD", "120"))
+TFL_REFRESH_TOP_N = int(os.getenv("TFL_REFRESH_TOP_N", "50"))
+TFL_REFRESH_INTERVAL = float(os.getenv("TFL_REFRESH_INTERVAL", "15"))
+
+# Serve route sequences and StopPoints from an offline snapshot (see tflApi/snapshot.py), live TfL on a miss
+TFL_SNAPSHOT_PATH = os.getenv("TFL_SNAPSHOT_PATH")
+TFL_SNAPSHOT_CHECK_INTERVAL = float(os.getenv("TFL_SNAPSHOT_CHECK_INTERVAL", "30"))
+
+# How long clients and CDNs may reuse stop responses without revalidating (ETag revalidation is always possible)
+TFL_STOPS_MAX_AGE = int(os.getenv("TFL_STOPS_MAX_AGE", "3600"))
+
+# direction=auto on /stops-between and /record-journey looks the journey up in both directions
+AUTO_DIRECTION = "auto"
+
+# Multi-route stop lookups: how many routes per request and how many fetched from TfL at once
+TFL_BATCH_MAX_ROUTES = int(os.getenv("TFL_BATCH_MAX_ROUTES", "50"))
+TFL_BATCH_CONCURRENCY = int(os.getenv("TFL_BATCH_CONCURRENCY", "8"))
+
+# Bulk journey imports are read and written this many rows at a time, so memory doesn't grow with the request
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", "500"))
+# Longest single journey accepted in a bulk import, in characters of JSON
+BULK_MAX_JOURNEY_SIZE = int(os.getenv("BULK_MAX_JOURNEY_SIZE", "16384"))
+
+http_client: Optional[httpx.AsyncClient] = None
+sequence_cache = TTLCache(maxsize=TFL_SEQUENCE_CACHE_SIZE, ttl=TFL_SEQUENCE_CACHE_TTL, stale_ttl=TFL_SEQUENCE_STALE_TTL)
+last_known_good = TTLCache(maxsize=TFL_SEQUENCE_CACHE_SIZE, ttl=TFL_LAST_GOOD_TTL)
+circuit_breaker = CircuitBreaker(failure_threshold=TFL_BREAKER_FAILURES, reset_timeout=TFL_BREAKER_RESET)
+snapshot: Optional[SnapshotReader] = None
+refresh_scheduler: Optional[RefreshScheduler] = None
+upstream_governor: Optional[UpstreamGovernor] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        headers={"app_key": TFL_API_KEY},
+        timeout=httpx.Timeout(TFL_TIMEOUT, connect=TFL_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=TFL_MAX_CONNECTIONS,
+            max_keepalive_connections=TFL_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=TFL_KEEPALIVE_EXPIRY,
+        ),
+        http2=TFL_HTTP2,
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared TfL client, creating it if the lifespan hasn't run (e.g. in tests)."""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = create_http_client()
+    return http_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client, snapshot, refresh_scheduler, upstream_governor
+    http_client = create_http_client()
+    upstream_governor = UpstreamGovernor(
+        rate=TFL_RATE_LIMIT,
+        burst=TFL_RATE_BURST,
+        max_in_flight=TFL_MAX_IN_FLIGHT,
+        max_wait=TFL_QUEUE_TIMEOUT,
+    )
+    if TFL_SNAPSHOT_PATH:
+        snapshot = SnapshotReader(TFL_SNAPSHOT_PATH, check_interval=TFL_SNAPSHOT_CHECK_INTERVAL)
+    if TFL_REFRESH_ENABLED:
+        refresh_scheduler = RefreshScheduler(
+            sequence_cache,
+            lambda key: partial(load_route_index, *key),
+            budget_per_minute=TFL_REFRESH_BUDGET_PER_MINUTE,
+            refresh_ahead=TFL_REFRESH_AHEAD,
+            top_n=TFL_REFRESH_TOP_N,
+            interval=TFL_REFRESH_INTERVAL,
+        )
+        refresh_scheduler.start()
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    except Exception as e:
-        logger.error(f"Failed to create Supabase client: {e}")
+        yield
+    finally:
+        if refresh_scheduler is not None:
+            await refresh_scheduler.stop()
+            refresh_scheduler = None
+        await http_client.aclose()
+        http_client = None
+        upstream_governor = None
+        if snapshot is not None:
+            snapshot.close()
+            snapshot = None
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
-def require_supabase():
-    if not SUPABASE_URL or not SUPABASE_KEY or not supabase:
+def require_supabase() -> Client:
+    supabase = db_client.get_supabase()
+    if not supabase:
         raise HTTPException(status_code=500, detail="Supabase credentials not properly set.")
+    return supabase
+
+
+def upstream_slot():
+    # The governor lives in the lifespan; without it (e.g. bare AsyncClient tests) calls go straight through
+    return upstream_governor.slot() if upstream_governor is not None else nullcontext()
+
+
+async def get_upstream(url: str) -> httpx.Response:
+    async with upstream_slot():
+        with upstream_timer("tfl") as timer:
+            response = await get_http_client().get(url)
+            timer.outcome = str(response.status_code)
+    if response.status_code in TRANSIENT_STATUSES:
+        response.raise_for_status()
+    return response
 
 
 async def fetch_tfl(url: str):
-    headers = {"app_key": TFL_API_KEY}
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        circuit_breaker.check()
+        try:
+            response = await with_retries(
+                partial(get_upstream, url),
+                attempts=TFL_RETRY_ATTEMPTS,
+                base_delay=TFL_RETRY_BASE_DELAY,
+                max_delay=TFL_RETRY_MAX_DELAY,
+            )
+        except Exception as e:
+            if is_transient(e):
+                circuit_breaker.record_failure()
+            raise
+        circuit_breaker.record_success()
+        response.raise_for_status()
+        return response.json()
+    except CircuitOpen as e:
+        raise HTTPException(
+            status_code=503,
+            detail="TfL is currently unavailable, please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except UpstreamBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="TfL request queue is full, please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except httpx.HTTPStatusError as e:
+        if e.response.status_code == 429:
+            raise HTTPException(
+                status_code=503,
+                detail="TfL is rate limiting requests, please retry shortly.",
+                headers={"Retry-After": e.response.headers.get("Retry-After", "1")},
+            )
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def fetch_route_index(route_id: str, direction: str) -> RouteIndex:
+    """Build a route's stop index from the snapshot or TfL without touching any cache."""
+    if snapshot is not None:
+        stops = snapshot.route_stops(route_id, direction)
+        if stops is not None:
+            return RouteIndex(stops)
 
-@app.get("/stops")
-async def get_stops(route_id: str = Query(...), direction: str = Query(...)):
     url = f"{TFL_URL}/Line/{route_id}/Route/Sequence/{direction}"
     data = await fetch_tfl(url)
 
     sequences = data.get("stopPointSequences", [])
     if not sequences:
         raise HTTPException(status_code=404, detail="No stop sequences found.")
+    return RouteIndex(sequences[0].get("stopPoint", []))
+
+
+async def load_route_index(route_id: str, direction: str) -> RouteIndex:
+    index = await fetch_route_index(route_id, direction)
+    last_known_good.set((route_id, direction), (index, time.time()))
+    return index
 
-    stops = sequences[0].get("stopPoint", [])
+
+async def get_route_index(route_id: str, direction: str, response: Optional[Response] = None) -> RouteIndex:
+    """Return the stop index for a route, sharing one upstream fetch per (route, direction).
+
+    If TfL is failing, the last good copy is returned instead and, when a
+    response is passed, marked stale with Age and Warning headers.
+    """
+    key = (route_id.lower(), direction.lower())
+    if refresh_scheduler is not None:
+        refresh_scheduler.record(key)
+    try:
+        return await sequence_cache.get_or_load(key, partial(load_route_index, *key))
+    except HTTPException as e:
+        fallback = last_known_good.get(key) if e.status_code >= 500 else None
+        if fallback is None:
+            raise
+        index, fetched_at = fallback
+        logger.warning(f"Serving stale stop sequence for {key} after TfL error: {e.detail}")
+        if response is not None:
+            response.headers["Age"] = str(int(time.time() - fetched_at))
+            response.headers["Warning"] = '110 - "Response is Stale"'
+            response.headers["X-Data-Stale"] = "true"
+        return index
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    stats = {"route_sequences": sequence_cache.stats()}
+    if snapshot is not None:
+        stats["snapshot"] = snapshot.stats()
+    if refresh_scheduler is not None:
+        stats["refresh"] = refresh_scheduler.stats()
+    return stats
+
+
+@app.get("/upstream/stats")
+async def upstream_stats():
     return {
-        "route_id": route_id,
-        "direction": direction,
-        "stop_count": len(stops),
-        "stops": stops
+        "tfl": upstream_governor.stats() if upstream_governor is not None else None,
+        "circuit_breaker": circuit_breaker.stats(),
     }
 
 
-@app.get("/stops/{stop_id}")
-async def get_stop(stop_id: str):
-    url = f"{TFL_URL}/StopPoint/{stop_id}"
-    return await fetch_tfl(url)
+def parse_stop_fields(fields: Optional[str], compact: bool) -> Optional[Tuple[str, ...]]:
+    if fields:
+        return tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    return COMPACT_STOP_FIELDS if compact else None
 
 
-@app.get("/stops-between")
-async def stops_between(route_id: str, from_stop_id: str, to_stop_id: str, direction: str = "outbound"):
-    url = f"{TFL_URL}/Line/{route_id}/Route/Sequence/{direction}"
-    data = await fetch_tfl(url)
+def make_etag(*parts) -> str:
+    """Strong ETag for a representation built from ``parts`` (route digests, query options)."""
+    key = "\x1f".join(str(part) for part in parts).encode()
+    return f'"{hashlib.blake2b(key, digest_size=16).hexdigest()}"'
 
-    sequences = data.get("stopPointSequences", [])
-    if not sequences:
-        raise HTTPException(status_code=404, detail="No stop sequences found.")
 
-    stops = sequences[0].get("stopPoint", [])
-    stop_ids = [stop["id"] for stop in stops]
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
 
-    try:
-        fromStop = stop_ids.index(from_stop_id)
-        toStop = stop_ids.index(to_stop_id)
-        between = stop_ids[min(fromStop, toStop)+1:max(fromStop, toStop)]
+
+def cached_json_response(request: Request, content, etag: str, response: Optional[Response] = None) -> Response:
+    """Answer with a 304 if the client already has ``etag``, otherwise with ``content`` serialized by orjson.
+
+    This skips FastAPI's jsonable_encoder pass over large TfL payloads. Headers
+    set on the injected ``response`` (e.g. stale markers) are carried over, and
+    stale data is marked for revalidation instead of being cached for max-age.
+    """
+    headers = dict(response.headers) if response is not None else {}
+    max_age = 0 if "x-data-stale" in headers else TFL_STOPS_MAX_AGE
+    headers["ETag"] = etag
+    headers["Cache-Control"] = f"public, max-age={max_age}"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content, headers=headers)
+
+
+@app.get("/stops")
+async def get_stops(
+    request: Request,
+    response: Response,
+    route_id: str = Query(...),
+    direction: str = Query(...),
+    fields: Optional[str] = None,
+    compact: bool = False
+):
+    index = await get_route_index(route_id, direction, response)
+    projection = parse_stop_fields(fields, compact)
+    return cached_json_response(request, {
+        "route_id": route_id,
+        "direction": direction,
+        "stop_count": len(index),
+        "stops": index.stops if projection is None else index.project(projection)
+    }, make_etag("stops", index.digest, route_id, direction, projection), response)
+
+
+class RouteDirection(BaseModel):
+    route_id: str
+    direction: str = "outbound"
+
+
+@app.post("/stops/batch")
+async def get_stops_batch(routes: List[RouteDirection]):
+    """Stops for many routes at once, streamed as NDJSON lines in the order they become ready."""
+    if len(routes) > TFL_BATCH_MAX_ROUTES:
+        raise HTTPException(status_code=413, detail=f"At most {TFL_BATCH_MAX_ROUTES} routes per request")
+
+    pairs = list(dict.fromkeys((route.route_id, route.direction) for route in routes))
+    semaphore = asyncio.Semaphore(TFL_BATCH_CONCURRENCY)
+
+    async def fetch_one(route_id: str, direction: str) -> dict:
+        try:
+            async with semaphore:
+                index = await get_route_index(route_id, direction)
+        except HTTPException as e:
+            return {"route_id": route_id, "direction": direction, "status": e.status_code, "error": e.detail}
         return {
-            "count": abs(toStop - fromStop),
-            "from_index": fromStop,
-            "to_index": toStop,
-            "stop_ids_between": between,
-            "all_stop_ids": stop_ids
+            "route_id": route_id,
+            "direction": direction,
+            "stop_count": len(index),
+            "stops": index.stops
         }
-    except ValueError:
+
+    async def stream():
+        tasks = [asyncio.ensure_future(fetch_one(*pair)) for pair in pairs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_done) + b"\n"
+        finally:
+            # The client went away mid-stream; don't keep fetching for it
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/stops/{stop_id}")
+async def get_stop(request: Request, stop_id: str, fields: Optional[str] = None, compact: bool = False):
+    stop_point = snapshot.stop_point(stop_id) if snapshot is not None else None
+    if stop_point is None:
+        url = f"{TFL_URL}/StopPoint/{stop_id}"
+        stop_point = await fetch_tfl(url)
+
+    projection = parse_stop_fields(fields, compact)
+    content = stop_point if projection is None else project_stop(stop_point, projection)
+    # A single stop point is small, so its ETag is simply a hash of the body
+    etag = make_etag("stop", orjson.dumps(content, option=orjson.OPT_SORT_KEYS).decode())
+    return cached_json_response(request, content, etag)
+
+
+async def scan_route_index(route_id: str, direction: str, slot: Callable[[], Any] = nullcontext) -> RouteIndex:
+    """Return the stop index for a route during a bulk scan such as a leaderboard rebuild.
+
+    Cached copies are reused, but unlike get_route_index a lookup isn't
+    counted as demand by the refresh scheduler and a fetched index isn't
+    cached, so a scan over every route can't push popular ones out. Upstream
+    fetches are made inside ``slot()``, which lets the scan keep to its own
+    budget on top of the shared governor.
+    """
+    key = (route_id.lower(), direction.lower())
+    cached = sequence_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        async with slot():
+            return await fetch_route_index(*key)
+    except HTTPException as e:
+        fallback = last_known_good.get(key) if e.status_code >= 500 else None
+        if fallback is None:
+            raise
+        return fallback[0]
+
+
+def resolve_span(index: RouteIndex, from_stop_id: str, to_stop_id: str):
+    try:
+        return index.span(from_stop_id, to_stop_id)
+    except KeyError:
         raise HTTPException(status_code=400, detail="One or both stop IDs not found on this route.")
 
 
+def load_failed(error: BaseException) -> bool:
+    """Whether a route lookup error means the route couldn't be loaded, rather than the journey not fitting it."""
+    return not isinstance(error, HTTPException) or error.status_code >= 500
+
+
+def pick_direction(loaded: dict, from_stop_id: str, to_stop_id: str) -> Tuple[str, RouteIndex, int, int]:
+    """Choose the direction the journey was ridden in from ``{direction: index or load error}``.
+
+    Prefers a direction where the from-stop comes before the to-stop, then any
+    direction with both stops on it. If neither fits and a direction failed to
+    load, that failure is raised, since the journey may be on the missing one.
+    """
+    reversed_match = None
+    for direction, index in loaded.items():
+        if isinstance(index, BaseException):
+            continue
+        fromStop, toStop = index.position(from_stop_id), index.position(to_stop_id)
+        if fromStop is None or toStop is None:
+            continue
+        if fromStop <= toStop:
+            return direction, index, fromStop, toStop
+        reversed_match = reversed_match or (direction, index, fromStop, toStop)
+
+    if reversed_match is not None:
+        return reversed_match
+    errors = [index for index in loaded.values() if isinstance(index, BaseException)]
+    for error in errors:
+        if load_failed(error):
+            raise error
+    if errors and len(errors) == len(loaded):
+        raise errors[0]
+    raise HTTPException(status_code=400, detail="One or both stop IDs not found on this route.")
+
+
+async def resolve_journey(
+    route_id: str,
+    direction: str,
+    from_stop_id: str,
+    to_stop_id: str,
+    response: Optional[Response] = None
+) -> Tuple[str, RouteIndex, int, int]:
+    """Return the direction, route index and stop positions for a journey.
+
+    With ``direction="auto"`` both directions are loaded concurrently (from the
+    cache where possible) and the one the journey fits is picked.
+    """
+    if direction.lower() != AUTO_DIRECTION:
+        index = await get_route_index(route_id, direction, response)
+        return (direction, index, *resolve_span(index, from_stop_id, to_stop_id))
+
+    loaded = await asyncio.gather(
+        *(get_route_index(route_id, candidate, response) for candidate in DIRECTIONS),
+        return_exceptions=True
+    )
+    return pick_direction(dict(zip(DIRECTIONS, loaded)), from_stop_id, to_stop_id)
+
+
+def place_journey(row: dict, loaded: dict) -> Optional[JourneySpan]:
+    """Place a saved journey row on its route given ``{direction: index or load error}`` for the route.
+
+    Returns None for rows whose stops aren't on the route; load failures raise.
+    """
+    try:
+        direction, index, fromStop, toStop = pick_direction(loaded, str(row["started_stop"]), str(row["ended_stop"]))
+    except HTTPException as e:
+        if e.status_code >= 500:
+            raise
+        return None
+    return JourneySpan(str(row["bus_route"]), direction, fromStop, toStop, len(index))
+
+
+async def journey_span(row: dict) -> Optional[JourneySpan]:
+    """Place a saved journey row on its route, in whichever direction it fits (rows don't store one)."""
+    loaded = await asyncio.gather(
+        *(get_route_index(str(row["bus_route"]), direction) for direction in DIRECTIONS),
+        return_exceptions=True
+    )
+    return place_journey(row, dict(zip(DIRECTIONS, loaded)))
+
+
+@app.get("/stops-between")
+async def stops_between(
+    request: Request,
+    response: Response,
+    route_id: str,
+    from_stop_id: str,
+    to_stop_id: str,
+    direction: str = "outbound",
+    include_stop_ids: bool = True
+):
+    direction, index, fromStop, toStop = await resolve_journey(route_id, direction, from_stop_id, to_stop_id, response)
+
+    count = abs(toStop - fromStop)
+    result = {
+        "direction": direction,
+        "count": count,
+        "from_index": fromStop,
+        "to_index": toStop,
+        "total_stops": len(index),
+        "percentage": index.percentage(count),
+    }
+    # The app still derives the percentage from all_stop_ids; newer clients pass include_stop_ids=false
+    if include_stop_ids:
+        result["stop_ids_between"] = index.between(fromStop, toStop)
+        result["all_stop_ids"] = list(index.stop_ids)
+    etag = make_etag("stops-between", index.digest, direction, from_stop_id, to_stop_id, include_stop_ids)
+    return cached_json_response(request, result, etag, response)
+
+
 @app.post("/add-bus-route")
 async def add_bus_route(
     bus_route: str, 
     percentage: int, 
-    user_uuid: str, 
     started_stop: str, 
     ended_stop: str,
-    user_email: str
+    user_email: str,
+    user_uuid: Optional[str] = None,
+    identity: Optional[Identity] = Depends(get_identity)
 ):
-    require_supabase()
+    user_uuid = resolve_user(identity, user_uuid)
+    supabase = require_supabase()
 
     try:
-        response = supabase.table("bus_routes_taken").insert({
+        response = await bus_routes.insert(supabase, {
             "bus_route": bus_route,
             "percentage_travelled": percentage,
             "started_stop": started_stop,
@@ -118,20 +559,211 @@ async def add_bus_route(
             "user_uuid": user_uuid,
             "user_email": user_email,
             "bus_route_taken": True
-        }).execute()
+        })
+        route_cache.inserted(user_uuid, response.data)
+        await coverage_engine.saved(user_uuid, response.data, journey_span)
 
         return {"message": "Bus route added", "data": response.data}
     except Exception as e:
         logging.error(f"Error adding route: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to insert into Supabase: {e}")
 
+class RecordJourneyPayload(BaseModel):
+    route_id: str
+    direction: str = "outbound"
+    from_stop_id: str
+    to_stop_id: str
+    # Taken from the access token when one is sent
+    user_uuid: Optional[str] = None
+    user_email: str
+
+def journey_row(journey: RecordJourneyPayload, index: RouteIndex):
+    """Build the bus_routes_taken row for a journey, returning it with the number of stops travelled."""
+    fromStop, toStop = resolve_span(index, journey.from_stop_id, journey.to_stop_id)
+    count = abs(toStop - fromStop)
+    row = {
+        "bus_route": journey.route_id,
+        "percentage_travelled": index.percentage(count),
+        "started_stop": journey.from_stop_id,
+        "ended_stop": journey.to_stop_id,
+        "user_uuid": journey.user_uuid,
+        "user_email": journey.user_email,
+        "bus_route_taken": True
+    }
+    return row, count
+
+@app.post("/record-journey")
+async def record_journey(payload: RecordJourneyPayload, identity: Optional[Identity] = Depends(get_identity)):
+    """Work out the stop span from the cached route index and save the journey in one call."""
+    payload.user_uuid = resolve_user(identity, payload.user_uuid)
+    supabase = require_supabase()
+
+    direction, index, _, _ = await resolve_journey(
+        payload.route_id, payload.direction, payload.from_stop_id, payload.to_stop_id
+    )
+    row, count = journey_row(payload, index)
+
+    try:
+        response = await bus_routes.insert(supabase, row)
+        route_cache.inserted(payload.user_uuid, response.data)
+        await coverage_engine.saved(payload.user_uuid, response.data, journey_span)
+    except Exception as e:
+        logging.error(f"Error recording journey: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to insert into Supabase: {e}")
+
+    return {
+        "message": "Journey recorded",
+        "direction": direction,
+        "count": count,
+        "total_stops": len(index),
+        "percentage": row["percentage_travelled"],
+        "data": response.data
+    }
+
+@app.post("/add-bus-routes")
+async def add_bus_routes(request: Request, identity: Optional[Identity] = Depends(get_identity)):
+    """Validate and insert a JSON array of journeys, streaming back a result for each in request order.
+
+    The body is read, checked and inserted ``BULK_INSERT_BATCH_SIZE`` journeys
+    at a time, and results are sent as soon as they're known, so memory stays
+    flat however many journeys are sent.
+    """
+    supabase = require_supabase()
+    journeys = iter_json_array(request.stream(), BULK_MAX_JOURNEY_SIZE)
+    # Read up to the first journey so a body that isn't an array gets a plain 400
+    try:
+        first = await journeys.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except MalformedJSON as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def read_ahead() -> AsyncIterator[List[Any]]:
+        """The journeys in chunks of BULK_INSERT_BATCH_SIZE, then a MalformedJSON if the body breaks off."""
+        chunk = [] if first is None else [first]
+        try:
+            async for journey in journeys:
+                if len(chunk) >= BULK_INSERT_BATCH_SIZE:
+                    yield chunk
+                    chunk = []
+                chunk.append(journey)
+        except MalformedJSON as e:
+            chunk.append(e)
+        if chunk:
+            yield chunk
+
+    # Each distinct route sequence is resolved once, from the cache where possible
+    indexes: Dict[Tuple[str, str], Any] = {}
+    results: Dict[int, dict] = {}
+    batch: List[dict] = []
+    batch_positions: List[int] = []
+    counts = {"created": 0, "error": 0}
+
+    async def flush():
+        nonlocal batch, batch_positions
+        rows, positions, batch, batch_positions = batch, batch_positions, [], []
+        try:
+            response = await bus_routes.insert(supabase, rows)
+            route_cache.inserted(None, response.data)
+            await coverage_engine.saved(None, response.data, journey_span)
+            for position, row in zip(positions, response.data):
+                results[position] = {"index": position, "status": "created", "id": row.get("id"),
+                                     "percentage": row.get("percentage_travelled")}
+            # Every journey needs a result for the ones after it to be sent
+            for position in positions[len(response.data):]:
+                results[position] = {"index": position, "status": "error", "detail": "Supabase didn't return the inserted row"}
+        except Exception as e:
+            logging.error(f"Error inserting journey batch: {str(e)}")
+            for position in positions:
+                results[position] = {"index": position, "status": "error", "detail": f"Failed to insert into Supabase: {e}"}
+
+    def check(item: Any) -> RecordJourneyPayload:
+        try:
+            journey = RecordJourneyPayload.model_validate(item)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail="; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'journey'}: {error['msg']}" for error in e.errors()
+            ))
+        journey.user_uuid = resolve_user(identity, journey.user_uuid)
+        return journey
+
+    def place(journey: RecordJourneyPayload) -> dict:
+        if journey.direction.lower() == AUTO_DIRECTION:
+            _, index, _, _ = pick_direction(
+                {direction: indexes[(journey.route_id, direction)] for direction in DIRECTIONS},
+                journey.from_stop_id, journey.to_stop_id
+            )
+        else:
+            index = indexes[(journey.route_id, journey.direction)]
+            if isinstance(index, BaseException):
+                raise index
+        return journey_row(journey, index)[0]
+
+    async def stream():
+        position = sent = 0
+
+        def ready() -> List[bytes]:
+            """Results that can go out now: everything up to the first journey still waiting on its insert."""
+            nonlocal sent
+            parts = []
+            while sent in results:
+                result = results.pop(sent)
+                counts[result["status"]] += 1
+                parts.append((b"," if sent else b"") + orjson.dumps(result))
+                sent += 1
+            return parts
+
+        yield b'{"results":['
+        async for chunk in read_ahead():
+            checked = []
+            for item in chunk:
+                try:
+                    if isinstance(item, MalformedJSON):
+                        raise HTTPException(status_code=400, detail=str(item))
+                    checked.append(check(item))
+                except HTTPException as e:
+                    checked.append(e)
+
+            keys = list({
+                (journey.route_id, direction)
+                for journey in checked if isinstance(journey, RecordJourneyPayload)
+                for direction in (DIRECTIONS if journey.direction.lower() == AUTO_DIRECTION else (journey.direction,))
+            } - indexes.keys())
+            loaded = await asyncio.gather(*(get_route_index(*key) for key in keys), return_exceptions=True)
+            indexes.update(zip(keys, loaded))
+
+            for journey in checked:
+                try:
+                    if isinstance(journey, HTTPException):
+                        raise journey
+                    batch.append(place(journey))
+                    batch_positions.append(position)
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    results[position] = {"index": position, "status": "error", "detail": detail}
+                position += 1
+                # Results go out in order, so also flush once enough are held back behind the batch
+                if len(batch) >= BULK_INSERT_BATCH_SIZE or (batch and len(results) >= BULK_INSERT_BATCH_SIZE):
+                    await flush()
+                for part in ready():
+                    yield part
+        if batch:
+            await flush()
+        for part in ready():
+            yield part
+        yield b'],"inserted":%d,"failed":%d}' % (counts["created"], counts["error"])
+
+    return StreamingResponse(stream(), media_type="application/json")
+
 class UpdateBusRoutePayload(BaseModel):
     user_email: str
     bus_route: str
     percentage: str = Field(alias="percentage_travelled", alias_priority=2)
     started_stop: Optional[str] = None
     ended_stop: Optional[str] = None
-    user_uuid: str
+    user_uuid: Optional[str] = None
+    # updated_at the client last saw; the edit only applies if the row hasn't changed since
+    expected_updated_at: Optional[str] = None
 
     class Config:
         # This allows the model to populate a "percentage_travelled" field from a "percentage" input
@@ -140,8 +772,13 @@ class UpdateBusRoutePayload(BaseModel):
         }
 
 @app.post("/update-bus-route/{route_id}")
-async def update_bus_route(route_id: int, payload: UpdateBusRoutePayload):
-    require_supabase()
+async def update_bus_route(
+    route_id: int,
+    payload: UpdateBusRoutePayload,
+    identity: Optional[Identity] = Depends(get_identity)
+):
+    payload.user_uuid = resolve_user(identity, payload.user_uuid)
+    supabase = require_supabase()
 
     try:
         # Convert the payload to dict and rename percentage to percentage_travelled
@@ -154,44 +791,30 @@ async def update_bus_route(route_id: int, payload: UpdateBusRoutePayload):
         # Remove None values
         update_data = {k: v for k, v in update_data.items() if v is not None}
 
-        # First verify the route exists and belongs to the user
-        verify_response = (
-            supabase.table("bus_routes_taken")
-            .select("*")
-            .eq("id", route_id)
-            .eq("user_uuid", payload.user_uuid)
-            .execute()
-        )
-
-        if not verify_response.data:
-            raise HTTPException(status_code=404, detail=f"No route found with id {route_id} for this user")
-
-        # Then update it
+        # One conditional update: it only matches the user's row (at the expected version) and returns it
         try:
-            response = (
-                supabase.table("bus_routes_taken")
-                .update(update_data)
-                .eq("id", route_id)
-                .eq("user_uuid", payload.user_uuid)
-                .execute()
+            response = await bus_routes.update(
+                supabase, route_id, payload.user_uuid, update_data,
+                expected_updated_at=payload.expected_updated_at
             )
         except Exception as update_error:
             logging.error(f"Supabase update error: {str(update_error)}")
             raise HTTPException(status_code=400, detail=f"Failed to update route: {str(update_error)}")
+        route_cache.updated(payload.user_uuid, response.data if response else None)
+        await coverage_engine.saved(payload.user_uuid, response.data if response else None, journey_span)
+
+        if not response or not response.data:
+            # Only pay for a read on the failure path, to tell a stale edit apart from a missing route
+            if payload.expected_updated_at is not None:
+                current = await bus_routes.select_by_id(supabase, route_id, payload.user_uuid, columns="id,updated_at")
+                if current.data:
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"Route {route_id} was changed by another update",
+                    )
+            raise HTTPException(status_code=404, detail=f"No route found with id {route_id} for this user")
 
-        # Let's fetch the updated record to return it
-        updated_record = (
-            supabase.table("bus_routes_taken")
-            .select("*")
-            .eq("id", route_id)
-            .eq("user_uuid", payload.user_uuid)
-            .execute()
-        )
-
-        if not updated_record.data:
-            raise HTTPException(status_code=404, detail=f"Could not verify update for route {route_id}")
-
-        return {"message": "Bus route updated", "data": updated_record.data}
+        return {"message": "Bus route updated", "data": response.data}
     except Exception as e:
         logging.error(f"Error updating route: {str(e)}")
         if isinstance(e, HTTPException):
@@ -199,11 +822,14 @@ async def update_bus_route(route_id: int, payload: UpdateBusRoutePayload):
         raise HTTPException(status_code=500, detail=f"Failed to update Supabase: {e}")
     
 @app.delete('/delete-bus-route/{bus_route_id}')
-async def delete_bus_route(bus_route_id: int):
-    require_supabase()
+async def delete_bus_route(bus_route_id: int, identity: Optional[Identity] = Depends(get_identity)):
+    supabase = require_supabase()
 
     try:
-        response = supabase.table("bus_routes_taken").delete().eq("id", bus_route_id).execute()
+        # Signed-in callers can only delete their own routes
+        response = await bus_routes.delete(supabase, bus_route_id, identity.user_id if identity else None)
+        route_cache.deleted(identity.user_id if identity else None, response.data)
+        coverage_engine.deleted(identity.user_id if identity else None, response.data)
         return {"message": "Bus route deleted", "data": response.data}
     except Exception as e:
         logging.error(f"Error deleting route: {str(e)}")
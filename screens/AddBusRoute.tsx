@@ -75,7 +75,7 @@ const AddBusRoute = ({ navigation }: { navigation: any }) => {
       const userUuid = await AsyncStorage.getItem("user_uuid");
       const API_URL = process.env.EXPO_PUBLIC_URL;
       const numberOfStopsBetween = await fetch(
-        `${API_URL}/api/tfl/stops-between?route_id=${routeId}&from_stop_id=${stop1}&to_stop_id=${stop2}`
+        `${API_URL}/api/tfl/stops-between?route_id=${routeId}&from_stop_id=${stop1}&to_stop_id=${stop2}&direction=auto`
       );
       const numberOfStopsBetweenData = await numberOfStopsBetween.json();
 
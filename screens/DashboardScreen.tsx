@@ -43,23 +43,36 @@ const DashboardScreen = () => {
   useEffect(() => {
     if (!userUuid) return;
 
-    fetch(`${API_URL}/api/dashboard/routes/?user_uuid=${userUuid}`, {
-      method: "GET",
-      headers: {
-        "Content-Type": "application/json",
-      },
-    })
-      .then((response) => response.json())
-      .then((data) => {
-        if (data.routes && data.routes.length > 0) {
-          setRoutes(data.routes);
-        } else {
-          console.log("No routes found:", data);
+    // Routes come back a page at a time: show the first page, then append the rest
+    const fetchPage = (cursor?: number): Promise<void> =>
+      fetch(
+        `${API_URL}/api/dashboard/routes/?user_uuid=${userUuid}${
+          cursor !== undefined ? `&cursor=${cursor}` : ""
+        }`,
+        {
+          method: "GET",
+          headers: {
+            "Content-Type": "application/json",
+          },
         }
-      })
-      .catch((error) => {
-        console.error("Error fetching routes:", error);
-      });
+      )
+        .then((response) => response.json())
+        .then((data) => {
+          if (data.routes && data.routes.length > 0) {
+            setRoutes((previous) =>
+              cursor !== undefined ? [...previous, ...data.routes] : data.routes
+            );
+            if (data.next_cursor != null) {
+              return fetchPage(data.next_cursor);
+            }
+          } else if (cursor === undefined) {
+            console.log("No routes found:", data);
+          }
+        });
+
+    fetchPage().catch((error) => {
+      console.error("Error fetching routes:", error);
+    });
   }, [userUuid]);
 
   const renderItem = ({ item }: { item: RouteData }) => {
@@ -103,7 +103,7 @@ const EditBusRoute = () => {
     try {
       // First get the number of stops between
       const numberOfStopsBetween = await fetch(
-        `${API_URL}/api/tfl/stops-between?route_id=${routeNumber}&from_stop_id=${stop1}&to_stop_id=${stop2}`
+        `${API_URL}/api/tfl/stops-between?route_id=${routeNumber}&from_stop_id=${stop1}&to_stop_id=${stop2}&direction=auto`
       );
       const numberOfStopsBetweenData = await numberOfStopsBetween.json();
 